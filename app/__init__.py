@@ -13,6 +13,7 @@ from flask_babel import Babel
 from sqlalchemy.engine import Engine
 from .ext_config import get_locale
 from .markdown_ext import Markdown
+from .utils.sql_metrics import SQLMetrics
 from sqlite3 import Connection as SQLite3Connection
 
 
@@ -24,6 +25,7 @@ migrate = Migrate()
 csrf = CSRFProtect()
 compress = Compress()
 babel = Babel()
+sql_metrics = SQLMetrics()
 # Set up Flask-Login
 login_manager = LoginManager()
 login_manager.session_protection = 'strong'
@@ -86,6 +88,7 @@ def create_app(config_name="dev"):
     compress.init_app(app)
     md = Markdown(app, safe_mode=True)
     babel.init_app(app, locale_selector=get_locale)
+    sql_metrics.init_app(app)
 
 
 
@@ -105,6 +108,9 @@ def create_app(config_name="dev"):
     from .control_lists import control_lists_bp
     app.register_blueprint(control_lists_bp)
 
+    # Register the tasks run by Job.enqueue and the run-worker command
+    from . import jobs
+
     # Static file cache-busting via versioned URLs
     if app.debug:
         @app.context_processor
@@ -4,10 +4,11 @@ from flask import (
     flash,
     redirect,
     url_for,
-    current_app)
+    current_app,
+    jsonify)
 from flask_login import current_user, login_required
 
-from app import db
+from app import db, sql_metrics
 from app.admin.forms import (
     ChangeAccountTypeForm,
     ChangeUserEmailForm,
@@ -16,7 +17,7 @@ from app.admin.forms import (
     ChangeAccountStatusForm)
 from app.decorators import admin_required
 from app.email import send_email_async
-from app.main.views.utils import render_template_with_nav_info
+from app.main.views.utils import render_template_with_nav_info, request_wants_json
 from app.models import Role, User
 
 admin = Blueprint('admin', __name__)
@@ -191,3 +192,26 @@ def delete_user(user_id):
     return redirect(url_for('admin.registered_users'))
 
 
+
+
+@admin.route('/metrics')
+@login_required
+@admin_required
+def metrics():
+    """View the SQL queries run by each endpoint since the start of the process."""
+    endpoints = sql_metrics.snapshot()
+    if request_wants_json():
+        return jsonify(endpoints)
+    return render_template_with_nav_info(
+        'admin/metrics.html', endpoints=endpoints, enabled=current_app.config.get("SQL_METRICS", True),
+        threshold=current_app.config.get("SLOW_QUERY_THRESHOLD"))
+
+
+@admin.route('/metrics/reset', methods=['POST'])
+@login_required
+@admin_required
+def reset_metrics():
+    """Forget the SQL metrics recorded so far."""
+    sql_metrics.reset()
+    flash('SQL metrics have been reset.', 'success')
+    return redirect(url_for('admin.metrics'))
@@ -1,6 +1,11 @@
 import click
+import gzip
+import multiprocessing
 import os
+import signal
 import subprocess
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
 
 from config import Config
 from app.models import Role, User, ControlLists
@@ -12,14 +17,26 @@ from .models import (
     AllowedPOS,
     AllowedLemma,
     AllowedMorph,
-    WordToken
+    WordToken,
+    CorpusStats
 )
 from app.utils.forms import create_input_format_convertion
+from app.utils.packs import load_pack, pack_directories
+from app.jobs import Worker
 from sqlalchemy_utils import database_exists, create_database
 from sqlalchemy import text
 import logging
 
+try:
+    from compression import zstd  # Python 3.14+
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
 app = None
+app_config = None
 
 
 DEFAULT_FILENAMES = {
@@ -29,6 +46,67 @@ DEFAULT_FILENAMES = {
     "morph": "allowed_morph.csv"
 }
 
+# Extension and text mode opener of each compression of corpus-dump
+DUMP_COMPRESSIONS = {
+    "none": ("", open),
+    "gzip": (".gz", gzip.open),
+    "zstd": (".zst", zstd.open if zstd else None)
+}
+
+
+def dump_corpus(corpus_id: int, path: str, compression: str = "none",
+                echo: Optional[Callable[[str], None]] = None) -> Optional[int]:
+    """ Write the tokens and the allowed values of a corpus to path, streaming rows from the database.
+    Needs an application context.
+
+    :param corpus_id: ID of the corpus
+    :param path: Directory where files are written
+    :param compression: Key of DUMP_COMPRESSIONS
+    :param echo: Called with a message after each file
+    :return: Number of tokens dumped, None when the corpus does not exist
+    """
+    corpus = db.session.get(Corpus, corpus_id)
+    if not corpus:
+        return None
+    os.makedirs(path, exist_ok=True)
+    extension, opener = DUMP_COMPRESSIONS[compression]
+    echo = echo or (lambda message: None)
+
+    def output(kind):
+        return opener(os.path.join(path, DEFAULT_FILENAMES[kind] + extension), "wt", encoding="utf-8", newline="")
+
+    with output("tokens") as file:
+        tokens = WordToken.write_input_format(WordToken.query.filter(WordToken.corpus == corpus.id), file)
+        echo("--- Tokens dumped")
+    with output("lemma") as file:
+        AllowedLemma.write_input_format(
+            AllowedLemma.query.filter(AllowedLemma.control_list == corpus.control_lists_id), file
+        )
+        echo("--- Allowed Lemma Values dumped")
+    with output("morph") as file:
+        AllowedMorph.write_input_format(
+            AllowedMorph.query.filter(AllowedMorph.control_list == corpus.control_lists_id), file
+        )
+        echo("--- Allowed Morphological Values dumped")
+    with output("POS") as file:
+        AllowedPOS.write_input_format(
+            AllowedPOS.query.filter(AllowedPOS.control_list == corpus.control_lists_id), file
+        )
+        echo("--- Allowed POS Values dumped")
+    return tokens
+
+
+def _dump_corpus_in_process(config: str, corpus_id: int, path: str, compression: str) -> Optional[int]:
+    """ Run dump_corpus in a worker process of corpus-dump, with its own application and connections """
+    worker_app = create_app(config)
+    with worker_app.app_context():
+        try:
+            return dump_corpus(corpus_id, path, compression)
+        finally:
+            db.session.remove()
+            db.engine.dispose()
+
+
 def make_cli():
     """ Creates a Command Line Interface for everydays tasks
 
@@ -39,8 +117,9 @@ def make_cli():
     def cli(config):
         """ Generates the client"""
         click.echo("Loading the application")
-        global app
+        global app, app_config
         app = create_app(config)
+        app_config = config
 
     @click.command("edit-user")
     @click.argument("user_id_or_email")
@@ -157,10 +236,12 @@ def make_cli():
                   help="Path of the file containing the Allowed Morphological tags")
     @click.option("--left", help="Number of words to keep on the left of each token")
     @click.option("--right", help="Number of words to keep on the right of each token")
+    @click.option("--no-context", "no_context", is_flag=True, default=False,
+                  help="Do not store the context of each token, compute it when tokens are displayed")
     def corpus_ingest(
             name, tokens,
             lemma_file=None, POS_file=None, morph_file=None,
-            left=None, right=None):
+            left=None, right=None, no_context=False):
 
         if lemma_file is not None:
             lemma_file = lemma_file.read()
@@ -181,6 +262,7 @@ def make_cli():
                 allowed_morph=morph,
                 context_left=left,
                 context_right=right,
+                store_context=not no_context,
                 columns=[
                     Column(heading="Lemma"),
                     Column(heading="POS"),
@@ -272,40 +354,126 @@ def make_cli():
             for corpus in Corpus.query.all():
                 click.echo(scheme.format(corpus.id, corpus.name))
 
-    @click.command("corpus-dump", help="Dump corpus identified by {corpus} id. Use corpus-list to have a list of IDs")
-    @click.argument("corpus", type=click.INT)
+    @click.command("corpus-dump", help="Dump the corpora identified by {corpora} ids. Use corpus-list to have a list "
+                                       "of IDs. When several corpora are dumped, each is written to a subdirectory "
+                                       "named after its ID by parallel processes.")
+    @click.argument("corpora", type=click.INT, nargs=-1)
+    @click.option("--corpus", "corpus_ids", type=click.INT, multiple=True, help="ID of a corpus to dump (repeatable)")
+    @click.option("--all", "dump_all", is_flag=True, default=False, help="Dump every corpus")
     @click.option("--path", type=click.Path(), required=True, help="Path where the corpus should be saved")
-    def corpus_dump(corpus, path):
+    @click.option("--compress", type=click.Choice(sorted(DUMP_COMPRESSIONS)), default="none", show_default=True,
+                  help="Compression of the files")
+    @click.option("--jobs", type=click.INT, default=min(4, os.cpu_count() or 1), show_default=True,
+                  help="Number of corpora dumped at the same time, each by its own process")
+    def corpus_dump(corpora, path, corpus_ids=(), dump_all=False, compress="none", jobs=1):
+        if compress == "zstd" and zstd is None:
+            raise click.UsageError("zstd compression needs Python 3.14 or the backports.zstd package")
         with app.app_context():
+            if dump_all:
+                corpora = [corpus_id for (corpus_id, ) in db.session.query(Corpus.id).order_by(Corpus.id)]
+            else:
+                corpora = list(dict.fromkeys(list(corpora) + list(corpus_ids)))
+            if not corpora:
+                raise click.UsageError("Give at least one corpus ID, or --all")
             if not os.path.exists(path):
                 os.makedirs(path)
-            corpus = db.session.get(Corpus, corpus)
 
-            # Check that the corpus exists
-            if not corpus:
-                click.echo("Corpus not found")
+            # A single corpus is written to path itself, as it always was
+            if len(corpora) == 1 and not dump_all:
+                if dump_corpus(corpora[0], path, compress, echo=click.echo) is None:
+                    click.echo("Corpus not found")
                 return
 
-            with open(os.path.join(path, DEFAULT_FILENAMES["tokens"]), "w") as file:
-                file.write(WordToken.to_input_format(
-                    WordToken.query.filter(WordToken.corpus == corpus.id)
-                ))
-                click.echo("--- Tokens dumped")
-            with open(os.path.join(path, DEFAULT_FILENAMES["lemma"]), "w") as file:
-                file.write(AllowedLemma.to_input_format(
-                    AllowedLemma.query.filter(AllowedLemma.control_list == corpus.control_lists_id)
+        targets = [(corpus_id, os.path.join(path, str(corpus_id))) for corpus_id in corpora]
+        if jobs <= 1:
+            with app.app_context():
+                results = [(corpus_id, dump_corpus(corpus_id, target, compress)) for corpus_id, target in targets]
+        else:
+            # Processes are spawned rather than forked so that none of them inherits a connection of this one
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = [
+                    (corpus_id, pool.submit(_dump_corpus_in_process, app_config, corpus_id, target, compress))
+                    for corpus_id, target in targets
+                ]
+                results = [(corpus_id, future.result()) for corpus_id, future in futures]
+        for corpus_id, tokens in results:
+            if tokens is None:
+                click.echo("Corpus {} not found".format(corpus_id))
+            else:
+                click.echo("--- Corpus {} dumped ({} tokens)".format(corpus_id, tokens))
+
+    @click.command("corpus-stats-rebuild", help="Recompute the materialized statistics of corpora. "
+                                                "Rebuilds every corpus when no ID is given")
+    @click.argument("corpora", type=click.INT, nargs=-1)
+    def corpus_stats_rebuild(corpora):
+        with app.app_context():
+            query = Corpus.query
+            if corpora:
+                query = query.filter(Corpus.id.in_(corpora))
+            for corpus in query.order_by(Corpus.id).all():
+                stats = CorpusStats.rebuild(corpus)
+                click.echo("--- {} ({}): {} tokens, {} changes".format(
+                    corpus.name, corpus.id, corpus.token_count, stats.changes
                 ))
-                click.echo("--- Allowed Lemma Values dumped")
-            with open(os.path.join(path, DEFAULT_FILENAMES["morph"]), "w") as file:
-                file.write(AllowedMorph.to_input_format(
-                    AllowedMorph.query.filter(AllowedMorph.control_list == corpus.control_lists_id)
+
+    @click.command("corpus-token-count", help="Check that the cached token count of corpora matches their tokens. "
+                                              "Checks every corpus when no ID is given")
+    @click.argument("corpora", type=click.INT, nargs=-1)
+    @click.option("--repair", is_flag=True, default=False, help="Overwrite wrong counts with the actual count")
+    def corpus_token_count(corpora, repair=False):
+        with app.app_context():
+            query = Corpus.query
+            if corpora:
+                query = query.filter(Corpus.id.in_(corpora))
+            inconsistent = 0
+            for corpus in query.order_by(Corpus.id).all():
+                actual = corpus.count_tokens()
+                if actual == corpus.token_count:
+                    continue
+                inconsistent += 1
+                click.echo("--- {} ({}): {} cached, {} actual".format(
+                    corpus.name, corpus.id, corpus.token_count, actual
                 ))
-                click.echo("--- Allowed Morphological Values dumped")
-            with open(os.path.join(path, DEFAULT_FILENAMES["POS"]), "w") as file:
-                file.write(AllowedPOS.to_input_format(
-                    AllowedPOS.query.filter(AllowedPOS.control_list == corpus.control_lists_id)
+                if repair:
+                    corpus.token_count = actual
+            if repair:
+                db.session.commit()
+                click.echo("{} corpora repaired".format(inconsistent))
+            else:
+                click.echo("{} inconsistent corpora".format(inconsistent))
+
+    @click.command("control-lists-defaults", help="Load the default control lists from the language packs, "
+                                                  "updating those whose pack changed and skipping the others")
+    @click.option("--compile-only", is_flag=True, default=False,
+                  help="Only compile the packs, eg. to cache them when building an image")
+    @click.option("--jobs", type=click.INT, default=None, help="Number of packs read at the same time")
+    def control_lists_defaults(compile_only=False, jobs=None):
+        if compile_only:
+            for directory in pack_directories():
+                pack = load_pack(directory)
+                click.echo("--- {} compiled ({} lemma, {} POS, {} morph)".format(
+                    pack.name, len(pack.lemma), len(pack.POS), len(pack.morph)
                 ))
-                click.echo("--- Allowed POS Values dumped")
+            return
+        with app.app_context():
+            for pack, status in ControlLists.add_default_lists(jobs=jobs).items():
+                click.echo("--- {}: {}".format(pack, status))
+
+    @click.command("run-worker", help="Run the jobs enqueued by the application (imports, context updates, "
+                                      "deletions, exports...) until stopped")
+    @click.option("--burst", is_flag=True, default=False, help="Stop once there is no job left to run")
+    @click.option("--interval", type=click.FLOAT, default=2.0, show_default=True,
+                  help="Seconds between two polls of the job table when it is empty")
+    @click.option("--name", default=None, help="Name recorded on the jobs claimed (Defaults to host:pid)")
+    def run_worker(burst=False, interval=2.0, name=None):
+        with app.app_context():
+            worker = Worker(name=name, interval=interval)
+            # Let the current job finish on shutdown
+            signal.signal(signal.SIGTERM, worker.stop)
+            signal.signal(signal.SIGINT, worker.stop)
+            click.echo("Worker {} started".format(worker.name))
+            count = worker.run(burst=burst)
+            click.echo("Worker {} stopped after {} jobs".format(worker.name, count))
 
     @cli.command("db-stamp")
     @click.argument("revision", default="head")
@@ -438,6 +606,10 @@ def make_cli():
     cli.add_command(corpus_import)
     cli.add_command(corpus_dump)
     cli.add_command(corpus_list)
+    cli.add_command(corpus_stats_rebuild)
+    cli.add_command(corpus_token_count)
+    cli.add_command(run_worker)
+    cli.add_command(control_lists_defaults)
 
     @cli.group()
     def translate():
@@ -2,14 +2,16 @@ from flask import request, flash, redirect, url_for, Blueprint, abort, jsonify,
 from flask_login import current_user, login_required
 from functools import wraps
 
+import json
 import sqlalchemy.exc
 from werkzeug.exceptions import BadRequest, NotFound, Forbidden
 
 
 from app.main.views.utils import render_template_with_nav_info
-from app.models import ControlLists, ControlListsUser, AllowedLemma, WordToken, User, PublicationStatus, CorpusCustomDictionary
+from app.models import ControlLists, ControlListsUser, AllowedLemma, WordToken, User, PublicationStatus, CorpusCustomDictionary, \
+    CorpusStats, Job, Corpus
 from app import db, email
-from ..utils import PyrrhaError
+from app.models.validation import search_allowed_values, search_allowed_morph
 from ..utils.forms import strip_or_none
 from ..utils.tsv import StringDictReader
 from ..utils.response import format_api_like_reply
@@ -77,7 +79,10 @@ def lemma_list(control_list_id):
                 AllowedLemma.id == lemma.id,
                 AllowedLemma.control_list == control_list_id
             ).delete()
+            ControlLists.bump_version(control_list_id)
+            CorpusStats.invalidate_unallowed(control_list_id=control_list_id)
             db.session.commit()
+            Corpus.schedule_validity(control_list_id=control_list_id)
             return "", 200
         except Exception as E:
             db.session.rollback()
@@ -88,7 +93,10 @@ def lemma_list(control_list_id):
             return abort(400, jsonify({"message": "No lemma were passed."}))
         lemmas = list(set(form.split()))
         try:
-            AllowedLemma.add_batch(lemmas, control_list.id, _commit=True)
+            AllowedLemma.add_batch(lemmas, control_list.id, _commit=False)
+            CorpusStats.invalidate_unallowed(control_list_id=control_list.id)
+            db.session.commit()
+            Corpus.schedule_validity(control_list_id=control_list.id)
             return jsonify({"message": "Data saved"})
         except ValueError as E:
             db.session.rollback()
@@ -183,13 +191,18 @@ def edit(cl_id, allowed_type, control_list):
             ]
         else:
             allowed_values = list(StringDictReader(allowed_values))
-        try:
-            control_list.update_allowed_values(allowed_type, allowed_values)
-            flash("Control List Updated", category="success")
-        except PyrrhaError as exception:
-            flash("A Pyrrha error occurred: {}".format(exception), category="error")
-        except:
-            flash("An unknown error occurred", category="error")
+        # Invalid values fail the same way at each attempt: the job is not retried
+        job = Job.enqueue(
+            "control_list.allowed_values", user_id=current_user.id, max_attempts=1,
+            control_list_id=control_list.id, allowed_type=allowed_type, allowed_values=allowed_values
+        )
+        if job.status == Job.DONE:
+            flash("Control List Updated ({added} added, {removed} removed, {updated} updated)".format(
+                **json.loads(job.result)), category="success")
+        elif job.status == Job.FAILED:
+            flash("The control list could not be updated: {}".format(job.error), category="error")
+        else:
+            flash("The control list is being updated", category="success")
 
     values = control_list.get_allowed_values(allowed_type=allowed_type, order_by="id")
     if allowed_type == "lemma":
@@ -220,6 +233,15 @@ def search_api(control_list_id, allowed_type):
     :param control_list_id: Id of the Control List
     :param allowed_type: Type of allowed value (lemma, morph, POS)
     """
+    if allowed_type in ("lemma", "POS"):
+        return jsonify(search_allowed_values(
+            control_list_id, allowed_type, request.args.get("form") or "", AUTOCOMPLETE_LIMIT
+        ))
+    if allowed_type == "morph":
+        return jsonify([
+            format_api_like_reply(result, allowed_type)
+            for result in search_allowed_morph(control_list_id, request.args.get("form") or "", AUTOCOMPLETE_LIMIT)
+        ])
     return jsonify(
         [
             format_api_like_reply(result, allowed_type)
@@ -394,7 +416,9 @@ def ignore_terms_filter(control_list_id, control_list):
         control_list.filter_numeral = 'numeral' in filtered_filter
         control_list.filter_ignore = 'ignore' in filtered_filter
         db.session.add(control_list)
+        ControlLists.bump_version(control_list.id)
         db.session.commit()
+        Corpus.schedule_validity(control_list_id=control_list.id)
 
 
         flash('The filters have been updated.', 'success')
@@ -0,0 +1,256 @@
+""" Tasks run by the job worker (see app.models.jobs.Job) and the worker loop itself
+
+Tasks receive the running job first, then the arguments given to Job.enqueue. They must be safe to run again
+after a failure, as failed jobs are retried from the start.
+"""
+import logging
+import os
+import time
+from contextlib import closing
+from itertools import islice
+from typing import Optional
+
+from flask import current_app
+
+from . import db
+from .lemmatizers import LemmatizationPipeline, LemmatizerError
+from .models import Corpus, ControlLists, WordToken, SimilarCount
+from .models.jobs import Job
+from .utils.response import stream_template
+
+
+logger = logging.getLogger(__name__)
+
+
+@Job.register("corpus.finalize")
+def finalize_corpus(job: Job, corpus_id: int):
+    """ Repair the order ids and contexts of a corpus uploaded by chunks, then make it available """
+    corpus = db.session.get(Corpus, corpus_id)
+    if corpus is None or corpus.status != "pending":
+        return None
+    token_count = corpus.count_tokens()
+    job.report(0, total=token_count)
+    # Order ids come from client-sent offsets: renumber them if a chunk was lost or sent twice
+    if not WordToken.has_continuous_order_ids(corpus_id):
+        logger.warning("Corpus %s: non-continuous order ids after upload, renumbering tokens", corpus_id)
+        WordToken.renumber_order_ids(corpus_id)
+    # Each chunk was contextualized on its own: contexts are cut at chunk boundaries
+    if corpus.store_context:
+        WordToken.stitch_contexts(
+            corpus_id,
+            context_left=corpus.context_left or WordToken.CONTEXT_LEFT,
+            context_right=corpus.context_right or WordToken.CONTEXT_RIGHT,
+            chunk_size=current_app.config.get("CORPUS_UPLOAD_CHUNK_SIZE", 2000)
+        )
+    corpus.token_count = token_count
+    corpus.status = "active"
+    corpus.ensure_validity(_commit=False)
+    job.report(token_count)
+    db.session.commit()
+    return {"tokens": token_count}
+
+
+@Job.register("corpus.lemmatize")
+def lemmatize_corpus(job: Job, corpus_id: int, service_uri: str, text: str):
+    """ Lemmatize raw text with a service and add its tokens to a pending corpus, then finalize it
+
+    Tokens are written by chunks of CORPUS_UPLOAD_CHUNK_SIZE as they come back from the service, the same way
+    chunked uploads are, and finalization stitches the contexts of the chunks.
+    """
+    corpus = db.session.get(Corpus, corpus_id)
+    if corpus is None or corpus.status != "pending":
+        return None
+    # A failed attempt may have left some tokens behind
+    WordToken.query.filter(WordToken.corpus == corpus_id).delete(synchronize_session=False)
+    db.session.commit()
+
+    chunk_size = current_app.config.get("CORPUS_UPLOAD_CHUNK_SIZE", 2000)
+    pipeline = LemmatizationPipeline.from_config(service_uri, current_app.config)
+    count = 0
+    with closing(pipeline.tokens(text)) as tokens:
+        while True:
+            chunk = list(islice(tokens, chunk_size))
+            if not chunk:
+                break
+            WordToken.add_batch(
+                corpus_id, chunk, context_left=corpus.context_left, context_right=corpus.context_right,
+                order_id_offset=count
+            )
+            count += len(chunk)
+            job.report(count)
+            db.session.commit()
+    if count == 0:
+        raise LemmatizerError("The lemmatization service returned no token")
+    return finalize_corpus(job, corpus_id)
+
+
+@Job.register("corpus.contexts")
+def update_contexts(job: Job, corpus_id: int, context_left: int, context_right: int):
+    """ Recompute the contexts of every token of a corpus """
+    total = db.session.query(Corpus.token_count).filter(Corpus.id == corpus_id).scalar()
+    Corpus.run_context_update(
+        corpus_id, context_left, context_right,
+        progress=lambda updated: job.report(updated, total=total)
+    )
+
+
+@Job.on_finish("corpus.contexts")
+def end_context_update(job: Job):
+    """ Allow new context updates of the corpus however the job ended, even if it never ran """
+    Corpus.set_context_update_progress(job.corpus_id, None, _commit=False)
+
+
+@Job.register("corpus.renumber")
+def renumber_corpus(job: Job, corpus_id: int):
+    """ Renumber the order ids of a corpus, which is locked meanwhile so that no token is inserted or deleted
+    between the order ids being rewritten """
+    if not Corpus.lock(corpus_id):
+        return None
+    total = db.session.query(Corpus.token_count).filter(Corpus.id == corpus_id).scalar()
+    job.report(0, total=total)
+    WordToken.renumber_order_ids(corpus_id)
+    job.report(total)
+    db.session.commit()
+    return {"tokens": total}
+
+
+@Job.register("corpus.similar_counts")
+def count_similar_tokens(job: Job, corpus_id: int):
+    """ Build the similar counts of a corpus, unless another job built them while this one was queued """
+    if not Corpus.lock(corpus_id) or SimilarCount.is_ready(corpus_id):
+        return None
+    job.report(0)
+    SimilarCount.rebuild(corpus_id)
+    return {"tokens": db.session.query(Corpus.token_count).filter(Corpus.id == corpus_id).scalar()}
+
+
+@Job.register("corpus.validity")
+def refresh_validity(job: Job, corpus_id: int):
+    """ Recompute the validity flags of the tokens of a corpus, unless another job already did """
+    if not Corpus.lock(corpus_id):
+        return None
+    corpus = db.session.get(Corpus, corpus_id)
+    job.report(0)
+    recomputed = corpus.ensure_validity(_commit=False)
+    db.session.commit()
+    return {"recomputed": recomputed}
+
+
+@Job.register("corpus.delete", cancellable=False)
+def delete_corpus(job: Job, corpus_id: int, chunk_size: int = 5000):
+    """ Remove the tokens of a corpus by chunks, so that the transaction stays small, then the corpus itself.
+    Chunks are committed as they go: the job cannot be cancelled, and the next attempt resumes a failed one.
+    """
+    corpus = db.session.get(Corpus, corpus_id)
+    if corpus is None:
+        return None
+    total, deleted = corpus.token_count, 0
+    while True:
+        ids = [
+            token_id for (token_id, ) in
+            db.session.query(WordToken.id).filter(WordToken.corpus == corpus_id).limit(chunk_size)
+        ]
+        if not ids:
+            break
+        WordToken.query.filter(WordToken.id.in_(ids)).delete(synchronize_session=False)
+        deleted += len(ids)
+        job.report(deleted, total=total)
+        db.session.commit()
+    # Enjoy cascade deletion
+    db.session.delete(db.session.get(Corpus, corpus_id))
+    db.session.commit()
+    return {"tokens": deleted}
+
+
+@Job.register("corpus.export")
+def export_corpus(job: Job, corpus_id: int, format: str):
+    """ Write a TEI export of a corpus to JOBS_FOLDER, the result gives the name of the file """
+    from .main.views.tokens import tei_export
+
+    corpus = db.session.get(Corpus, corpus_id)
+    template, filename, context = tei_export(corpus, format)
+    total = corpus.token_count
+    chunk_size = context["tokens"].chunk_size
+
+    class ReportingStream:
+        """ Reports the number of exported tokens after each chunk """
+        def __init__(self, stream):
+            self.stream = stream
+
+        def __iter__(self):
+            for index, row in enumerate(self.stream, 1):
+                if index % chunk_size == 0:
+                    job.report(index, total=total)
+                    db.session.commit()
+                yield row
+
+    context["tokens"] = ReportingStream(context["tokens"])
+    folder = current_app.config["JOBS_FOLDER"]
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, "{}-{}".format(job.id, filename))
+    with open(path, "w") as file:
+        for piece in stream_template(template, **context):
+            file.write(piece)
+    job.report(total, total=total)
+    return {"filename": filename, "path": path}
+
+
+@Job.register("control_list.allowed_values")
+def replace_allowed_values(job: Job, control_list_id: int, allowed_type: str, allowed_values: list):
+    """ Replace the allowed values of a given type of a control list, reporting the number of values added,
+    removed and updated """
+    control_list = db.session.get(ControlLists, control_list_id)
+    job.report(0, total=len(allowed_values))
+    change = control_list.update_allowed_values(allowed_type, allowed_values)
+    job.report(len(allowed_values))
+    db.session.commit()
+    # Corpora whose flags were already stale could not follow the change
+    Corpus.schedule_validity(control_list_id=control_list_id)
+    return change.to_dict()
+
+
+class Worker:
+    """ Claim and run jobs one at a time until stopped
+
+    :param name: Name of the worker recorded on the jobs it claims
+    :param interval: Seconds to wait before polling again when there is nothing to run
+    """
+    def __init__(self, name: Optional[str] = None, interval: float = 2.0):
+        self.name = name or Job.worker_name()
+        self.interval = interval
+        self.stopped = False
+
+    def stop(self, *args):
+        """ Stop once the current job is over (usable as a signal handler) """
+        self.stopped = True
+
+    def run_once(self) -> bool:
+        """ Run the next job ready to run
+
+        :return: Whether a job was run
+        """
+        job = Job.claim(self.name)
+        if job is None:
+            return False
+        logger.info("Worker %s runs job %s (%s)", self.name, job.id, job.task)
+        job.run()
+        db.session.remove()
+        return True
+
+    def run(self, burst: bool = False, max_jobs: Optional[int] = None) -> int:
+        """ Run jobs as they come
+
+        :param burst: Stop when there is no job ready to run
+        :param max_jobs: Stop after this number of jobs
+        :return: Number of jobs run
+        """
+        count = 0
+        while not self.stopped and (max_jobs is None or count < max_jobs):
+            Job.requeue_stale()
+            if self.run_once():
+                count += 1
+            elif burst:
+                break
+            else:
+                time.sleep(self.interval)
+        return count
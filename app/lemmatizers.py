@@ -1,5 +1,26 @@
-from typing import Optional
+""" Lemmatization services and the pipeline sending raw text to them from the server
+
+The pipeline splits a text into batches of whole sentences and posts them concurrently to the service, reusing
+a small pool of keep-alive connections. Only max_pending batches are in flight or waiting to be read at any
+time, so that reading the tokens slowly (eg. while they are written to the database) slows the requests down
+instead of buffering the whole text. Tokens come out in the order of the text.
+"""
+import http.client
+import logging
+import queue
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
 from dataclasses import dataclass
+from urllib.parse import urlsplit, urlencode
+
+import regex as re
+
+from .utils import PyrrhaError
+
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -10,3 +31,180 @@ class LemmatizerService:
     bibtex: str  # Citation Scheme
     apa: str  # APA equivalent
     ui: Optional[str] = None
+
+
+class LemmatizerError(PyrrhaError):
+    """ Raised when a lemmatization service does not answer a batch correctly """
+
+
+# A sentence ends with strong punctuation followed by spaces, or with an empty line
+_SENTENCE_END = re.compile(r"(?<=[.!?;])\s+|\n\s*\n")
+# Column names of the services, as expected by WordToken.add_batch
+_COLUMNS = {"token": "form", "pos": "POS"}
+
+
+def sentence_batches(text: str, batch_size: int) -> Iterator[str]:
+    """ Split a text into batches of whole sentences of about batch_size words. A sentence longer than
+    batch_size is cut by batch_size words.
+
+    :param text: Raw text
+    :param batch_size: Number of words per batch
+    """
+    words, sentences = 0, []
+    start = 0
+    for end in [match.start() for match in _SENTENCE_END.finditer(text)] + [len(text)]:
+        sentence = text[start:end].strip()
+        start = end
+        if not sentence:
+            continue
+        length = len(sentence.split())
+        if words and words + length > batch_size:
+            yield " ".join(sentences)
+            words, sentences = 0, []
+        if length > batch_size:
+            sentence_words = sentence.split()
+            for index in range(0, length, batch_size):
+                yield " ".join(sentence_words[index:index + batch_size])
+            continue
+        words += length
+        sentences.append(sentence)
+    if sentences:
+        yield " ".join(sentences)
+
+
+def parse_response(body: str) -> List[Dict[str, str]]:
+    """ Read the TSV returned by a service into token dicts with form, lemma, POS and morph keys """
+    lines = [line for line in body.splitlines() if line.strip()]
+    if not lines:
+        return []
+    header = [_COLUMNS.get(column, column) for column in lines[0].split("\t")]
+    if "form" not in header:
+        raise LemmatizerError("The service did not return a token column")
+    return [dict(zip(header, line.split("\t"))) for line in lines[1:]]
+
+
+class ConnectionPool:
+    """ Keep-alive HTTP connections to a single host, shared by the threads of a pipeline
+
+    :param uri: Address of the service
+    :param size: Maximum number of idle connections kept
+    :param timeout: Seconds before a connection or a read times out
+    """
+    def __init__(self, uri: str, size: int = 4, timeout: float = 60.0):
+        parts = urlsplit(uri)
+        self.path = (parts.path or "/") + ("?" + parts.query if parts.query else "")
+        self.host, self.port = parts.hostname, parts.port
+        self.connection_class = http.client.HTTPSConnection if parts.scheme == "https" else http.client.HTTPConnection
+        self.timeout = timeout
+        self.idle = queue.LifoQueue(maxsize=size)
+
+    def post(self, fields: Dict[str, str]) -> (int, str):
+        """ Post form fields to the service
+
+        :return: Status and decoded body of the response
+        """
+        try:
+            connection = self.idle.get_nowait()
+        except queue.Empty:
+            connection = self.connection_class(self.host, self.port, timeout=self.timeout)
+        try:
+            connection.request(
+                "POST", self.path, body=urlencode(fields),
+                headers={"Content-Type": "application/x-www-form-urlencoded", "Connection": "keep-alive"}
+            )
+            response = connection.getresponse()
+            body = response.read().decode("utf-8")
+        except Exception:
+            connection.close()
+            raise
+        if response.will_close:
+            connection.close()
+        else:
+            try:
+                self.idle.put_nowait(connection)
+            except queue.Full:
+                connection.close()
+        return response.status, body
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class LemmatizationPipeline:
+    """ Lemmatize raw text with a service, batch by batch
+
+    :param uri: Address of the service, which receives the text in the data field of a form
+    :param batch_size: Number of words sent at once, batches are cut at sentence ends
+    :param max_workers: Number of batches sent at the same time
+    :param max_pending: Number of batches sent or waiting to be read (Defaults to twice max_workers)
+    :param retries: Number of times a batch is sent again after a network error or a 429/5xx answer
+    :param retry_delay: Seconds before the first retry, doubled after each of them
+    :param timeout: Seconds before a request times out
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+    def __init__(self, uri: str, batch_size: int = 1000, max_workers: int = 4, max_pending: Optional[int] = None,
+                 retries: int = 3, retry_delay: float = 1.0, timeout: float = 60.0):
+        self.uri = uri
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_pending = max(max_pending or 2 * max_workers, max_workers)
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.timeout = timeout
+
+    @classmethod
+    def from_config(cls, uri: str, config) -> "LemmatizationPipeline":
+        """ Build a pipeline with the LEMMATIZER_* settings of the application """
+        return cls(
+            uri,
+            batch_size=config.get("LEMMATIZER_BATCH_SIZE", 1000),
+            max_workers=config.get("LEMMATIZER_WORKERS", 4),
+            retries=config.get("LEMMATIZER_RETRIES", 3),
+            timeout=config.get("LEMMATIZER_TIMEOUT", 60.0)
+        )
+
+    def lemmatize_batch(self, pool: ConnectionPool, batch: str) -> List[Dict[str, str]]:
+        """ Send a batch to the service, retrying transient failures
+
+        :raises LemmatizerError: When the service refused the batch or kept failing
+        """
+        for attempt in range(self.retries + 1):
+            try:
+                status, body = pool.post({"data": batch})
+            except (OSError, http.client.HTTPException) as exception:
+                error = "{}: {}".format(type(exception).__name__, exception)
+            else:
+                if status == 200:
+                    return parse_response(body)
+                error = "HTTP {}".format(status)
+                if status not in self.RETRY_STATUSES:
+                    break
+            if attempt < self.retries:
+                logger.warning("Lemmatizer %s failed (%s), retrying", self.uri, error)
+                time.sleep(self.retry_delay * 2 ** attempt)
+        raise LemmatizerError("The lemmatization service failed: {}".format(error))
+
+    def tokens(self, text: str) -> Iterator[Dict[str, str]]:
+        """ Lemmatize text, yielding its tokens in order as soon as their batch is back
+
+        :param text: Raw text
+        """
+        pool = ConnectionPool(self.uri, size=self.max_workers, timeout=self.timeout)
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="lemmatizer")
+        pending = deque()
+        try:
+            for batch in sentence_batches(text, self.batch_size):
+                # Backpressure: the next batch is sent only once the oldest one was read
+                if len(pending) >= self.max_pending:
+                    yield from pending.popleft().result()
+                pending.append(executor.submit(self.lemmatize_batch, pool, batch))
+            while pending:
+                yield from pending.popleft().result()
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            pool.close()
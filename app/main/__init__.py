@@ -4,4 +4,4 @@ from flask import Blueprint
 main = Blueprint('main', __name__)
 
 from . import errors, filters
-from .views import tokens, corpus, index, dashboard, browse_api
+from .views import tokens, corpus, index, dashboard, browse_api, jobs
@@ -1,6 +1,6 @@
 import math
 import locale
-from typing import Optional
+from typing import Dict, Optional
 from json import dumps
 
 from flask import request, url_for
@@ -29,14 +29,21 @@ def json(obj):
 
 
 @main.app_template_filter("get_token_uri")
-def get_token_uri(token: Optional[WordToken]):
+def get_token_uri(token: Optional[WordToken], positions: Optional[Dict[int, int]] = None):
+    """ Link to the page of the annotation table showing a token
+
+    :param token: Token to link to
+    :param positions: Positions of the tokens of the page by ID (See Corpus.get_positions), so that they are not
+        read again for each token
+    """
     if token is None:
         return "#"
     per_page = request.args.get("per_page", 100, int)
-    page = int(math.ceil(token.order_id / 100))
+    position = positions[token.id] if positions and token.id in positions else token.position
+    page = int(math.ceil(position / 100))
     return url_for(
         "main.tokens_correct",
         corpus_id=token.corpus,
         page=page,
         limit=per_page
-    ) + f"#tok{token.order_id}"
+    ) + f"#tok{position}"
@@ -3,7 +3,7 @@ from flask_login import login_required, current_user
 from sqlalchemy import func
 
 from app import db
-from app.models import Corpus, CorpusUser, ControlLists, ControlListsUser, Favorite
+from app.models import Corpus, CorpusUser, ControlLists, ControlListsUser, Favorite, CorpusStats
 from app.models.corpus import WordToken, ChangeRecord
 from app.models.user import User
 from app.utils.pagination import int_or
@@ -16,6 +16,17 @@ def _paginate_query(query, page, per_page):
     return query.paginate(page=page, per_page=per_page, error_out=False)
 
 
+def _materialized_or_live(stats_column, live_query):
+    """ Read a counter from corpus_stats, falling back on the live count for corpora without a row yet """
+    materialized = (
+        db.session.query(stats_column)
+        .filter(CorpusStats.corpus_id == Corpus.id)
+        .correlate(Corpus)
+        .scalar_subquery()
+    )
+    return func.coalesce(materialized, live_query.correlate(Corpus).scalar_subquery())
+
+
 def _corpus_subqueries():
     user_count = (
         db.session.query(func.count(CorpusUser.user_id))
@@ -23,12 +34,6 @@ def _corpus_subqueries():
         .correlate(Corpus)
         .scalar_subquery()
     )
-    token_count = (
-        db.session.query(func.count(WordToken.id))
-        .filter(WordToken.corpus == Corpus.id)
-        .correlate(Corpus)
-        .scalar_subquery()
-    )
     last_change = (
         db.session.query(func.max(ChangeRecord.created_on))
         .filter(ChangeRecord.corpus == Corpus.id)
@@ -51,13 +56,11 @@ def _corpus_subqueries():
         .correlate(Corpus)
         .scalar_subquery()
     )
-    needs_review_count = (
-        db.session.query(func.count(WordToken.id))
-        .filter(WordToken.corpus == Corpus.id, WordToken.needs_review == True)
-        .correlate(Corpus)
-        .scalar_subquery()
+    needs_review_count = _materialized_or_live(
+        CorpusStats.needs_review,
+        db.session.query(func.count(WordToken.id)).filter(WordToken.corpus == Corpus.id, WordToken.needs_review == True)
     )
-    return user_count, token_count, last_change, is_fav, owner_sort, needs_review_count
+    return user_count, last_change, is_fav, owner_sort, needs_review_count
 
 
 @main.route('/api/browse/corpora')
@@ -69,12 +72,12 @@ def browse_corpora_api():
         abort(403)
     admin_view = wants_admin
 
-    user_count_sq, token_count_sq, last_change_sq, is_fav_sq, owner_sort_sq, needs_review_count_sq = _corpus_subqueries()
+    user_count_sq, last_change_sq, is_fav_sq, owner_sort_sq, needs_review_count_sq = _corpus_subqueries()
 
     base = db.session.query(
         Corpus,
         user_count_sq.label('user_count'),
-        token_count_sq.label('token_count'),
+        Corpus.token_count,
         last_change_sq.label('last_change'),
         is_fav_sq.label('is_fav'),
         needs_review_count_sq.label('needs_review_count'),
@@ -108,7 +111,7 @@ def browse_corpora_api():
 
     sort_cols = {
         'name':        Corpus.name,
-        'token_count': token_count_sq,
+        'token_count': Corpus.token_count,
         'user_count':  user_count_sq,
         'last_change': last_change_sq,
         'owners':      owner_sort_sq,
@@ -9,9 +9,10 @@ from typing import List
 from app import db
 
 from app.models import CorpusUser, ControlLists, ControlListsUser, WordToken, ChangeRecord, Bookmark, Favorite, User, \
-    CorpusCustomDictionary
+    CorpusCustomDictionary, CorpusStats, Job
 
 from .utils import render_template_with_nav_info
+from .jobs import job_json
 from app.utils import ValidationError
 from app.utils.forms import create_input_format_convertion, read_input_tokens
 from .. import main
@@ -19,7 +20,7 @@ from ...utils.forms import strip_or_none
 from ...models import Corpus, Column
 from ...utils.response import format_api_like_reply
 from ...errors import MissingTokenColumnValue, NoTokensInput
-from .utils import requires_corpus_admin_access, requires_corpus_access
+from .utils import requires_corpus_admin_access, requires_corpus_access, corpus_context
 from ..forms import Delete
 from app.utils import PreferencesUpdateError, PersonalDictionaryError
 from app import logger
@@ -70,6 +71,7 @@ def corpus_new():
                 "context_left": request.form.get("context_left", None),
                 "context_right": request.form.get("context_right", None),
                 "delimiter_token": strip_or_none(request.form.get("sep_token", "")) or None,
+                "store_context": not request.form.get("lazyContext"),
                 "columns": [
                     Column(heading="Lemma"),
                     Column(heading="POS"),
@@ -134,6 +136,7 @@ def corpus_new():
                 current_controlList.filter_numeral = 'numeral' in list_filter
                 current_controlList.filter_ignore = 'ignore' in list_filter
                 db.session.commit()
+                Corpus.schedule_validity(corpus_id=corpus.id)
                 flash("New corpus registered", category="success")
             except (sqlalchemy.exc.StatementError, sqlalchemy.exc.IntegrityError) as e:
                 db.session.rollback()
@@ -193,11 +196,15 @@ def corpus_new_init():
     if (data.get("lemmaColumn") and data.get("posColumn") and data.get("morphColumn")):
         return jsonify({"error": "You can't disable Lemma and POS and Morph. Keep at least one."}), 400
 
-    # Clean up any previous pending corpora for this user before creating a new one
+    # Clean up any previous pending corpora for this user before creating a new one, except those a job is
+    # still finalizing or lemmatizing
+    in_progress = db.session.query(Job.corpus_id).filter(
+        Job.corpus_id.isnot(None), Job.status.in_((Job.QUEUED, Job.RUNNING))
+    )
     old_pending = (
         db.session.query(Corpus)
         .join(CorpusUser, CorpusUser.corpus_id == Corpus.id)
-        .filter(CorpusUser.user_id == current_user.id, Corpus.status == 'pending')
+        .filter(CorpusUser.user_id == current_user.id, Corpus.status == 'pending', Corpus.id.notin_(in_progress))
         .all()
     )
     for old in old_pending:
@@ -207,7 +214,7 @@ def corpus_new_init():
 
     form_kwargs = dict(
         name=name, context_left=context_left, context_right=context_right,
-        delimiter_token=delimiter_token, columns=columns,
+        delimiter_token=delimiter_token, columns=columns, store_context=not data.get("lazyContext"),
     )
 
     control_list_mode = data.get("control_list", "create")
@@ -309,15 +316,44 @@ def corpus_tokens_finalize(corpus_id):
     if not cu or corpus.status != 'pending':
         abort(403)
 
-    token_count = WordToken.query.filter_by(corpus=corpus_id).count()
+    # Chunks may have been retried by the client: the finalize count is authoritative
+    token_count = corpus.count_tokens()
     if token_count == 0:
         db.session.delete(corpus)
         db.session.commit()
         return jsonify({"error": "You did not input any text."}), 400
 
-    corpus.status = 'active'
-    db.session.commit()
-    return jsonify({"redirect": url_for(".corpus_get", corpus_id=corpus_id)})
+    # Order ids and contexts are repaired by a job, the corpus becomes active once it is over
+    job = Job.enqueue("corpus.finalize", user_id=current_user.id, corpus_id=corpus_id)
+    if job.status == Job.FAILED:
+        return jsonify({"error": "The corpus could not be finalized.", "job": job_json(job)}), 500
+    return jsonify({"redirect": url_for(".corpus_get", corpus_id=corpus_id), "job": job_json(job)})
+
+
+@main.route('/corpus/<int:corpus_id>/tokens/lemmatize', methods=["POST"])
+@login_required
+def corpus_tokens_lemmatize(corpus_id):
+    """Lemmatize raw text on the server and add its tokens to a pending corpus, which is then finalized."""
+    corpus = Corpus.get_or_404(corpus_id)
+    cu = CorpusUser.query.filter_by(corpus_id=corpus_id, user_id=current_user.id,
+                                    is_owner=True).first()
+    if not cu or corpus.status != 'pending':
+        abort(403)
+
+    data = request.get_json(silent=True) or {}
+    # Only configured services are reached from the server
+    services = {service.uri for service in current_app.config.get("LEMMATIZERS", [])}
+    if data.get("service") not in services:
+        return jsonify({"error": "Unknown lemmatization service."}), 400
+    text = (data.get("text") or "").strip()
+    if not text:
+        return jsonify({"error": "You did not input any text."}), 400
+
+    job = Job.enqueue("corpus.lemmatize", user_id=current_user.id, corpus_id=corpus_id,
+                      service_uri=data["service"], text=text)
+    if job.status == Job.FAILED:
+        return jsonify({"error": "The text could not be lemmatized.", "job": job_json(job)}), 500
+    return jsonify({"redirect": url_for(".corpus_get", corpus_id=corpus_id), "job": job_json(job)})
 
 
 @main.route('/corpus/favorite/<int:corpus_id>')
@@ -419,7 +455,7 @@ def corpus_bookmark(corpus_id):
             token=bm.token_id
         )
     else:
-        bm = Corpus.get_or_404(corpus_id).get_bookmark(current_user)
+        bm = corpus_context(corpus_id).bookmark
         if bm:
             link = "{uri}#token_{token}_row".format(
                 uri=url_for("main.tokens_correct", corpus_id=corpus_id, page=bm.page),
@@ -439,10 +475,11 @@ def corpus_delete(corpus_id: int):
     form = Delete(prefix="delete")
     if request.method == "POST" and form.validate():
         if form.name.data == corpus.name.strip():
-            # Enjoy cascade deletion
-            db.session.delete(corpus)
-            db.session.commit()
-            flash("The corpus has been removed", category="success")
+            job = Job.enqueue("corpus.delete", user_id=current_user.id, corpus_id=corpus.id)
+            if job.status == Job.DONE:
+                flash("The corpus has been removed", category="success")
+            else:
+                flash("The corpus is being removed", category="success")
             return redirect(url_for(".index"))
         else:
             flash("The corpus name you entered is not the one expected.", category="error")
@@ -499,7 +536,9 @@ def control_list_switch(corpus_id: int):
                 ]
             ]
             corpus.control_lists_id = control_list.id
+            CorpusStats.invalidate_unallowed(corpus_id=corpus.id)
             switch_control_lists_access(corpus, users, current_control_lists.id)
+            Corpus.schedule_validity(corpus_id=corpus.id)
             flash(
                 "The control list has been switched to {}".format(control_list.name),
                 category="success"
@@ -574,6 +613,11 @@ def custom_dictionary_search_value_api(corpus_id, category):
     corpus = Corpus.get_or_404(corpus_id)
     if not corpus.has_access(current_user):
         abort(403)
+    if category == "morph":
+        return jsonify([
+            format_api_like_reply(result, category)
+            for result in CorpusCustomDictionary.search_morph(corpus, form, AUTOCOMPLETE_LIMIT)
+        ])
     return jsonify(
         [
             format_api_like_reply(result, category)
@@ -634,6 +678,7 @@ def corpus_preferences(corpus_id: int):
             corpus.update_contexts(
                 context_left=new_context_left,
                 context_right=new_context_right,
+                store_context=not request.form.get("lazyContext"),
             )
             corpus.update_columns(
                 {
@@ -659,6 +704,12 @@ def corpus_preferences(corpus_id: int):
         db.session.add(gloss_col)
         db.session.commit()
 
+    if corpus.context_update_progress is not None:
+        flash(
+            f"Contexts are being updated: {corpus.context_update_progress} / {corpus.token_count} tokens",
+            category="info"
+        )
+
     return render_template_with_nav_info(
         "main/corpus_preferences.html",
         sep_token=corpus.delimiter_token or "",
@@ -670,6 +721,19 @@ def corpus_preferences(corpus_id: int):
     )
 
 
+@main.route("/corpus/<int:corpus_id>/preferences/contexts")
+@login_required
+@requires_corpus_access("corpus_id")
+def corpus_contexts_progress(corpus_id: int):
+    """Progress of the context update running in the background."""
+    corpus = Corpus.get_or_404(corpus_id)
+    return jsonify({
+        "running": corpus.context_update_progress is not None,
+        "updated": corpus.context_update_progress or 0,
+        "total": corpus.token_count
+    })
+
+
 @main.route("/corpus/<int:corpus_id>/custom-dict", methods=["GET", "POST", "PATCH"])
 @login_required
 @requires_corpus_access("corpus_id")
@@ -686,6 +750,7 @@ def corpus_custom_dictionary(corpus_id: int):
             elif not value:
                 raise PersonalDictionaryError("Value is missing")
             corpus.insert_custom_dictionary_value(category=category, string=value)
+            Corpus.schedule_validity(corpus_id=corpus.id)
             return jsonify({
                 "status": True,
                 "message": "New value saved."
@@ -711,6 +776,7 @@ def corpus_custom_dictionary(corpus_id: int):
             corpus.custom_dictionaries_update(
                 "morph", morph
             )
+            Corpus.schedule_validity(corpus_id=corpus.id)
         except PersonalDictionaryError as exception:
             flash(
                 f"Faild to update dictionary: {exception}",
@@ -6,7 +6,7 @@ from typing import List
 
 from app import db
 from app.decorators import admin_required
-from app.main.views.utils import render_template_with_nav_info
+from app.main.views.utils import render_template_with_nav_info, corpus_context
 from app.models import Corpus, User, Role, ControlLists, CorpusUser, ControlListsUser, WordToken
 from .. import main
 
@@ -168,10 +168,13 @@ def manage_corpus_users(corpus_id):
     """
          Save or display corpus accesses
      """
-    corpus = Corpus.query.filter(Corpus.id == corpus_id).first()
+    context = corpus_context(corpus_id)
+    if context is None:
+        abort(404)
+    corpus = context.corpus
 
-    can_read = corpus.has_access(current_user)
-    can_edit = current_user.is_admin() or corpus.is_owned_by(current_user)
+    can_read = context.has_access
+    can_edit = current_user.is_admin() or context.is_owner
 
     if can_read is True:
         # only owners can give/remove access & promote a user to owner
@@ -0,0 +1,66 @@
+import os
+
+from flask import jsonify, url_for, abort, send_file
+from flask_login import current_user, login_required
+
+from app import db
+from .. import main
+from ...models import Job
+
+
+def _get_readable_job(job_id: int) -> Job:
+    job = db.session.get(Job, job_id)
+    if job is None:
+        abort(404)
+    if not job.can_be_read_by(current_user):
+        abort(403)
+    return job
+
+
+def job_json(job: Job) -> dict:
+    """ Progress of a job, with the URLs to follow and cancel it and to download its file when there is one """
+    data = job.to_dict()
+    data["url"] = url_for("main.job_status", job_id=job.id)
+    data["cancel_url"] = url_for("main.job_cancel", job_id=job.id) if job.cancellable else None
+    data["download_url"] = url_for("main.job_download", job_id=job.id) \
+        if job.status == Job.DONE and (data["result"] or {}).get("path") else None
+    return data
+
+
+@main.route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    """ Progress of a background job
+
+    :param job_id: ID of the job
+    """
+    return jsonify(job_json(_get_readable_job(job_id)))
+
+
+@main.route('/jobs/<int:job_id>/cancel', methods=["POST"])
+@login_required
+def job_cancel(job_id):
+    """ Cancel a queued job, or ask a running job to stop
+
+    :param job_id: ID of the job
+    """
+    job = _get_readable_job(job_id)
+    if not job.can_be_cancelled_by(current_user):
+        abort(403)
+    if not job.cancel():
+        return jsonify({"error": "This job cannot be cancelled", "job": job_json(job)}), 409
+    return jsonify(job_json(job))
+
+
+@main.route('/jobs/<int:job_id>/download')
+@login_required
+def job_download(job_id):
+    """ Download the file written by a job
+
+    :param job_id: ID of the job
+    """
+    job = _get_readable_job(job_id)
+    result = job.to_dict()["result"] or {}
+    if job.status != Job.DONE or not result.get("path") or not os.path.isfile(result["path"]):
+        abort(404)
+    return send_file(result["path"], as_attachment=True, download_name=result["filename"])
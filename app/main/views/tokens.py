@@ -5,19 +5,52 @@ from slugify import slugify
 import math
 from csv import DictWriter
 from io import StringIO
-from typing import Dict
+from itertools import islice
+from typing import Dict, Optional
 from sqlalchemy.orm import selectinload
 
 from app import db
-from .utils import render_template_with_nav_info, request_wants_json, requires_corpus_access
+from .utils import render_template_with_nav_info, request_wants_json, requires_corpus_access, corpus_context
+from .jobs import job_json
 from .. import main
-from ...models import WordToken, Corpus, ChangeRecord, TokenHistory, Bookmark
+from ...models import WordToken, Corpus, ChangeRecord, TokenHistory, Bookmark, CorpusStats, Job
 from ...utils.forms import string_to_none
 from ...utils.pagination import int_or
+from ...utils.keyset import KeysetPagination
 from ...utils.tsv import TSV_CONFIG, stream_tsv
 from ...utils.response import stream_template
 
 
+#: TEI export formats: template, filename suffix and whether the token history is exported
+TEI_EXPORTS = {
+    "standoff-tei": ("tei/standoff.xml", "-standoff", False),
+    "tei-geste": ("tei/geste.xml", "", True),
+    "tei-msd": ("tei/TEI.xml", "", True),
+}
+
+
+def tei_export(corpus: Corpus, format: str):
+    """ Template, file name and streamed context of a TEI export of a corpus
+
+    :param corpus: Corpus to export
+    :param format: Key of TEI_EXPORTS
+    """
+    template, suffix, with_history = TEI_EXPORTS[format]
+    chunk_size = current_app.config["EXPORT_CHUNK_SIZE"]
+    context = dict(
+        base=corpus.first_token_id() - 1,
+        tokens=corpus.stream_tokens(chunk_size=chunk_size),
+        allowed_columns=corpus.displayed_columns_by_name,
+        delimiter=corpus.delimiter_token
+    )
+    if with_history:
+        context["has_history"] = db.session.query(
+            TokenHistory.query.filter(TokenHistory.corpus == corpus.id).exists()
+        ).scalar()
+        context["history"] = corpus.stream_token_history(chunk_size=chunk_size)
+    return template, "{}{}.xml".format(slugify(corpus.name), suffix), context
+
+
 def _corpus_urls(corpus, data_url=None):
     """ Return the URL map shared between the HTML config and the data API. """
     return {
@@ -51,6 +84,41 @@ def _corpus_urls(corpus, data_url=None):
     }
 
 
+def _paginate_tokens(query, total: Optional[int] = None, default_limit: Optional[int] = None,
+                     descending: bool = False) -> KeysetPagination:
+    """ Paginate tokens in the order of the corpus from the page, after, before and limit arguments of the request
+
+    Following and previous pages are read from the cursors sent with each page in constant time. The total is not
+    counted again when a cursor is given: unless known, it is the total argument sent back by the client.
+
+    :param query: Query of tokens
+    :param total: Known number of tokens
+    :param default_limit: Number of tokens per page (Defaults to PAGINATION_DEFAULT_TOKENS)
+    :param descending: Whether tokens are in the reverse order of the corpus
+    """
+    after, before = request.args.get("after") or None, request.args.get("before") or None
+    if total is None and (after or before):
+        total = int_or(request.args.get("total"), None)
+    return KeysetPagination(
+        query, (WordToken.order_id, WordToken.id),
+        per_page=int_or(request.args.get("limit"), default_limit or current_app.config["PAGINATION_DEFAULT_TOKENS"]),
+        page=int_or(request.args.get("page"), 1),
+        after=after, before=before, total=total, descending=descending
+    )
+
+
+def _page_json(tokens: KeysetPagination) -> dict:
+    """ Pagination data of the JSON endpoints of the annotation table """
+    return {
+        "page": tokens.page,
+        "pages": tokens.pages,
+        "total": tokens.total,
+        "per_page": tokens.per_page,
+        "next": tokens.next_cursor,
+        "prev": tokens.prev_cursor,
+    }
+
+
 @main.route('/corpus/<int:corpus_id>/tokens/correct')
 @login_required
 @requires_corpus_access("corpus_id")
@@ -59,7 +127,7 @@ def tokens_correct(corpus_id):
 
     :param corpus_id: Id of the corpus
     """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
 
     # Minimal config — no token data; Vue fetches via tokens_correct_data
     visible_cols = list(corpus.displayed_columns_by_name.keys())
@@ -82,37 +150,34 @@ def tokens_correct(corpus_id):
 @requires_corpus_access("corpus_id")
 def tokens_correct_data(corpus_id):
     """ JSON endpoint: paginated token data for the annotation table. """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
-    current_user.bookmark: Bookmark = corpus.get_bookmark(current_user)
+    context = corpus_context(corpus_id)
+    corpus = context.corpus
+    current_user.bookmark: Optional[Bookmark] = context.bookmark
 
-    tokens = corpus.get_tokens().paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), current_app.config["PAGINATION_DEFAULT_TOKENS"])
-    )
+    tokens = _paginate_tokens(corpus.get_tokens(), total=corpus.token_count)
 
     if "similar" in corpus.displayed_columns_by_name:
         WordToken.get_similar_for_batch(corpus, tokens.items)
 
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items, contiguous=True)
+    positions = corpus.get_positions(tokens.items)
 
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = getattr(tok, "similar", 0)
         d["similar_link"] = url_for(
             "main.tokens_similar_to_token", corpus_id=corpus.id, token_id=tok.id
         ) if d["similar"] else None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
 
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": current_user.bookmark.token_id if current_user.bookmark else None,
     })
 
@@ -126,7 +191,7 @@ def tokens_correct_unallowed(corpus_id, allowed_type):
     :param corpus_id: Id of the corpus
     :param allowed_type: Type of allowed value to check against (lemma, POS, morph)
     """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
     visible_cols = list(corpus.displayed_columns_by_name.keys())
     pyrrha_config = {
         "corpus_id": corpus.id,
@@ -148,27 +213,23 @@ def tokens_correct_unallowed(corpus_id, allowed_type):
 @requires_corpus_access("corpus_id")
 def tokens_correct_unallowed_data(corpus_id, allowed_type):
     """ JSON endpoint: paginated unallowed tokens for the annotation table. """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
-    tokens = corpus.get_unallowed(allowed_type).paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), current_app.config["PAGINATION_DEFAULT_TOKENS"])
-    )
+    corpus = Corpus.get_or_404(corpus_id)
+    tokens = _paginate_tokens(corpus.get_unallowed(allowed_type))
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items)
+    positions = corpus.get_positions(tokens.items)
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = 0
         d["similar_link"] = None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": None,
     })
 
@@ -178,7 +239,7 @@ def tokens_correct_unallowed_data(corpus_id, allowed_type):
 @login_required
 @requires_corpus_access("corpus_id")
 def tokens_similar_to_record(corpus_id, record_id):
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
     record = ChangeRecord.query.filter_by(**{"id": record_id}).first_or_404()
     visible_cols = list(corpus.displayed_columns_by_name.keys())
     pyrrha_config = {
@@ -198,6 +259,7 @@ def tokens_similar_to_record(corpus_id, record_id):
     return render_template_with_nav_info(
         'main/tokens_similar_to_record.html',
         corpus=corpus, record=record,
+        context=corpus.get_contexts([record.word_token])[record.word_token.id] if record.word_token else None,
         pyrrha_config=pyrrha_config
     )
 
@@ -206,28 +268,24 @@ def tokens_similar_to_record(corpus_id, record_id):
 @login_required
 @requires_corpus_access("corpus_id")
 def tokens_similar_to_record_data(corpus_id, record_id):
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
     record = ChangeRecord.query.filter_by(**{"id": record_id}).first_or_404()
-    tokens = WordToken.get_similar_to_record(change_record=record).paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), current_app.config["PAGINATION_DEFAULT_TOKENS"])
-    )
+    tokens = _paginate_tokens(WordToken.get_similar_to_record(change_record=record))
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items)
+    positions = corpus.get_positions(tokens.items)
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = 0
         d["similar_link"] = None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": None,
     })
 
@@ -237,12 +295,14 @@ def tokens_similar_to_record_data(corpus_id, record_id):
 @requires_corpus_access("corpus_id")
 def tokens_similar_to_token(corpus_id, token_id):
     mode = request.args.get("mode", "partial")
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
     token = WordToken.query.filter_by(**{"id": token_id, "corpus": corpus_id}).first_or_404()
     if request_wants_json():
         tokens = WordToken.get_nearly_similar_to(token, mode=mode)
         if request.args.get("hits", "false").lower() == "true":
-            return jsonify([tok.to_dict() for tok in tokens.all()])
+            tokens = tokens.all()
+            contexts = corpus.get_contexts(tokens)
+            return jsonify([tok.to_dict(context=contexts[tok.id]) for tok in tokens])
         return jsonify({"count": tokens.count()})
     visible_cols = list(corpus.displayed_columns_by_name.keys())
     pyrrha_config = {
@@ -256,6 +316,7 @@ def tokens_similar_to_token(corpus_id, token_id):
     return render_template_with_nav_info(
         'main/tokens_similar_to_token.html',
         corpus=corpus, mode=mode, token=token,
+        context=corpus.get_contexts([token])[token.id],
         pyrrha_config=pyrrha_config
     )
 
@@ -265,28 +326,24 @@ def tokens_similar_to_token(corpus_id, token_id):
 @requires_corpus_access("corpus_id")
 def tokens_similar_to_token_data(corpus_id, token_id):
     mode = request.args.get("mode", "partial")
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first()
+    corpus = Corpus.get_or_404(corpus_id)
     token = WordToken.query.filter_by(**{"id": token_id, "corpus": corpus_id}).first_or_404()
-    tokens = WordToken.get_nearly_similar_to(token, mode=mode).paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), current_app.config["PAGINATION_DEFAULT_TOKENS"])
-    )
+    tokens = _paginate_tokens(WordToken.get_nearly_similar_to(token, mode=mode))
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items)
+    positions = corpus.get_positions(tokens.items)
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = 0
         d["similar_link"] = None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": None,
     })
 
@@ -333,6 +390,30 @@ def tokens_correct_single(corpus_id, token_id):
         return response
 
 
+@main.route('/corpus/<int:corpus_id>/tokens/correct/batch', methods=["POST"])
+@login_required
+@requires_corpus_access("corpus_id")
+def tokens_correct_batch(corpus_id):
+    """ Edit many tokens at once. Expects a JSON list of {token_id, lemma, POS, morph, gloss} objects,
+    either as the body itself or under a "tokens" key.
+
+    :param corpus_id: Id of the corpus
+    """
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get("tokens")
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        response = jsonify({"status": False, "message": "A list of token corrections is expected"})
+        response.status_code = 400
+        return response
+
+    statuses = WordToken.update_many(user_id=current_user.id, corpus_id=corpus_id, corrections=data)
+    return jsonify({
+        "updated": len([status for status in statuses if status["status"]]),
+        "statuses": statuses
+    })
+
+
 @main.route('/corpus/<int:corpus_id>/tokens/similar/<int:record_id>/update', methods=["POST"])
 @login_required
 @requires_corpus_access("corpus_id")
@@ -342,10 +423,11 @@ def tokens_correct_from_record(corpus_id, record_id):
     :param corpus_id: Id of the record
     :param record_id: Id of the ChangeRecord
     """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first_or_404()
+    corpus = Corpus.get_or_404(corpus_id)
     record = ChangeRecord.query.filter_by(**{"id": record_id}).first_or_404()
     changed = record.apply_changes_to(user_id=current_user.id, token_ids=request.json.get("word_tokens"))
-    return jsonify([word_token.to_dict() for word_token in changed])
+    contexts = corpus.get_contexts(changed)
+    return jsonify([word_token.to_dict(context=contexts[word_token.id]) for word_token in changed])
 
 
 @main.route('/corpus/<int:corpus_id>/tokens/review/<int:token_id>', methods=["POST"])
@@ -367,6 +449,8 @@ def tokens_mark_review(corpus_id, token_id):
         needs_review = needs_review.lower() == 'true'
     else:
         needs_review = bool(needs_review)
+    if token.needs_review != needs_review:
+        CorpusStats.increment(corpus_id, needs_review=1 if needs_review else -1)
     token.needs_review = needs_review
     token.review_comment = string_to_none(data.get('review_comment')) if needs_review else None
     db.session.add(token)
@@ -382,7 +466,7 @@ def tokens_needs_review(corpus_id):
 
     :param corpus_id: Id of the corpus
     """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first_or_404()
+    corpus = Corpus.get_or_404(corpus_id)
     visible_cols = list(corpus.displayed_columns_by_name.keys())
     pyrrha_config = {
         "corpus_id": corpus.id,
@@ -404,27 +488,25 @@ def tokens_needs_review(corpus_id):
 @requires_corpus_access("corpus_id")
 def tokens_needs_review_data(corpus_id):
     """ JSON endpoint: paginated tokens flagged for review. """
-    corpus = Corpus.query.filter_by(**{"id": corpus_id}).first_or_404()
-    tokens = corpus.get_needs_review().paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), current_app.config["PAGINATION_DEFAULT_TOKENS"])
+    corpus = Corpus.get_or_404(corpus_id)
+    tokens = _paginate_tokens(
+        corpus.get_needs_review(), total=CorpusStats.for_corpus(corpus).needs_review
     )
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items)
+    positions = corpus.get_positions(tokens.items)
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = 0
         d["similar_link"] = None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": None,
     })
 
@@ -476,51 +558,16 @@ def tokens_export(corpus_id):
                     "Content-Disposition": 'attachment; filename="{}.tsv"'.format(filename)
                 }
             )
-    elif format == "standoff-tei":
-        tokens = corpus.get_tokens().all()
-        base = tokens[0].id - 1
-        return Response(
-            stream_with_context(stream_template(
-                "tei/standoff.xml",
-                base=base,
-                tokens=tokens,
-                allowed_columns=allowed_columns,
-                delimiter=corpus.delimiter_token
-            )),
-            status=200,
-            headers={"Content-Disposition": 'attachment; filename="{}-standoff.xml"'.format(filename)},
-            mimetype="text/xml"
-        )
-    elif format == "tei-geste":
-        tokens = corpus.get_tokens().all()
-        base = tokens[0].id - 1
-        return Response(
-            stream_with_context(stream_template(
-                "tei/geste.xml",
-                base=base,
-                tokens=tokens,
-                allowed_columns=allowed_columns,
-                history=TokenHistory.query.filter_by(corpus=corpus_id).options(selectinload(TokenHistory.user)).all(),
-                delimiter=corpus.delimiter_token
-            )),
-            status=200,
-            headers={"Content-Disposition": 'attachment; filename="{}.xml"'.format(filename)},
-            mimetype="text/xml"
-        )
-    elif format == "tei-msd":
-        tokens = corpus.get_tokens().all()
-        base = tokens[0].id - 1
+    elif format in TEI_EXPORTS:
+        if request.args.get("background"):
+            # Written to a file by a job, downloaded from its progress URL once it is over
+            job = Job.enqueue("corpus.export", user_id=current_user.id, corpus_id=corpus_id, format=format)
+            return jsonify(job_json(job)), 202
+        template, filename, context = tei_export(corpus, format)
         return Response(
-            stream_with_context(stream_template(
-                "tei/TEI.xml",
-                base=base,
-                tokens=tokens,
-                allowed_columns=allowed_columns,
-                history=TokenHistory.query.filter_by(corpus=corpus_id).options(selectinload(TokenHistory.user)).all(),
-                delimiter=corpus.delimiter_token
-            )),
+            stream_with_context(stream_template(template, **context)),
             status=200,
-            headers={"Content-Disposition": 'attachment; filename="{}.xml"'.format(filename)},
+            headers={"Content-Disposition": 'attachment; filename="{}"'.format(filename)},
             mimetype="text/xml"
         )
     return render_template_with_nav_info(
@@ -546,7 +593,11 @@ def tokens_history(corpus_id):
     """
     corpus = Corpus.get_or_404(corpus_id)
     tokens = corpus.get_history(page=int_or(request.args.get("page"), 1), limit=int_or(request.args.get("limit"), 20))
-    return render_template_with_nav_info('main/tokens_history.html', corpus=corpus, tokens=tokens)
+    word_tokens = [record.word_token for record in tokens.items if record.word_token]
+    positions = corpus.get_positions(word_tokens)
+    contexts = corpus.get_contexts(word_tokens)
+    return render_template_with_nav_info('main/tokens_history.html', corpus=corpus, tokens=tokens,
+                                         positions=positions, contexts=contexts)
 
 
 @main.route('/corpus/<int:corpus_id>/tokens/history/download')
@@ -572,33 +623,30 @@ def tokens_history_download(corpus_id):
         writer.writeheader()
         yield output.getvalue()
 
-        records = (
+        records = iter(
             ChangeRecord.query
             .filter_by(corpus=corpus_id)
             .order_by(ChangeRecord.created_on.desc())
             .options(selectinload(ChangeRecord.word_token), selectinload(ChangeRecord.user))
             .yield_per(500)
         )
-        for record in records:
+        # Contexts are read once per chunk of records
+        for chunk in iter(lambda: list(islice(records, 500)), []):
+            contexts = corpus.get_contexts([record.word_token for record in chunk if record.word_token])
             output = StringIO()
             writer = DictWriter(output, fieldnames=fieldnames, **TSV_CONFIG)
-            ctx = ""
-            if record.word_token:
-                ctx = "{} {} {}".format(
-                    record.word_token.left_context or "",
-                    record.word_token.form,
-                    record.word_token.right_context or ""
-                ).strip()
-            row = {
-                "user": "{}.{}".format(record.user.first_name[0], record.user.last_name),
-                "edit": record.created_on.isoformat(),
-                "context": ctx,
-            }
-            for col in ("lemma", "POS", "morph", "gloss"):
-                if col in visible:
-                    row[col + "_old"] = getattr(record, col) or ""
-                    row[col + "_new"] = getattr(record, col + "_new") or ""
-            writer.writerow(row)
+            for record in chunk:
+                row = {
+                    "user": "{}.{}".format(record.user.first_name[0], record.user.last_name),
+                    "edit": record.created_on.isoformat(),
+                    "context": record.word_token.format_context(contexts[record.word_token.id])
+                    if record.word_token else "",
+                }
+                for col in ("lemma", "POS", "morph", "gloss"):
+                    if col in visible:
+                        row[col + "_old"] = getattr(record, col) or ""
+                        row[col + "_new"] = getattr(record, col + "_new") or ""
+                writer.writerow(row)
             yield output.getvalue()
 
     return Response(
@@ -670,40 +718,38 @@ def tokens_search_data(corpus_id):
 
     token_dict = _search_token_dict(request.args)
     if not token_dict:
-        return jsonify({"tokens": [], "page": 1, "pages": 0, "total": 0, "per_page": 100, "bookmark_token_id": None})
+        return jsonify({"tokens": [], "page": 1, "pages": 0, "total": 0, "per_page": 100, "next": None, "prev": None,
+                        "bookmark_token_id": None})
 
+    desc = int(request.args.get("desc", "0"))
     tokens_q, _, _ = corpus.token_search(
         token_dict=token_dict,
         case_sensitive='caseBox' not in request.args,
-        desc=int(request.args.get("desc", "0"))
-    )
-    tokens = tokens_q.paginate(
-        page=int_or(request.args.get("page"), 1),
-        per_page=int_or(request.args.get("limit"), 100)
+        desc=desc
     )
+    tokens = _paginate_tokens(tokens_q, default_limit=100, descending=bool(desc))
 
     if "similar" in corpus.displayed_columns_by_name:
         WordToken.get_similar_for_batch(corpus, tokens.items)
 
     changed = corpus.changed(tokens.items)
+    contexts = corpus.get_contexts(tokens.items)
+    positions = corpus.get_positions(tokens.items)
     tokens_data = []
     for tok in tokens.items:
-        d = tok.to_dict()
+        d = tok.to_dict(context=contexts[tok.id])
         d["changed"] = tok.id in changed
         d["similar"] = getattr(tok, "similar", 0)
         d["similar_link"] = url_for(
             "main.tokens_similar_to_token", corpus_id=corpus.id, token_id=tok.id
         ) if d["similar"] else None
-        d["left_context"] = tok.left_context or ""
-        d["right_context"] = tok.right_context or ""
+        d["left_context"], d["right_context"] = contexts[tok.id]
+        d["position"] = positions[tok.id]
         tokens_data.append(d)
 
     return jsonify({
         "tokens": tokens_data,
-        "page": tokens.page,
-        "pages": tokens.pages,
-        "total": tokens.total,
-        "per_page": tokens.per_page,
+        **_page_json(tokens),
         "bookmark_token_id": None,
     })
 
@@ -719,14 +765,16 @@ def tokens_edit_form(corpus_id, token_id):
     """
     corpus = Corpus.get_or_404(corpus_id)
     token = WordToken.query.filter_by(**{"corpus": corpus_id, "id": token_id}).first_or_404()
-    page = math.floor(token.order_id / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
-    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(token.order_id)
+    position = token.position
+    page = math.floor(position / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
+    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(position)
     if request.method == "POST" and request.form.get("form"):
         token.edit_form(request.form.get("form"), corpus=corpus, user=current_user)
         flash("The form has been updated.", category="success")
         return redirect(go_back_url)
     return render_template_with_nav_info(
         "main/tokens_edit_form.html", corpus=corpus, token=token,
+        context=corpus.get_contexts([token])[token.id],
         go_back=go_back_url
     )
 
@@ -743,8 +791,9 @@ def tokens_del_row(corpus_id, token_id):
     """
     corpus = Corpus.get_or_404(corpus_id)
     token = WordToken.query.filter_by(**{"corpus": corpus_id, "id": token_id}).first_or_404()
-    page = math.floor(token.order_id / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
-    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(token.order_id)
+    position = token.position
+    page = math.floor(position / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
+    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(position)
 
     if request.method == "POST":
         if request.form.get("form") == token.form:
@@ -756,6 +805,7 @@ def tokens_del_row(corpus_id, token_id):
 
     return render_template_with_nav_info(
         "main/tokens_del_row.html", corpus=corpus, token=token,
+        context=corpus.get_contexts([token])[token.id],
         go_back=go_back_url
     )
 
@@ -772,16 +822,23 @@ def tokens_add_row(corpus_id, token_id):
     """
     corpus = Corpus.get_or_404(corpus_id)
     token = WordToken.query.filter_by(**{"corpus": corpus_id, "id": token_id}).first_or_404()
-    page = math.floor(token.order_id / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
-    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(token.order_id)
+    position = token.position
+    page = math.floor(position / current_app.config["PAGINATION_DEFAULT_TOKENS"]) + 1
+    go_back_url = url_for(".tokens_correct", corpus_id=corpus_id, page=page) + "#tok" + str(position)
 
     if request.method == "POST" and request.form.get("form"):
-        token.add_form(request.form.get("form"), corpus=corpus, user=current_user)
+        try:
+            token.add_form(request.form.get("form"), corpus=corpus, user=current_user)
+        except WordToken.RenumberingPending as error:
+            db.session.rollback()
+            flash(str(error), category="error")
+            return redirect(url_for(".tokens_add_row", corpus_id=corpus_id, token_id=token_id))
         flash("The form has been updated.", category="success")
         return redirect(go_back_url)
 
     return render_template_with_nav_info(
         "main/tokens_add_row.html", corpus=corpus, token=token,
+        context=corpus.get_contexts([token])[token.id],
         go_back=go_back_url
     )
 
@@ -1,9 +1,57 @@
-from flask import render_template, request, abort, flash
+import time
+from flask import render_template, request, abort, flash, g, current_app
 from flask_login import current_user
 from functools import wraps
+from typing import List, NamedTuple, Optional
 
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload
 
-from ...models import Corpus, ControlLists
+from .. import main
+from ... import db
+from ...models import Corpus, CorpusUser, ControlLists, ControlListsUser, Bookmark, Favorite
+from ...utils.cache import LRUCache
+
+
+class CorpusContext(NamedTuple):
+    """ Corpus of the current request with the rights and the bookmark of the current user """
+    corpus: Corpus
+    is_member: bool
+    is_owner: bool
+    bookmark: Optional[Bookmark]
+
+    @property
+    def has_access(self) -> bool:
+        return self.is_member or current_user.is_admin()
+
+
+@main.before_app_request
+def _reset_corpus_contexts():
+    # The application context, hence g, can outlive a request, eg. in tests
+    g.pop("corpus_contexts", None)
+
+
+def corpus_context(corpus_id: int) -> Optional[CorpusContext]:
+    """ Load, once per request and with a single query, a corpus with its columns and control list, and the
+    membership, ownership and bookmark of the current user. Decorators and views share the result, and further
+    Corpus.get_or_404(corpus_id) calls are served by the identity map of the session.
+
+    :param corpus_id: ID of the corpus
+    :returns: Context, or None when the corpus does not exist
+    """
+    contexts = g.setdefault("corpus_contexts", {})
+    if corpus_id not in contexts:
+        row = db.session.query(Corpus, CorpusUser.user_id, CorpusUser.is_owner, Bookmark).outerjoin(
+            CorpusUser, db.and_(CorpusUser.corpus_id == Corpus.id, CorpusUser.user_id == current_user.id)
+        ).outerjoin(
+            Bookmark, db.and_(Bookmark.corpus_id == Corpus.id, Bookmark.user_id == current_user.id)
+        ).options(
+            joinedload(Corpus.columns), joinedload(Corpus.control_lists)
+        ).filter(Corpus.id == corpus_id).first()
+        contexts[corpus_id] = None if row is None else CorpusContext(
+            corpus=row[0], is_member=row[1] is not None, is_owner=bool(row[2]), bookmark=row[3]
+        )
+    return contexts[corpus_id]
 
 
 def requires_corpus_access(corpus_id_key):
@@ -15,7 +63,9 @@ def requires_corpus_access(corpus_id_key):
     def wrapper(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            if not Corpus.static_has_access(request.view_args[corpus_id_key], current_user):
+            context = corpus_context(request.view_args[corpus_id_key])
+            # Administrators reach the view, which answers 404 for unknown corpora
+            if not current_user.is_admin() and (context is None or not context.has_access):
                 return abort(403)
             return f(*args, **kwargs)
         return wrapped
@@ -31,9 +81,10 @@ def requires_corpus_admin_access(corpus_id_key):
     def wrapper(f):
         @wraps(f)
         def wrapped(*args, **kwargs):
-            if not Corpus.get_or_404(request.view_args[corpus_id_key]).is_owned_by(
-                    current_user
-            ) and not current_user.is_admin():
+            context = corpus_context(request.view_args[corpus_id_key])
+            if context is None:
+                return abort(404)
+            if not context.is_owner and not current_user.is_admin():
                 flash("You have not admin access to this corpus.")
                 return abort(403)
             return f(*args, **kwargs)
@@ -41,6 +92,57 @@ def requires_corpus_admin_access(corpus_id_key):
     return wrapper
 
 
+class NavItem(NamedTuple):
+    """ Corpus or control list linked in the navigation bar """
+    id: int
+    name: str
+
+
+class NavInfo(NamedTuple):
+    favorites: List[NavItem]
+    control_lists: List[NavItem]
+
+
+#: Favorite corpora and control lists of users, keyed by user id, with the time they were read at. Entries are
+#: dropped when the session of this process flushes a change to them, and expire after NAV_CACHE_TTL seconds
+#: for changes made by other processes.
+NAV_CACHE = LRUCache(maxsize=1024)
+
+
+def nav_info(user) -> NavInfo:
+    """ Favorite corpora and control lists shown in the navigation bar of user
+
+    :param user: Current user
+    """
+    ttl = current_app.config.get("NAV_CACHE_TTL", 0)
+    cached = NAV_CACHE.get(user.id) if ttl else None
+    if cached is not None and time.monotonic() - cached[0] < ttl:
+        return cached[1]
+    info = NavInfo(
+        favorites=[NavItem(corpus.id, corpus.name) for corpus in Corpus.fav_for_user(user)],
+        control_lists=[NavItem(control_list.id, control_list.name)
+                       for control_list in ControlLists.for_user(user)]
+    )
+    if ttl and user.id is not None:
+        NAV_CACHE.set(user.id, (time.monotonic(), info))
+    return info
+
+
+@event.listens_for(Session, "after_flush")
+def _invalidate_nav_info(session, flush_context):
+    """ Drop the navigation data of the users whose favorites, corpora or control lists changed """
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(instance, (Favorite, CorpusUser, ControlListsUser)):
+            NAV_CACHE.pop(instance.user_id)
+        elif isinstance(instance, (Corpus, ControlLists)) and (
+                instance in session.deleted
+                or (instance in session.dirty and inspect(instance).attrs.name.history.has_changes())
+        ):
+            # Every user may show it
+            NAV_CACHE.clear()
+            return
+
+
 def render_template_with_nav_info(template, **kwargs):
     """ Render the template and adds information about available corpora
 
@@ -48,14 +150,8 @@ def render_template_with_nav_info(template, **kwargs):
     :param kwargs: Additional arguments for the template
     :return:
     """
-    kwargs.update(dict(
-        favorites=[corpus for corpus in Corpus.fav_for_user(current_user)]
-    ))
-    kwargs.update(dict(
-        control_lists=[
-            control_list for control_list in ControlLists.for_user(current_user)
-        ]
-    ))
+    nav = nav_info(current_user)
+    kwargs.update(dict(favorites=nav.favorites, control_lists=nav.control_lists))
     kwargs["resizedLeftMenu"] = request.cookies.get('resized-menu')
     return render_template(template, **kwargs)
 
@@ -1,4 +1,6 @@
 from .corpus import WordToken, ChangeRecord, Corpus, CorpusUser, TokenHistory, Bookmark, Favorite, Column, \
-    CorpusCustomDictionary
+    CorpusCustomDictionary, CorpusStats, TokenOrderShift, SimilarCount
 from .user import User, AnonymousUser, Permission, Role
-from .control_lists import AllowedLemma, AllowedMorph, AllowedPOS, ControlListsUser, ControlLists, PublicationStatus
+from .control_lists import AllowedLemma, AllowedMorph, AllowedPOS, ControlListsUser, ControlLists, PublicationStatus, \
+    AllowedValuesChange
+from .jobs import Job
@@ -2,14 +2,12 @@
 import datetime
 import csv
 import enum
-import os.path
 import io
-import glob
 from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
 # PIP Packages
 import unidecode
 import regex as re
-import yaml
 from flask_sqlalchemy.query import Query as FlaskQuery
 from sqlalchemy.ext.associationproxy import association_proxy
 from sqlalchemy.orm import backref, Query, column_property
@@ -18,14 +16,40 @@ from werkzeug.exceptions import BadRequest
 # APP Logic
 from .. import db
 from ..utils import PyrrhaError
-from ..utils.forms import prepare_search_string, column_search_filter, read_input_POS, read_input_morph, \
-    read_input_lemma
+from ..utils.bulk import bulk_insert
+from ..utils.packs import load_pack, pack_directories
+from ..utils.forms import prepare_search_string, column_search_filter
 # Models
 from .user import User
 # Session
 from flask_login import current_user
 from flask import abort
-from typing import Optional
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+
+class AllowedValuesChange(NamedTuple):
+    """ Difference applied to the allowed values of a type by :meth:`ControlLists.update_allowed_values`
+
+    :ivar allowed_type: Type of the values (lemma, POS or morph)
+    :ivar added: Labels inserted
+    :ivar removed: Labels deleted
+    :ivar updated: Labels kept whose readable form changed (morph only)
+    :ivar previous_version: Version of the control list before the change
+    :ivar version: Version of the control list after the change
+    """
+    allowed_type: str
+    added: List[str]
+    removed: List[str]
+    updated: List[str]
+    previous_version: int
+    version: int
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.added or self.removed or self.updated)
+
+    def to_dict(self) -> Dict[str, int]:
+        return {"added": len(self.added), "removed": len(self.removed), "updated": len(self.updated)}
 
 
 class PublicationStatus(enum.Enum):
@@ -50,19 +74,22 @@ class ControlLists(db.Model):
     filter_numeral = db.Column(db.Boolean, unique=False, default=False)
     filter_metadata = db.Column(db.Boolean, unique=False, default=False)
     filter_ignore = db.Column(db.Boolean, unique=False, default=False)
+    # Incremented whenever allowed values or filters change, used to invalidate in-process caches
+    version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Language pack the list was loaded from and checksum of its sources, see app.utils.packs
+    pack = db.Column(db.String(64), nullable=True, unique=True, index=True)
+    pack_checksum = db.Column(db.String(64), nullable=True)
 
     re_filter_metadata = r'(\[[^\]]+:[^\]]*\]$)'
     re_filter_ignore = r'(^\[IGNORE\])'
     re_filter_punct = r"(^[^\w\s]+$)"
     re_filter_numeral = r'(^\d+$)'
 
-    # For caching purposes, we record the last time these fields were edited
-    #last_lemma_edit = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    #last_morph_edit = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    #last_POS_edit = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
     users = association_proxy('control_lists_user', 'user')
 
+    #: Functions called with the control list and the AllowedValuesChange after allowed values were updated
+    ALLOWED_VALUES_HOOKS: List[Callable[["ControlLists", AllowedValuesChange], None]] = []
+
     _sort_logic = column_property(
         case(
             (public == PublicationStatus.public, -1),
@@ -78,6 +105,16 @@ class ControlLists(db.Model):
             abort(404, description=description)
         return rv
 
+    @staticmethod
+    def bump_version(control_list_id: int):
+        """ Mark the allowed values of a control list as changed
+
+        :param control_list_id: ID of the control list
+        """
+        ControlLists.query.filter(ControlLists.id == control_list_id).update(
+            {ControlLists.version: ControlLists.version + 1}
+        )
+
     @property
     def str_public(self):
         return self.public.name
@@ -222,12 +259,22 @@ class ControlLists(db.Model):
             ).exists()
         ).scalar()
 
-    def update_allowed_values(self, allowed_type, allowed_values):
-        """ Update allowed values of the current corpus
+    @staticmethod
+    def on_allowed_values_change(hook: Callable[["ControlLists", AllowedValuesChange], None]):
+        """ Register a function to call, in the same transaction, after the allowed values of a control list
+        were updated by :meth:`update_allowed_values`
+        """
+        ControlLists.ALLOWED_VALUES_HOOKS.append(hook)
+        return hook
+
+    def update_allowed_values(self, allowed_type, allowed_values, _commit: bool = True) -> AllowedValuesChange:
+        """ Replace the allowed values of a type by new ones. Only the difference with the current values
+        is written: missing labels are deleted, new ones inserted, and the readable form of kept morph updated.
 
         :param allowed_type: Allowed Value Type (lemma, morph, POS)
-        :param allowed_values: New values
-        :return: Bool of success
+        :param allowed_values: New values, labels for lemma and POS, dict with label and readable keys for morph
+        :param _commit: Autocommit
+        :return: Changes applied
         """
         if allowed_type == "lemma":
             cls = AllowedLemma
@@ -239,10 +286,61 @@ class ControlLists(db.Model):
             raise BadRequest("The type is not of lemma, morph or POS")
 
         try:
-            data = db.session.query(cls).filter_by(control_list=self.id).delete()
-            cls.add_batch(allowed_values, self.id, _commit=True)
-        except Exception as E:
-            print(E)
+            if allowed_type == "lemma" and len(allowed_values) != len(set(allowed_values)):
+                raise PyrrhaError("Following values are duplicated: " + ", ".join(
+                    [lemma for lemma, cnt in Counter(allowed_values).items() if cnt > 1]
+                ))
+            if allowed_type == "morph":
+                new = {item["label"]: item.get("readable", item["label"]) for item in allowed_values}
+                current = {
+                    label: (id_, readable)
+                    for id_, label, readable in db.session.query(cls.id, cls.label, cls.readable).filter(
+                        cls.control_list == self.id
+                    )
+                }
+            else:
+                new = dict.fromkeys(allowed_values)
+                current = {
+                    label: (id_, None)
+                    for id_, label in db.session.query(cls.id, cls.label).filter(cls.control_list == self.id)
+                }
+
+            added = [label for label in new if label not in current]
+            removed = [label for label in current if label not in new]
+            updated = [
+                label for label in new
+                if allowed_type == "morph" and label in current and current[label][1] != new[label]
+            ]
+            previous_version = db.session.query(ControlLists.version).filter(ControlLists.id == self.id).scalar()
+            if not (added or removed or updated):
+                return AllowedValuesChange(allowed_type, [], [], [], previous_version, previous_version)
+
+            removed_ids = [current[label][0] for label in removed]
+            for start in range(0, len(removed_ids), 500):
+                cls.query.filter(cls.id.in_(removed_ids[start:start+500])).delete(synchronize_session=False)
+            if updated:
+                db.session.bulk_update_mappings(cls, [
+                    {"id": current[label][0], "readable": new[label]} for label in updated
+                ])
+            if added:
+                cls.add_batch(
+                    [{"label": label, "readable": new[label]} for label in added]
+                    if allowed_type == "morph" else added,
+                    self.id
+                )
+            else:
+                ControlLists.bump_version(self.id)
+
+            change = AllowedValuesChange(
+                allowed_type, added, removed, updated, previous_version,
+                db.session.query(ControlLists.version).filter(ControlLists.id == self.id).scalar()
+            )
+            for hook in ControlLists.ALLOWED_VALUES_HOOKS:
+                hook(self, change)
+            if _commit:
+                db.session.commit()
+            return change
+        except Exception:
             db.session.rollback()
             raise
 
@@ -267,34 +365,83 @@ class ControlLists(db.Model):
 
 
     @staticmethod
-    def add_default_lists(path=None):
-        """ Loads the default lists from the config folder
-
+    def add_default_lists(path: Optional[str] = None, jobs: Optional[int] = None) -> Dict[str, str]:
+        """ Loads the default lists from the compiled language packs of the config folder, in a single transaction.
+        Packs are read in parallel, lists loaded from a pack whose checksum did not change are skipped and those
+        loaded from a pack which changed since are updated.
+
+        :param path: Glob pattern of the pack folders (Defaults to the shipped packs)
+        :param jobs: Number of packs read at the same time
+        :return: Status of each pack, by name: created, updated, unchanged or linked (for a list loaded before
+            lists recorded their pack, found by name and left as it is)
         """
-        if not path:
-            current = os.path.dirname(os.path.abspath(__file__))
-            path = os.path.join(current, "..", "configurations", "langs", "**")
-
-        for directory in glob.glob(path):
-            with open(os.path.join(directory, "metadata.yaml")) as f:
-                data = yaml.safe_load(f)
-            print("[ControlLists] Adding %s " % data["name"])
-            cl = ControlLists(**data, public=PublicationStatus.public)
-            db.session.add(cl)
-            db.session.flush()  # Get the AutoIncrement ID
-            configs = [
-                ("lemma.txt", AllowedLemma, read_input_lemma),
-                ("POS.txt", AllowedPOS, read_input_POS),
-                ("morph.txt", AllowedMorph, read_input_morph)
-            ]
-            for file, model, parser in configs:
-                filepath = os.path.join(directory, file)
-                if os.path.exists(filepath):
-                    with open(filepath, encoding='utf-8') as f:
-                        model.add_batch(parser(f.read()), control_lists_id=cl.id)
-
-                    print("[ControlLists] [%s] Loading %s " % (data["name"], os.path.basename(filepath)))
-            db.session.commit()
+        directories = pack_directories(path)
+        if not directories:
+            return {}
+        with ThreadPoolExecutor(max_workers=jobs or min(4, len(directories))) as pool:
+            packs = list(pool.map(load_pack, directories))
+
+        loaded = {
+            control_list.pack: control_list
+            for control_list in ControlLists.query.filter(ControlLists.pack.in_([pack.name for pack in packs]))
+        }
+        # Lists loaded before they recorded their pack are found by name, the oldest one first
+        unlinked = {}
+        for control_list in ControlLists.query.filter(
+                ControlLists.pack.is_(None),
+                ControlLists.public == PublicationStatus.public,
+                ControlLists.name.in_([pack.metadata["name"] for pack in packs])
+        ).order_by(ControlLists.id):
+            unlinked.setdefault(control_list.name, control_list)
+
+        status = {}
+        for pack in packs:
+            cl = loaded.get(pack.name)
+            if cl is None and pack.metadata["name"] in unlinked:
+                cl = unlinked.pop(pack.metadata["name"])
+                cl.pack = pack.name
+            if cl is not None and cl.pack_checksum is None:
+                # The content of lists loaded before checksums were recorded is unknown: they are left as they
+                # are, and only updated once their pack changes
+                print("[ControlLists] Linking %s to its pack" % pack.metadata["name"])
+                cl.pack_checksum = pack.checksum
+                status[pack.name] = "linked"
+                continue
+            if cl is not None and cl.pack_checksum == pack.checksum:
+                print("[ControlLists] %s is up to date" % pack.metadata["name"])
+                status[pack.name] = "unchanged"
+                continue
+
+            if cl is None:
+                print("[ControlLists] Adding %s " % pack.metadata["name"])
+                cl = ControlLists(**pack.metadata, public=PublicationStatus.public, pack=pack.name)
+                db.session.add(cl)
+                db.session.flush()  # Get the AutoIncrement ID
+                connection = db.session.connection()
+                bulk_insert(connection, AllowedLemma.__table__, ("label", "label_uniform", "control_list"), (
+                    (label, uniform, cl.id) for label, uniform in pack.lemma
+                ))
+                bulk_insert(connection, AllowedPOS.__table__, ("label", "control_list"), (
+                    (label, cl.id) for label, in pack.POS
+                ))
+                bulk_insert(connection, AllowedMorph.__table__, ("label", "readable", "control_list"), (
+                    (label, readable, cl.id) for label, readable in pack.morph
+                ))
+                ControlLists.bump_version(cl.id)
+                status[pack.name] = "created"
+            else:
+                print("[ControlLists] Updating %s " % pack.metadata["name"])
+                for key, value in pack.metadata.items():
+                    setattr(cl, key, value)
+                cl.update_allowed_values("lemma", [label for label, _ in pack.lemma], _commit=False)
+                cl.update_allowed_values("POS", [label for label, in pack.POS], _commit=False)
+                cl.update_allowed_values("morph", [
+                    {"label": label, "readable": readable} for label, readable in pack.morph
+                ], _commit=False)
+                status[pack.name] = "updated"
+            cl.pack_checksum = pack.checksum
+        db.session.commit()
+        return status
 
 
 class ControlListsUser(db.Model):
@@ -320,6 +467,20 @@ class ControlListsUser(db.Model):
             cls.control_lists_id == control_list_id
         ))
 
+def _write_labels(query: Query, file, separator: str, chunk_size: int) -> int:
+    """ Write the labels selected by a query to a file, separated by separator
+
+    :return: Number of labels written
+    """
+    count = 0
+    for (label, ) in query.yield_per(chunk_size):
+        if count:
+            file.write(separator)
+        file.write(label)
+        count += 1
+    return count
+
+
 class AllowedLemma(db.Model):
     """ An allowed lemma is a lemma that is accepted
 
@@ -367,6 +528,7 @@ class AllowedLemma(db.Model):
                 for item in allowed_values
             ]
         )
+        ControlLists.bump_version(control_lists_id)
         if _commit:
             db.session.commit()
 
@@ -380,12 +542,23 @@ class AllowedLemma(db.Model):
         :type query: AllowedLemma.query
         :return: String representation of the data
         """
-        return "\n".join(
-            [
-                allowed.label
-                for allowed in query.order_by(AllowedLemma.id).all()
-            ]
-        )
+        output = io.StringIO()
+        AllowedLemma.write_input_format(query, output)
+        return output.getvalue()
+
+    @staticmethod
+    def write_input_format(query, file, chunk_size: int = 5000) -> int:
+        """ Writes query results in the input format to a file as they are read
+
+        .. note:: OrderBy is done inside the function
+
+        :param query: Query on AllowedLemma
+        :param file: Text file to write to
+        :param chunk_size: Number of rows fetched at once
+        :return: Number of values written
+        """
+        return _write_labels(query.with_entities(AllowedLemma.label).order_by(AllowedLemma.id), file, "\n",
+                             chunk_size)
 
 
 class AllowedPOS(db.Model):
@@ -414,6 +587,7 @@ class AllowedPOS(db.Model):
                 for item in allowed_values
             ]
         )
+        ControlLists.bump_version(control_lists_id)
         if _commit:
             db.session.commit()
 
@@ -427,12 +601,22 @@ class AllowedPOS(db.Model):
         :type query: AllowedPOS.query
         :return: String representation of the data
         """
-        return ",".join(
-            [
-                allowed.label
-                for allowed in query.order_by(AllowedPOS.id).all()
-            ]
-        )
+        output = io.StringIO()
+        AllowedPOS.write_input_format(query, output)
+        return output.getvalue()
+
+    @staticmethod
+    def write_input_format(query, file, chunk_size: int = 5000) -> int:
+        """ Writes query results in the input format to a file as they are read
+
+        .. note:: OrderBy is done inside the function
+
+        :param query: Query on AllowedPOS
+        :param file: Text file to write to
+        :param chunk_size: Number of rows fetched at once
+        :return: Number of values written
+        """
+        return _write_labels(query.with_entities(AllowedPOS.label).order_by(AllowedPOS.id), file, ",", chunk_size)
 
 
 class AllowedMorph(db.Model):
@@ -467,6 +651,7 @@ class AllowedMorph(db.Model):
                 for item in allowed_values
             ]
         )
+        ControlLists.bump_version(control_lists_id)
         if _commit:
             db.session.commit()
 
@@ -481,9 +666,25 @@ class AllowedMorph(db.Model):
         :return: String representation of the data
         """
         csv_file = io.StringIO()
-        writer = csv.writer(csv_file, dialect="excel-tab")
-        writer.writerow(["label", "readable"])
-        for morph in query.order_by(AllowedMorph.id).all():
-            writer.writerow([morph.label, morph.readable])
-
+        AllowedMorph.write_input_format(query, csv_file)
         return csv_file.getvalue()
+
+    @staticmethod
+    def write_input_format(query, file, chunk_size: int = 5000) -> int:
+        """ Writes query results in the input format to a file as they are read
+
+        .. note:: OrderBy is done inside the function
+
+        :param query: Query on AllowedMorph
+        :param file: Text file to write to
+        :param chunk_size: Number of rows fetched at once
+        :return: Number of values written
+        """
+        writer = csv.writer(file, dialect="excel-tab")
+        writer.writerow(["label", "readable"])
+        count = 0
+        rows = query.with_entities(AllowedMorph.label, AllowedMorph.readable).order_by(AllowedMorph.id)
+        for label, readable in rows.yield_per(chunk_size):
+            writer.writerow([label, readable])
+            count += 1
+        return count
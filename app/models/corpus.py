@@ -3,15 +3,17 @@ import csv
 import io
 import enum
 from datetime import datetime
-from typing import Iterable, Optional, Dict, List, Tuple
-from itertools import product
+from typing import Callable, Iterable, Iterator, Optional, Dict, List, Tuple
+from itertools import chain, accumulate, combinations
+from operator import itemgetter
+from bisect import bisect_left, bisect_right
 # PIP Packages
 import unidecode
 import sqlalchemy.exc
-import regex as re
 from sqlalchemy.ext.associationproxy import association_proxy
-from sqlalchemy.orm import backref, aliased
-from sqlalchemy import func, literal, not_, or_, and_
+from sqlalchemy.orm import backref, selectinload
+from sqlalchemy import func, literal, literal_column, not_, and_, case
+from sqlalchemy.dialects import postgresql
 from werkzeug.exceptions import BadRequest
 from flask import url_for, abort
 
@@ -19,13 +21,19 @@ from flask import url_for, abort
 from app import db
 from app.utils import validate_length
 from app.utils.tsv import TSV_CONFIG
+from app.utils.keyset import KeysetStream, iter_keyset
+from app.utils.contexts import sliding_contexts
+from app.utils.bulk import bulk_insert
+from app.utils.fragment_index import FragmentIndex
 from app.errors import MissingTokenColumnValue, NoTokensInput
-from app.utils import PreferencesUpdateError
-from app.utils.forms import strip_or_none, column_search_filter, prepare_search_string
+from app.utils import PreferencesUpdateError, PyrrhaError
+from app.utils.forms import strip_or_none, column_search_alternatives, prepare_search_string
 
 # Models
 from .user import User
 from .control_lists import ControlLists, ControlListsUser, AllowedPOS, AllowedMorph, AllowedLemma, PublicationStatus
+from .validation import TokenValidator, AllowedValues, CUSTOM_DICTIONARIES_CACHE, AUTOCOMPLETE_CACHE
+from .jobs import Job
 
 
 from collections import namedtuple
@@ -88,6 +96,18 @@ class Corpus(db.Model):
     delimiter_token = db.Column(db.String(12), default=None)
     status = db.Column(db.Enum('pending', 'active', name='corpus_status'), nullable=False, default='active')
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    token_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    custom_dictionary_version = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    # Contexts are stored on each token, otherwise they are computed when tokens are read
+    store_context = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    # Number of tokens whose context was updated by the running context update, None when there is none
+    context_update_progress = db.Column(db.Integer, nullable=True)
+    # Spacing of the order ids given at the last renumbering, see WordToken.ORDER_ID_GAP
+    order_id_gap = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Whether the SimilarCount rows of the corpus are up to date, they are rebuilt on read otherwise
+    similar_counts_ready = db.Column(db.Boolean, nullable=False, default=False, server_default='0')
+    # Key of the allowed values the validity flags of the tokens were computed for, see Corpus.validity_key()
+    validity_version = db.Column(db.String(64), nullable=True)
 
     control_lists = db.relationship("ControlLists")
     word_token_history = db.relationship('TokenHistory', lazy='select', cascade="all, delete-orphan", passive_deletes=True)
@@ -183,60 +203,17 @@ class Corpus(db.Model):
 
     @property
     def statistics(self) -> CorpusStatistics:
-        """ Returns some nice statistics on the dashboard
+        """ Returns some nice statistics on the dashboard, read from the materialized corpus_stats row
         """
-        total = self.tokens_count
-        changes = ChangeRecord.query.filter(ChangeRecord.corpus == self.id).count()
-
-        forms_edited = TokenHistory.query.filter(TokenHistory.corpus == self.id).count()
-
-        lemma_acc = pos_acc = morph_acc = None
-        all_type = all_lemma = all_morph = False
-
-        if "lemma" in self.displayed_columns_by_name:
-            lemma_acc = ChangeRecord.query.with_entities(ChangeRecord.word_token_id).distinct().filter(
-                db.and_(
-                    ChangeRecord.corpus == self.id,
-                    ChangeRecord.lemma != ChangeRecord.lemma_new
-                )
-            ).count()
-            # Todo: Make sure this is optimized.
-            all_lemma = db.session.query(
-                AllowedLemma.label).filter(AllowedLemma.control_list == self.control_lists_id)
-
-        if "POS" in self.displayed_columns_by_name:
-            pos_acc = ChangeRecord.query.with_entities(ChangeRecord.word_token_id).distinct().filter(
-                db.and_(
-                    ChangeRecord.corpus == self.id,
-                    ChangeRecord.POS != ChangeRecord.POS_new
-                )
-            ).count()
-            # Todo: Make sure this is optimized.
-            all_type = db.session.query(AllowedPOS.label).filter(AllowedPOS.control_list == self.control_lists_id)
-
-        if "morph" in self.displayed_columns_by_name:
-            morph_acc = ChangeRecord.query.with_entities(ChangeRecord.word_token_id).distinct().filter(
-                db.and_(
-                    ChangeRecord.corpus == self.id,
-                    ChangeRecord.morph != ChangeRecord.morph_new
-                )
-            ).count()
-            # Todo: Make sure this is optimized.
-            all_morph = db.session.query(AllowedMorph.label).filter(AllowedMorph.control_list == self.control_lists_id)
-
-        unallowed = db.session.query(WordToken.id).filter(
-            db.and_(
-                WordToken.corpus == self.id,
-                db.or_(
-                    WordToken.morph.notin_(all_morph) if all_morph else False,
-                    WordToken.lemma.notin_(all_lemma) if all_lemma else False,
-                    WordToken.POS.notin_(all_type) if all_type else False,
-                )
-            )
-        ).count()
+        stats = CorpusStats.for_corpus(self)
+        total = self.token_count
+        visible = self.displayed_columns_by_name
+        lemma_acc = stats.lemma_changed if "lemma" in visible else None
+        pos_acc = stats.POS_changed if "POS" in visible else None
+        morph_acc = stats.morph_changed if "morph" in visible else None
 
         return CorpusStatistics(
-            total, changes, forms_edited, unallowed,
+            total, stats.changes, stats.forms_edited, stats.unallowed,
             lemma_acc and lemma_acc / total * 100 if total > 0 else 0,
             pos_acc and pos_acc / total * 100 if total > 0 else 0,
             morph_acc and morph_acc / total * 100 if total > 0 else 0,
@@ -310,25 +287,51 @@ class Corpus(db.Model):
             ).order_by(order_by)
         return db.session.query(cls).filter(cls.control_list == self.control_lists_id).order_by(order_by)
 
+    def get_validator(self) -> TokenValidator:
+        """ Retrieve a validator for the values of this corpus. Allowed values and custom dictionaries
+        are cached in-process and reloaded only when their version changed.
+
+        :rtype: TokenValidator
+        """
+        custom = CUSTOM_DICTIONARIES_CACHE.get_versioned(
+            # The creation date tells apart corpora reusing the ID of a deleted one
+            self.id, (self.created_at, self.custom_dictionary_version),
+            lambda: CorpusCustomDictionary.get_values(self.id)
+        )
+        if not self.control_lists:
+            return TokenValidator(AllowedValues(frozenset(), frozenset(), frozenset()), custom)
+        return TokenValidator.for_control_list(self.control_lists, custom)
+
     def get_unallowed(self, allowed_type="lemma"):
         """ Search for WordToken that would not comply with Allowed Values (in AllowedLemma,
         AllowedPOS, AllowedMorph) nor with a corpus custom dictionary
 
+        Tokens are read from their validity flags. While the flags are stale, until the job recomputing them (see
+        :meth:`schedule_validity`) is over, the values are checked against the allowed values in the query itself.
+
         :param allowed_type: A value from the set "lemma", "POS", "morph"
         :return: Flask SQL Alchemy Query
         :rtype: BaseQuery
         """
-        if allowed_type == "lemma":
-            cls = AllowedLemma
-            prop = WordToken.lemma
-        elif allowed_type == "POS":
-            cls = AllowedPOS
-            prop = WordToken.POS
-        elif allowed_type == "morph":
-            cls = AllowedMorph
-            prop = WordToken.morph
-        else:
+        if allowed_type not in ("lemma", "POS", "morph"):
             raise ValueError("Get Allowed value had %s and it's not from the lemma, POS, morph set" % allowed_type)
+        if self.validity_current:
+            unallowed = getattr(WordToken, allowed_type + "_valid") == False
+        else:
+            unallowed = db.and_(*self._unallowed_conditions(allowed_type))
+        return db.session.query(WordToken).filter(
+            WordToken.corpus == self.id,
+            unallowed
+        ).order_by(WordToken.order_id)
+
+    def _unallowed_conditions(self, allowed_type: str) -> list:
+        """ SQL conditions matching the tokens whose value of allowed_type is neither in the control list nor in
+        the custom dictionary, once the tokens ignored by the filters of the control list are set apart
+
+        :param allowed_type: A value from the set "lemma", "POS", "morph"
+        """
+        cls = {"lemma": AllowedLemma, "POS": AllowedPOS, "morph": AllowedMorph}[allowed_type]
+        prop = getattr(WordToken, allowed_type)
 
         allowed = db.session.query(cls).filter(
             cls.control_list == self.control_lists_id,
@@ -340,20 +343,17 @@ class Corpus(db.Model):
             CorpusCustomDictionary.label == prop
         )
 
-        list_darguments = [
-            WordToken.corpus == self.id,
+        conditions = [
             not_(allowed.exists()),
             not_(custom_dict.exists())
         ]
+        not_regexp = 'not regexp' if db.session.get_bind().dialect.name == 'sqlite' else '!~'
 
         current_controlList = self.control_lists
         regex_liste = []
         if current_controlList:
             if current_controlList.filter_metadata:
-                if db.session.get_bind().dialect.name == 'sqlite':
-                    list_darguments.append(WordToken.form.op('not regexp')(ControlLists.re_filter_metadata))
-                else:
-                    list_darguments.append(WordToken.form.op('!~')(ControlLists.re_filter_metadata))
+                conditions.append(WordToken.form.op(not_regexp)(ControlLists.re_filter_metadata))
             if current_controlList.filter_ignore:
                 regex_liste.append(ControlLists.re_filter_ignore)
             if current_controlList.filter_punct:
@@ -362,14 +362,135 @@ class Corpus(db.Model):
                 regex_liste.append(ControlLists.re_filter_numeral)
 
         if regex_liste:
-            if db.session.get_bind().dialect.name == 'sqlite':
-                list_darguments.append(WordToken.lemma.op('not regexp')("".join(regex_liste)))
-            else:
-                list_darguments.append(WordToken.lemma.op('!~')("".join(regex_liste)))
+            conditions.append(WordToken.lemma.op(not_regexp)("".join(regex_liste)))
+        return conditions
 
-        return db.session.query(WordToken).filter(
-            db.and_(*list_darguments)
-        ).order_by(WordToken.order_id)
+    def validity_key(self, version: Optional[int] = None) -> str:
+        """ Identify the allowed values and filters the validity flags of the tokens depend on: the control list
+        and its version, the version of the custom dictionary and the filters of the control list
+
+        :param version: Version of the control list to use instead of the current one
+        :rtype: str
+        """
+        control_list = self.control_lists
+        if not control_list:
+            return "-.{}".format(self.custom_dictionary_version)
+        return "{}.{}.{}.{}".format(
+            control_list.id, control_list.version if version is None else version, self.custom_dictionary_version,
+            "".join(
+                str(int(bool(getattr(control_list, name))))
+                for name in ("filter_metadata", "filter_ignore", "filter_punct", "filter_numeral")
+            )
+        )
+
+    @property
+    def validity_current(self) -> bool:
+        """ Whether the validity flags of the tokens match the current allowed values """
+        return self.validity_version == self.validity_key()
+
+    def _set_validity(self, *filters):
+        """ Recompute the validity flags of the tokens of the corpus matching filters """
+        WordToken.query.filter(WordToken.corpus == self.id, *filters).update({
+            getattr(WordToken, allowed_type + "_valid"): case(
+                # Conditions are NULL, hence not unallowed, for NULL values compared to regular expressions
+                (db.and_(*self._unallowed_conditions(allowed_type)), False),
+                else_=True
+            )
+            for allowed_type in ("lemma", "POS", "morph")
+        }, synchronize_session=False)
+
+    def ensure_validity(self, _commit: bool = True) -> bool:
+        """ Recompute in bulk the validity flags of every token if the control list, its filters or the custom
+        dictionary changed since they were computed. The unallowed counter of the statistics is then stale.
+
+        :param _commit: Autocommit
+        :returns: Whether the flags were recomputed
+        """
+        key = self.validity_key()
+        if self.validity_version == key:
+            return False
+        self._set_validity()
+        self.validity_version = key
+        CorpusStats.invalidate_unallowed(corpus_id=self.id)
+        if _commit:
+            db.session.commit()
+        return True
+
+    @staticmethod
+    def schedule_validity(corpus_id: Optional[int] = None, control_list_id: Optional[int] = None) -> List["Job"]:
+        """ Enqueue the recomputation of the validity flags of the corpora whose flags are stale, after their
+        control list, its filters or their custom dictionary changed
+
+        :param corpus_id: Corpus to check
+        :param control_list_id: Check the corpora using this control list
+        :return: Jobs queued or running for the stale corpora
+        """
+        query = Corpus.query
+        if corpus_id is not None:
+            query = query.filter(Corpus.id == corpus_id)
+        if control_list_id is not None:
+            query = query.filter(Corpus.control_lists_id == control_list_id)
+        return [
+            Job.enqueue_once("corpus.validity", corpus_id=corpus.id)
+            for corpus in query.all()
+            if not corpus.validity_current
+        ]
+
+    def count_invalid(self, token_ids: Optional[List[int]] = None) -> int:
+        """ Count the tokens with an unallowed value in one of the displayed lemma, POS and morph columns
+
+        :param token_ids: Restrict the count to these tokens
+        """
+        filters = [WordToken.corpus == self.id, db.or_(db.false(), *[
+            getattr(WordToken, col + "_valid") == False
+            for col in CorpusStats._checked_columns(self)
+        ])]
+        if token_ids is not None:
+            filters.append(WordToken.id.in_(token_ids))
+        return db.session.query(func.count(WordToken.id)).filter(*filters).scalar()
+
+    def update_validity(self, token_ids: List[int]) -> int:
+        """ Recompute the validity flags of tokens whose values changed and update the unallowed counter.
+        Does nothing when the flags of the corpus are stale, as they will all be recomputed by a job.
+
+        :param token_ids: IDs of the changed tokens
+        :returns: Change in the number of unallowed tokens
+        """
+        if not token_ids or not self.validity_current:
+            return 0
+        db.session.flush()
+        delta = 0
+        for start in range(0, len(token_ids), 500):
+            chunk = token_ids[start:start+500]
+            before = self.count_invalid(chunk)
+            self._set_validity(WordToken.id.in_(chunk))
+            delta += self.count_invalid(chunk) - before
+        CorpusStats.increment(self.id, unallowed=delta)
+        return delta
+
+    def apply_allowed_values_change(self, change) -> bool:
+        """ Follow a change of the allowed values of the control list by recomputing the validity flags of the
+        tokens whose value was added or removed only. Does nothing when the flags were already stale before the
+        change, as they will all be recomputed by a job.
+
+        :param change: AllowedValuesChange reported by ControlLists.update_allowed_values
+        :returns: Whether the flags were updated
+        """
+        if self.validity_version != self.validity_key(change.previous_version):
+            return False
+        self.validity_version = self.validity_key(change.version)
+        labels = change.added + change.removed
+        prop = getattr(WordToken, change.allowed_type)
+        token_ids = []
+        for start in range(0, len(labels), 500):
+            token_ids.extend(
+                token_id
+                for token_id, in db.session.query(WordToken.id).filter(
+                    WordToken.corpus == self.id, prop.in_(labels[start:start+500])
+                )
+            )
+        self.update_validity(token_ids)
+        return True
 
     def get_needs_review(self):
         """ Return all tokens in this corpus flagged for review """
@@ -380,12 +501,37 @@ class Corpus(db.Model):
 
     @property
     def tokens_count(self):
-        """ Count the number of tokens
+        """ Number of tokens, read from the denormalized token_count column
+
+        :rtype: int
+        """
+        return self.token_count
+
+    @staticmethod
+    def lock(corpus_id: int) -> bool:
+        """ Lock the row of a corpus until the end of the transaction, so that its tokens are not inserted,
+        deleted or renumbered concurrently. SQLite, which has no row lock, runs a single writer at a time anyway.
+
+        :param corpus_id: ID of the corpus
+        :return: Whether the corpus exists
+        """
+        return db.session.query(Corpus.id).filter(Corpus.id == corpus_id).with_for_update().scalar() is not None
+
+    @staticmethod
+    def increment_token_count(corpus_id: int, delta: int):
+        """ Add delta to the token count of a corpus in the current transaction
+
+        :param corpus_id: ID of the corpus
+        :param delta: Number of tokens added (or removed when negative)
+        """
+        Corpus.query.filter(Corpus.id == corpus_id).update({Corpus.token_count: Corpus.token_count + delta})
+
+    def count_tokens(self) -> int:
+        """ Count the tokens of the corpus in the word_token table, ignoring the token_count column
 
         :rtype: int
         """
-        # ToDo: This is so slow that it is impossible to use it on the Dashboard page
-        return db.session.query(db.func.count()).filter(WordToken.corpus==self.id).scalar()
+        return db.session.query(func.count(WordToken.id)).filter(WordToken.corpus == self.id).scalar()
 
     @property
     def displayed_columns_by_name(self):
@@ -413,6 +559,116 @@ class Corpus(db.Model):
         """
         return WordToken.query.filter_by(corpus=self.id).order_by(WordToken.order_id)
 
+    def stream_tokens(self, chunk_size: int = 1000) -> KeysetStream:
+        """ Stream the tokens of the corpus as lightweight rows, in reading order
+
+        :param chunk_size: Number of tokens fetched per query
+        :return: Re-iterable stream of rows with the id, order_id, form, lemma, POS, morph, gloss
+                 and token_reference attributes
+        """
+        return KeysetStream(
+            db.session.query(
+                WordToken.id, WordToken.order_id, WordToken.form, WordToken.lemma, WordToken.POS,
+                WordToken.morph, WordToken.gloss, WordToken.token_reference
+            ).filter(WordToken.corpus == self.id),
+            keys=(WordToken.order_id, WordToken.id),
+            chunk_size=chunk_size
+        )
+
+    def stream_token_history(self, chunk_size: int = 1000) -> KeysetStream:
+        """ Stream the TokenHistory of the corpus as lightweight rows, in chronological order
+
+        :param chunk_size: Number of records fetched per query
+        :return: Re-iterable stream of rows with the id, word_token_id, action_type, old, new, created_on,
+                 first_name and last_name attributes
+        """
+        return KeysetStream(
+            db.session.query(
+                TokenHistory.id, TokenHistory.word_token_id, TokenHistory.action_type, TokenHistory.old,
+                TokenHistory.new, TokenHistory.created_on, User.first_name, User.last_name
+            ).outerjoin(User, User.id == TokenHistory.user_id).filter(TokenHistory.corpus == self.id),
+            keys=(TokenHistory.id, ),
+            chunk_size=chunk_size
+        )
+
+    def get_contexts(self, tokens: List["WordToken"], contiguous: bool = False) -> Dict[int, Tuple[str, str]]:
+        """ Retrieve the left and right contexts of tokens of the corpus
+
+        When the corpus does not store contexts, the neighbours of the tokens are read in a single query per
+        WordToken.CONTEXT_UNION_SIZE lookups.
+
+        :param tokens: Tokens of the corpus
+        :param contiguous: Whether tokens are a slice of the corpus in reading order (eg. a page of the corpus),
+                           which only requires the neighbours of its first and last tokens
+        :return: Dictionary of (left context, right context) by token id
+        """
+        if self.store_context or not tokens:
+            return {tok.id: (tok.left_context or "", tok.right_context or "") for tok in tokens}
+
+        context_left = self.context_left or WordToken.CONTEXT_LEFT
+        context_right = self.context_right or WordToken.CONTEXT_RIGHT
+        order_ids = sorted(tok.order_id for tok in tokens)
+
+        def neighbours(order_id):
+            return [
+                db.session.query(WordToken.order_id, WordToken.form).filter(
+                    WordToken.corpus == self.id, WordToken.order_id < order_id
+                ).order_by(WordToken.order_id.desc()).limit(context_left),
+                db.session.query(WordToken.order_id, WordToken.form).filter(
+                    WordToken.corpus == self.id, WordToken.order_id > order_id
+                ).order_by(WordToken.order_id).limit(context_right)
+            ]
+
+        if contiguous:
+            # The page itself fills the gaps between the neighbours of its first and last token
+            subqueries = neighbours(order_ids[0])[:1] + neighbours(order_ids[-1])[1:]
+        else:
+            subqueries = [query for order_id in order_ids for query in neighbours(order_id)]
+        rows = {}
+        # SQLite does not unite more than 500 selects in a statement
+        for start in range(0, len(subqueries), WordToken.CONTEXT_UNION_SIZE):
+            rows.update(db.session.execute(sqlalchemy.union_all(*[
+                query.subquery().select() for query in subqueries[start:start+WordToken.CONTEXT_UNION_SIZE]
+            ])).all())
+        rows.update({tok.order_id: tok.form for tok in tokens})
+
+        # Neighbours of every token were read, so the closest known rows around a token are its context
+        known = sorted(rows)
+        contexts = {}
+        for tok in tokens:
+            position = bisect_left(known, tok.order_id)
+            contexts[tok.id] = (
+                " ".join(rows[order_id] for order_id in known[max(position - context_left, 0):position]),
+                " ".join(rows[order_id] for order_id in known[position + 1:position + 1 + context_right])
+            )
+        return contexts
+
+    def get_positions(self, tokens: Iterable["WordToken"]) -> Dict[int, int]:
+        """ Retrieve the position, starting at 1, of tokens of the corpus
+
+        Order ids are multiples of order_id_gap after a renumbering: the position of a token is the number of
+        gaps up to its order id, corrected by the tokens inserted or deleted up to it since the renumbering.
+
+        :param tokens: Tokens of the corpus
+        :return: Dictionary of positions by token id
+        """
+        shifts = db.session.query(TokenOrderShift.order_id, TokenOrderShift.delta).filter(
+            TokenOrderShift.corpus_id == self.id
+        ).order_by(TokenOrderShift.order_id).all()
+        order_ids = [order_id for order_id, _ in shifts]
+        deltas = list(accumulate(delta for _, delta in shifts))
+        positions = {}
+        for tok in tokens:
+            index = bisect_right(order_ids, tok.order_id)
+            positions[tok.id] = tok.order_id // self.order_id_gap + (deltas[index - 1] if index else 0)
+        return positions
+
+    def first_token_id(self) -> int:
+        """ ID of the first token of the corpus, used to number tokens in exports (0 for an empty corpus) """
+        return db.session.query(WordToken.id).filter(
+            WordToken.corpus == self.id
+        ).order_by(WordToken.order_id, WordToken.id).limit(1).scalar() or 0
+
     def changed(self, tokens):
         if db.session.get_bind().dialect.name != "postgresql":
             data = db.session.query(ChangeRecord.word_token_id).group_by(ChangeRecord.word_token_id).filter(
@@ -433,13 +689,15 @@ class Corpus(db.Model):
         :type limit: int
         :return: Pagination of records
         """
-        return ChangeRecord.query.filter_by(corpus=self.id).order_by(ChangeRecord.created_on.desc()).paginate(page=page, per_page=limit)
+        return ChangeRecord.query.filter_by(corpus=self.id).order_by(ChangeRecord.created_on.desc()).options(
+            selectinload(ChangeRecord.word_token), selectinload(ChangeRecord.user)
+        ).paginate(page=page, per_page=limit)
 
     @staticmethod
     def create_shell(
             name, allowed_lemma=None, allowed_POS=None, allowed_morph=None,
             context_left=None, context_right=None, control_list: ControlLists = None,
-            delimiter_token=None, columns=None
+            delimiter_token=None, columns=None, store_context: bool = True
     ):
         """Create the corpus record and control list without inserting tokens.
 
@@ -468,6 +726,8 @@ class Corpus(db.Model):
                 context_left=context_left,
                 context_right=context_right,
                 columns=columns,
+                store_context=store_context,
+                order_id_gap=WordToken.ORDER_ID_GAP,
                 status='pending',
             )
             db.session.add(c)
@@ -482,7 +742,7 @@ class Corpus(db.Model):
             name, word_tokens_dict,
             allowed_lemma=None, allowed_POS=None, allowed_morph=None,
             context_left=None, context_right=None, control_list: ControlLists = None,
-            delimiter_token=None, columns=None
+            delimiter_token=None, columns=None, store_context: bool = True
     ):
         """ Create a corpus
 
@@ -495,6 +755,7 @@ class Corpus(db.Model):
         :param context_right: Number of tokens to keep on the right
         :param control_list: Control list to reuse
         :param delimiter_token: Token used for separating passages
+        :param store_context: Store the context of each token instead of computing it when tokens are read
         :return: Created Corpus
         :rtype: Corpus
         """
@@ -502,7 +763,7 @@ class Corpus(db.Model):
             name=name, allowed_lemma=allowed_lemma, allowed_POS=allowed_POS,
             allowed_morph=allowed_morph, context_left=context_left,
             context_right=context_right, control_list=control_list,
-            delimiter_token=delimiter_token, columns=columns,
+            delimiter_token=delimiter_token, columns=columns, store_context=store_context,
         )
 
         token_count = WordToken.add_batch(
@@ -514,6 +775,7 @@ class Corpus(db.Model):
             raise NoTokensInput("No tokens were given")
 
         c.status = 'active'
+        c.ensure_validity(_commit=False)
         db.session.commit()
         return c
 
@@ -573,20 +835,82 @@ class Corpus(db.Model):
                     f"cannot set delimiter token to '{delimiter_token}'"
                 )
 
-    def update_contexts(self, context_left: int, context_right: int):
-        if context_left == self.context_left and context_right == self.context_right:
+    def update_contexts(self, context_left: int, context_right: int, store_context: Optional[bool] = None):
+        """ Change the context lengths of the corpus and recompute the context of its tokens in the background
+
+        :param context_left: left context length
+        :param context_right: right context length
+        :param store_context: Whether contexts are stored on tokens (Defaults to the current mode)
+        """
+        if store_context is None:
+            store_context = self.store_context
+        if context_left == self.context_left and context_right == self.context_right \
+                and store_context == self.store_context:
             return
+        if self.context_update_progress is not None:
+            raise PreferencesUpdateError("The contexts of this corpus are already being updated")
 
         try:
+            clear = self.store_context and not store_context
             self.context_left = context_left
             self.context_right = context_right
-            WordToken.update_batch_context(self.id, context_left, context_right)
+            self.store_context = store_context
+            if store_context:
+                self.context_update_progress = 0
+                db.session.commit()
+                Job.enqueue("corpus.contexts", corpus_id=self.id, context_left=context_left,
+                            context_right=context_right)
+            else:
+                # Contexts are computed on read
+                if clear:
+                    WordToken.query.filter(WordToken.corpus == self.id).update(
+                        {WordToken.left_context: None, WordToken.right_context: None},
+                        synchronize_session=False
+                    )
+                db.session.commit()
         except Exception:
             db.session.rollback()
+            Corpus.set_context_update_progress(self.id, None)
             raise PreferencesUpdateError(
                 f"Cannot set context to 'left: {context_left}, right: {context_right}'"
             )
 
+    @staticmethod
+    def set_context_update_progress(corpus_id: int, progress: Optional[int], _commit: bool = True):
+        """ Record the number of tokens whose context was updated
+
+        :param corpus_id: ID of the corpus
+        :param progress: Number of tokens updated, None once the update is over
+        :param _commit: Autocommit
+        """
+        Corpus.query.filter(Corpus.id == corpus_id).update({Corpus.context_update_progress: progress})
+        if _commit:
+            db.session.commit()
+
+    @staticmethod
+    def run_context_update(corpus_id: int, context_left: int, context_right: int,
+                           progress: Optional[Callable[[int], None]] = None):
+        """ Recompute the context of the tokens of a corpus, recording the progress after each chunk. The update
+        is marked as over once it succeeded: on failure, the progress is left for the caller to clear, as the
+        corpus.contexts job does when it ends, so that no other update starts while it is retried.
+
+        :param corpus_id: ID of the corpus
+        :param context_left: left context length
+        :param context_right: right context length
+        :param progress: Also called with the number of tokens updated after each chunk
+        """
+        def report(updated: int):
+            Corpus.set_context_update_progress(corpus_id, updated, _commit=False)
+            if progress:
+                progress(updated)
+
+        try:
+            WordToken.update_batch_context(corpus_id, context_left, context_right, progress=report)
+        except Exception:
+            db.session.rollback()
+            raise
+        Corpus.set_context_update_progress(corpus_id, None)
+
     def update_columns(self, columns):
         """Update columns.
 
@@ -596,6 +920,7 @@ class Corpus(db.Model):
             raise PreferencesUpdateError(
                 "You can't disable Lemma and POS and Morph. Keep at least one of them."
             )
+        CorpusStats.invalidate_unallowed(corpus_id=self.id)
         for column in self.columns:
             try:
                 column.hidden = columns.get(column.heading.lower(), False)
@@ -644,6 +969,7 @@ class Corpus(db.Model):
                 CorpusCustomDictionary,
                 values
             )
+        self.custom_dictionary_version = Corpus.custom_dictionary_version + 1
         if _commit:
             db.session.commit()
         return len(values)
@@ -662,6 +988,7 @@ class Corpus(db.Model):
         db.session.add(CorpusCustomDictionary(
             **preproc(string, self.id)
         ))
+        self.custom_dictionary_version = Corpus.custom_dictionary_version + 1
         db.session.commit()
 
     def token_search(
@@ -704,41 +1031,16 @@ class Corpus(db.Model):
             if value:
                 fields[name] = prepare_search_string(value)
 
-        # all search combinations
-        fields: List[List[Tuple[str, str]]] = [
-            [
-                (field, value)
-                for value in fields[field]
-            ]
-            for field in fields
-        ]
-        # Création combinaison de recherches possibles pipe product
-        # If source_dict = {"POS": "NOM|VER", "lemma": "mang*"}
-        # Then fields = [[("POS", "NOM"), ("POS", "VER")], [("lemma", "mang*")]]
-        # And search_branches :
-        #    [{"POS": "NOM", "lemma": "mang*"}, {"POS": "VER", "lemma": "mang*"}]
-        # * => fields = [["a", "b"], ["c"]]
-        # product(*fields) == product(fields[0], fields[1])
-        search_branches: List[Dict[str, str]] = [dict(prod) for prod in product(*fields)]
-
-        value_filters = []
-        # for each branch filter (= OR clauses if any)
-        for search_branch in search_branches:
-            # filtre minimal = bon corpus (id)
-            branch_filters = [WordToken.corpus == self.id]
-
-            # for each field (lemma, pos, form, morph)
-            for name, value in search_branch.items():
-                # transformation couple clé valeur en filtre SQLalchemy
-                branch_filters.extend(
-                    column_search_filter(getattr(WordToken, name), value, case_sensitive=case_sensitive))
-
-            value_filters.append(branch_filters)
-
-        if not value_filters:  # If the search is empty, we only search for the corpus_id
-            value_filters.append([WordToken.corpus == self.id])
-
-        # there is at least one OR clause
+        # Alternatives of a field are OR'ed and fields are AND'ed: equality alternatives of a field are
+        # collapsed into one IN, instead of one OR'ed branch per combination of alternatives.
+        # If source_dict = {"POS": "NOM|VER|ADJ*", "lemma": "mang*"}
+        # Then filters = [POS IN ("NOM", "VER") OR POS LIKE "ADJ%", lemma LIKE "mang%"]
+        value_filters = [WordToken.corpus == self.id]
+        for name, values in fields.items():
+            condition = column_search_alternatives(getattr(WordToken, name), values, case_sensitive=case_sensitive)
+            if condition is not None:
+                value_filters.append(condition)
+
         # get sort arguments (sort per default by WordToken.order_id)
         order_by = {
             "order_id": WordToken.order_id,
@@ -751,15 +1053,7 @@ class Corpus(db.Model):
             order_by_key = "order_id"
         order_by = order_by.get(order_by_key)
 
-        args = []
-
-        if len(value_filters) > 1:
-            and_filters = [and_(*branch_filters) for branch_filters in value_filters]
-            args = [or_(*and_filters)]
-        elif len(value_filters) == 1:
-            args = value_filters[0]
-
-        tokens = WordToken.query.filter(*args).order_by(order_by.desc() if desc else order_by)
+        tokens = WordToken.query.filter(*value_filters).order_by(order_by.desc() if desc else order_by)
 
         return tokens, order_by_key, input_values
 
@@ -788,11 +1082,14 @@ class WordToken(db.Model):
      context when adding WordToken in batch
     :cvar CONTEXT_RIGHT: Number of word at the right of the current word to put in \
      context when adding WordToken in batch
+    :cvar INSERT_BATCH_SIZE: Number of tokens written at once when adding WordToken in batch
+    :cvar ORDER_ID_GAP: Spacing of the order ids of renumbered tokens, which leaves room for insertions
+    :cvar ORDER_ID_MAX_SHIFTS: Number of insertions and deletions after which a corpus is renumbered
 
     """
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     corpus = db.Column(db.Integer, db.ForeignKey('corpus.id', ondelete='CASCADE'))
-    order_id = db.Column(db.Integer)  # Id in the corpus
+    order_id = db.Column(db.BigInteger)  # Sort key in the corpus, see Corpus.get_positions()
     form = db.Column(db.String(128))
     lemma = db.Column(db.String(128))
     label_uniform = db.Column(db.String(128))
@@ -804,18 +1101,40 @@ class WordToken(db.Model):
     token_reference = db.Column(db.String(512), nullable=True)
     left_context = db.Column(db.String(1024))
     right_context = db.Column(db.String(1024))
+    # Whether the values are accepted by the control list, see Corpus.get_unallowed()
+    lemma_valid = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    POS_valid = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
+    morph_valid = db.Column(db.Boolean, nullable=False, default=True, server_default='1')
 
     __table_args__ = (
         # Covers the primary annotation query: filter by corpus, order by position
         db.Index('ix_word_token_corpus_order', 'corpus', 'order_id'),
         # Covers the similarity query: find all tokens in a corpus sharing a form
         db.Index('ix_word_token_corpus_form', 'corpus', 'form'),
+        # Cover the unallowed pages and counts, which only read the few invalid tokens
+        *[
+            db.Index(
+                'ix_word_token_{}_invalid'.format(column.lower()), 'corpus', 'order_id',
+                postgresql_where=db.text('NOT "{}_valid"'.format(column)),
+                sqlite_where=db.text('"{}_valid" = 0'.format(column))
+            )
+            for column in ("lemma", "POS", "morph")
+        ]
     )
 
     _changes = db.relationship("ChangeRecord")
 
+    INSERT_BATCH_SIZE = 5000
+    ORDER_ID_GAP = 1024
+    ORDER_ID_MAX_SHIFTS = 1000
+    INSERT_COLUMNS = (
+        "form", "lemma", "label_uniform", "POS", "morph", "gloss", "token_reference",
+        "left_context", "right_context", "corpus", "order_id"
+    )
+
     CONTEXT_LEFT = 3
     CONTEXT_RIGHT = 3
+    CONTEXT_UNION_SIZE = 400
 
     class ValidityError(ValueError):
         """ Error for values which are not allowed """
@@ -830,11 +1149,17 @@ class WordToken(db.Model):
         statuses = {}
         msg = ""
 
-    def to_dict(self):
+    class RenumberingPending(PyrrhaError):
+        """ Error when there is no room left to insert a token until the corpus is renumbered by its job """
+
+    def to_dict(self, context: Optional[Tuple[str, str]] = None):
         """ Export the current lemma to a dict (Most useful for jsonify)
 
+        :param context: Left and right contexts of the token (see Corpus.get_contexts), read when not given
         :return: Dict version of the lemma
         """
+        if context is None:
+            context = db.session.get(Corpus, self.corpus).get_contexts([self])[self.id]
         return {
             "id": self.id,
             "corpus": self.corpus,
@@ -847,70 +1172,59 @@ class WordToken(db.Model):
             "needs_review": self.needs_review,
             "review_comment": self.review_comment,
             "token_reference": self.token_reference,
-            "context": self.context
+            "context": self.format_context(context)
         }
 
-    def update_context_around(self, corpus, added=0, tokens=None, delete=None, _commit=True):
-        """ Recomputes the context of tokens around the current token
+    def update_context_around(self, corpus, _commit=True):
+        """ Recomputes the context of the tokens around the position of the current token
+
+        The current token may have been edited or inserted, or deleted in which case only its neighbours are
+        updated.
 
         :param corpus: Corpus object to look for settings
-        :param added: Number of token added
-        :param tokens: Dictionary of tokens that should not be retrieved because they are updated
         :param _commit: Autocommit
         """
+        if not corpus.store_context:
+            return
 
-        token_count = corpus.tokens_count
-        select_range = (
-            # Start is the current order id minus the context
-            # But we need this context twice because we will need also the tokens around it
-            max(self.order_id - corpus.context_left * 2, 1),
-            min(self.order_id + corpus.context_right * 2 + 1 + added, token_count)
-        )
-        edit_range = (
-            # Start is the current order id minus the context
-            # But we need this context twice because we will need also the tokens around it
-            max(self.order_id - corpus.context_left, 1),
-            min(self.order_id + corpus.context_right + 1 + added, token_count)
-        )
-
-        tokens = tokens or {}
-        # Get the required tokens
-        tokens.update({
-            tok.order_id: tok
-            for tok in WordToken.query.filter(
-                db.and_(
-                    WordToken.corpus == self.corpus,
-                    WordToken.order_id.between(
-                        *select_range
-                    )
-                )
-            ).all()
-            if not delete or tok.id != delete
-        })
-
-        for token_id in range(*edit_range):
-            if token_id == self.order_id and added:
-                pass
-            tok = tokens[token_id]
-
-            tok.left_context = " ".join([
-                tokens[order_id].form for order_id in range(
-                    max(token_id - corpus.context_left, 1),
-                    token_id
-                )
-            ])
-
-            tok.right_context = " ".join([
-                tokens[order_id].form for order_id in range(
-                    # We need max on both because editing the last one would make the range fail
-                    min(token_count, token_id + 1),
-                    min(token_count, corpus.context_right + token_id + 1)
-                )
-            ])
-            db.session.add(tok)
+        context_left = corpus.context_left or WordToken.CONTEXT_LEFT
+        context_right = corpus.context_right or WordToken.CONTEXT_RIGHT
+        # Tokens whose context contains the position, and the tokens in their own context
+        before = WordToken.query.filter(
+            WordToken.corpus == self.corpus, WordToken.order_id < self.order_id
+        ).order_by(WordToken.order_id.desc()).limit(context_left + context_right).all()[::-1]
+        after = WordToken.query.filter(
+            WordToken.corpus == self.corpus, WordToken.order_id >= self.order_id
+        ).order_by(WordToken.order_id).limit(context_left + context_right + 1).all()
+
+        edited = range(max(len(before) - context_right, 0), len(before) + context_left + 1)
+        for index, (tok, left_context, right_context) in enumerate(sliding_contexts(
+                before + after, context_left, context_right, get_form=lambda token: token.form)):
+            if index in edited:
+                tok.left_context, tok.right_context = left_context, right_context
         if _commit:
             db.session.commit()
 
+    @property
+    def position(self) -> int:
+        """ Position of the token in its corpus, starting at 1 """
+        return db.session.get(Corpus, self.corpus).get_positions([self])[self.id]
+
+    def _order_id_after(self, corpus) -> Optional[int]:
+        """ Free order id between the current token and the next one, None when there is no room left
+
+        :param corpus: Corpus in which the token is
+        """
+        following = db.session.query(func.min(WordToken.order_id)).filter(
+            WordToken.corpus == self.corpus, WordToken.order_id > self.order_id
+        ).scalar()
+        if following is None:
+            # Positions are derived from the gaps: tokens stay below the gap following the last renumbered one
+            following = (self.order_id // corpus.order_id_gap + 1) * corpus.order_id_gap
+        if following - self.order_id < 2:
+            return None
+        return (self.order_id + following) // 2
+
     def edit_form(self, form, corpus, user):
         """ Edit the form of a token, recompute the context of neighbors, adds a recording
 
@@ -926,38 +1240,60 @@ class WordToken(db.Model):
             action_type=TokenHistory.TYPES.Edition,
             user_id=user.id,
             word_token_id=self.id,
-            order_id = self.order_id
+            order_id=self.position
         ))
+        SimilarCount.move(corpus.id, [(
+            (self.form, self.lemma, self.POS, self.morph), (form, self.lemma, self.POS, self.morph)
+        )])
         self.form = form
         db.session.add(self)
+        CorpusStats.increment(corpus.id, forms_edited=1)
+        # The form decides whether the token is metadata
+        corpus.update_validity([self.id])
 
-        self.update_context_around(corpus, tokens={
-            self.order_id: self
-        })
+        self.update_context_around(corpus)
 
         db.session.commit()
 
+    def _lock_order_ids(self, corpus):
+        """ Lock the corpus against renumberings and other insertions or deletions, then read the order id of the
+        token and the gap of the corpus again, as a renumbering may have changed them since they were loaded
+
+        :param corpus: Corpus in which the token is
+        """
+        Corpus.lock(corpus.id)
+        db.session.refresh(self, ["order_id"])
+        db.session.refresh(corpus, ["order_id_gap"])
+
     def add_form(self, form, corpus, user):
         """ Add a new token after the current one
 
+        The new token takes an order id between the current token and the next one, other tokens are not
+        renumbered unless there is no room left between them, as in corpora numbered before gaps were left.
+
         :param form: Form to record
         :param corpus: Corpus in which the token is
         :param user: User doing the correction
+        :raises WordToken.RenumberingPending: When the corpus has to be renumbered first and its job is not over
         """
-
-        # Update the order ids
-        WordToken.query.filter(db.and_(
-            WordToken.corpus == corpus.id,
-            WordToken.order_id > self.order_id
-        )).update({WordToken.order_id: WordToken.order_id + 1})
+        self._lock_order_ids(corpus)
+        order_id = self._order_id_after(corpus)
+        if order_id is None:
+            job = WordToken.schedule_renumbering(corpus.id, force=True)
+            if job.status != Job.DONE:
+                raise WordToken.RenumberingPending("The corpus is being renumbered, try again in a moment")
+            self._lock_order_ids(corpus)
+            order_id = self._order_id_after(corpus)
 
         # Add the new token
         new_token = WordToken(
             corpus=corpus.id,
             form=form,
-            order_id=self.order_id + 1
+            order_id=order_id
         )
         db.session.add(new_token)
+        db.session.add(TokenOrderShift(corpus_id=corpus.id, order_id=order_id, delta=1))
+        SimilarCount.move(corpus.id, [(None, (form, None, None, None))])
         db.session.flush()
 
         # Record the change
@@ -967,34 +1303,37 @@ class WordToken(db.Model):
             action_type=TokenHistory.TYPES.Addition,
             user_id=user.id,
             word_token_id=new_token.id,
-            order_id = new_token.order_id
+            order_id=new_token.position
         ))
+        Corpus.increment_token_count(corpus.id, 1)
+        CorpusStats.increment(corpus.id, forms_edited=1)
+        corpus.update_validity([new_token.id])
 
         # Update the contexts
-        self.update_context_around(corpus, added=2, tokens={
-            self.order_id: self,
-            self.order_id + 1: new_token
-        })
+        new_token.update_context_around(corpus)
 
         db.session.commit()
+        WordToken.schedule_renumbering(corpus.id)
 
     def del_form(self, corpus, user):
-        """ Add a new token after the current one
+        """ Remove the current token
+
+        Following tokens keep their order id, the deletion is recorded as a shift of their position.
 
-        :param form: Form to record
         :param corpus: Corpus in which the token is
         :param user: User doing the correction
         """
+        self._lock_order_ids(corpus)
+        # Must be read before the deletion sets the records' token to NULL
+        corrected = ChangeRecord.corrected_columns(self.id)
+        position = self.position
+        unallowed = corpus.count_invalid([self.id]) if corpus.validity_current else 0
+
         # Remove
         db.session.delete(self)
+        db.session.add(TokenOrderShift(corpus_id=corpus.id, order_id=self.order_id, delta=-1))
+        SimilarCount.move(corpus.id, [((self.form, self.lemma, self.POS, self.morph), None)])
 
-        # Update the order ids
-        WordToken.query.filter(db.and_(
-            WordToken.corpus == corpus.id,
-            WordToken.order_id > self.order_id
-        )).update({WordToken.order_id: WordToken.order_id - 1})
-
-        # Update
         # Record the change
         db.session.add(TokenHistory(
             corpus=corpus.id,
@@ -1003,14 +1342,22 @@ class WordToken(db.Model):
             action_type=TokenHistory.TYPES.Deletion,
             user_id=user.id,
             #word_token_id=self.id,
-            order_id = self.order_id
+            order_id=position
         ))
-
+        Corpus.increment_token_count(corpus.id, -1)
+        CorpusStats.increment(
+            corpus.id,
+            forms_edited=1,
+            needs_review=-int(bool(self.needs_review)),
+            unallowed=-unallowed,
+            **{col + "_changed": -1 for col, was_corrected in corrected.items() if was_corrected}
+        )
 
         # Update the contexts
-        self.update_context_around(corpus, delete=self.id)
+        self.update_context_around(corpus)
 
         db.session.commit()
+        WordToken.schedule_renumbering(corpus.id)
 
     @property
     def tsv(self):
@@ -1048,34 +1395,14 @@ class WordToken(db.Model):
         if not token_list:
             return
 
-        # Self-join: for each page token count OTHER corpus tokens that share
-        # the same form and at least one annotation field (lemma, POS, or morph).
-        # This avoids loading all matching corpus rows into Python.
-        PageToken = aliased(WordToken, flat=True)
-        CorpusToken = aliased(WordToken, flat=True)
-
-        rows = db.session.query(
-            PageToken.id,
-            func.count(CorpusToken.id)
-        ).join(
-            CorpusToken,
-            and_(
-                CorpusToken.corpus == PageToken.corpus,
-                CorpusToken.form == PageToken.form,
-                CorpusToken.id != PageToken.id,
-                or_(
-                    CorpusToken.lemma == PageToken.lemma,
-                    CorpusToken.POS == PageToken.POS,
-                    CorpusToken.morph == PageToken.morph,
-                )
-            )
-        ).filter(
-            PageToken.id.in_([t.id for t in token_list])
-        ).group_by(PageToken.id).all()
-
-        counts = {token_id: count for token_id, count in rows}
+        # For each page token count OTHER corpus tokens that share the same form and at least one annotation
+        # field (lemma, POS, or morph), from the precomputed counts of the page forms.
+        counts = SimilarCount.for_forms(corpus.id, [token.form for token in token_list])
         for token in token_list:
-            token.similar = counts.get(token.id, 0)
+            values = {"lemma": token.lemma, "POS": token.POS, "morph": token.morph}
+            similar = counts.count_any(token.form, {}, values)
+            # The token itself is counted as soon as one of its values is not NULL
+            token.similar = similar - int(any(value is not None for value in values.values()))
 
     @staticmethod
     def get_like(filter_id, form, group_by, type_like="lemma", allowed_list=False):
@@ -1188,64 +1515,19 @@ class WordToken(db.Model):
         :return: Dictionary of status
         :rtype: dict
         """
-        allowed_lemma, allowed_POS, allowed_morph = corpus.get_allowed_values("lemma"), \
-                                                    corpus.get_allowed_values("POS"), \
-                                                    corpus.get_allowed_values("morph")
-
-        statuses = {
-            "lemma": True,
-            "POS": True,
-            "morph": True
-        }
-        allowed_column = corpus.displayed_columns_by_name
-        current_controlList = corpus.control_lists
-        metadata_filtered = (
-            form
-            and current_controlList
-            and current_controlList.filter_metadata
-            and re.match(current_controlList.re_filter_metadata, form)
+        return corpus.get_validator().validate(
+            lemma=lemma, POS=POS, morph=morph, form=form,
+            columns=corpus.displayed_columns_by_name
         )
-        if not metadata_filtered:
-            if (lemma  # If we changed the lemma
-                and "lemma" in allowed_column  # And if the lemma is a column known to the project
-                and allowed_lemma.count()  # And if we have a list of accepted lemma
-                ):
-                regex_liste = []
-                if current_controlList:
-                    if current_controlList.filter_ignore:
-                        regex_liste.append(ControlLists.re_filter_ignore)
-                    if current_controlList.filter_punct:
-                        regex_liste.append(ControlLists.re_filter_punct)
-                    if current_controlList.filter_numeral:
-                        regex_liste.append(ControlLists.re_filter_numeral)
-                ignored_by_regex = any(re.match(regex, lemma) for regex in regex_liste)
-                if (
-                    not ignored_by_regex
-                    and not corpus.has_custom_dictionary_value("lemma", lemma)
-                    and corpus.get_allowed_values("lemma", label=lemma).count() == 0
-                ):
-                    statuses["lemma"] = False
-
-            if POS is not None \
-                and "POS" in allowed_column \
-                and allowed_POS.count() > 0 \
-                and corpus.get_allowed_values("POS", label=POS).count() == 0:
-                if not corpus.has_custom_dictionary_value("POS", POS):
-                    statuses["POS"] = False
-
-            if morph is not None \
-                and "morph" in allowed_column \
-                and allowed_morph.count() > 0 \
-                and corpus.get_allowed_values("morph", label=morph).count() == 0:
-                if not corpus.has_custom_dictionary_value("morph", morph):
-                    statuses["morph"] = False
-
-        return statuses
 
     @staticmethod
-    def add_batch(corpus_id, word_tokens_dict, context_left=None, context_right=None, order_id_offset: int = 0):
+    def add_batch(corpus_id, word_tokens_dict, context_left=None, context_right=None, order_id_offset: int = 0,
+                  batch_size: Optional[int] = None):
         """ Add a batch of tokens to a corpus given a TSV
 
+        Tokens are read lazily and written by batches of batch_size, so that memory does not grow with the
+        size of the input. Contexts are built with a sliding window over the forms.
+
         :param corpus_id: Id of the corpus
         :type corpus_id: int
         :param word_tokens_dict: Generator made of dicts of tokens with form, lemma, POS and morph key
@@ -1254,6 +1536,9 @@ class WordToken(db.Model):
         :type context_left: int
         :param context_right: Length of the context to keep on the right
         :type context_right: int
+        :param order_id_offset: Number of tokens preceding this batch in the corpus, order ids are spaced by the
+                                order_id_gap of the corpus
+        :param batch_size: Number of tokens written at once (Defaults to WordToken.INSERT_BATCH_SIZE)
         """
         if context_right:
             context_right = int(context_right)
@@ -1265,15 +1550,15 @@ class WordToken(db.Model):
         else:
             context_left = WordToken.CONTEXT_LEFT
 
-        word_tokens_dict = list(word_tokens_dict)
-        count_tokens = len(word_tokens_dict)
-        tokens = []
+        batch_size = batch_size or WordToken.INSERT_BATCH_SIZE
+        word_tokens_dict = iter(word_tokens_dict)
+        first = next(word_tokens_dict, None)
 
         # stop right now if there's nothing to add
-        if count_tokens == 0:
+        if first is None:
             return 0
 
-        _keys = word_tokens_dict[0]
+        _keys = first
         form_key = "form" if "form" in _keys else "token" if "token" in _keys else "tokens"
         lemma_key = "lemma" if "lemma" in _keys else "lemmas"
         pos_key = "pos" if "pos" in _keys else "POS"
@@ -1281,105 +1566,281 @@ class WordToken(db.Model):
         gloss_key = "gloss" if "gloss" in _keys else None
         ref_key = "token_reference" if "token_reference" in _keys else "ref" if "ref" in _keys else None
 
-        for i, token in enumerate(word_tokens_dict):
-
-            if i == 0:
-                previous_token = []
-            elif i < context_left:
-                previous_token = [tok.get(form_key) for tok in word_tokens_dict[:i]]
-            else:
-                previous_token = [tok.get(form_key) for tok in word_tokens_dict[i-context_left:i]]
-
-            if i == count_tokens-1:
-                next_token = []
-            elif count_tokens-1-i < context_right:
-                next_token = [tok.get(form_key) for tok in word_tokens_dict[i+1:]]
-            else:
-                next_token = [tok.get(form_key) for tok in word_tokens_dict[i+1:i+context_right+1]]
-
-            form = token.get(form_key)
-            if not form:
-                error = MissingTokenColumnValue()
-                error.line = i+1
-                raise error
+        def read_forms():
+            """ Check forms as soon as they are read, as they are needed for the context of previous tokens """
+            for i, token in enumerate(chain([first], word_tokens_dict)):
+                form = token.get(form_key)
+                if not form:
+                    error = MissingTokenColumnValue()
+                    error.line = i+1
+                    raise error
+                validate_length("form", form, {"form": 128})
+                yield form, token
+
+        store_context, order_id_gap = db.session.query(
+            Corpus.store_context, Corpus.order_id_gap
+        ).filter(Corpus.id == corpus_id).one()
+        if store_context is False:
+            context_left = context_right = 0
+
+        connection = db.session.connection()
+        count_tokens = 0
+        tokens = []
+        for (form, token), left_context, right_context in sliding_contexts(
+                read_forms(), context_left, context_right, get_form=itemgetter(0)):
             lemma = token.get(lemma_key)
             label_uniform = ""
             if lemma:
                 label_uniform = unidecode.unidecode(lemma)
-            POS = token.get(pos_key, None)
-            morph = token.get(morph_key, None)
-
-            wt = dict(
+            count_tokens += 1
+            tokens.append(dict(
                 form=form,
                 lemma=lemma,
                 label_uniform=label_uniform,
-                POS=POS,
-                morph=morph,
+                POS=token.get(pos_key, None),
+                morph=token.get(morph_key, None),
                 gloss=token.get(gloss_key) or None if gloss_key else None,
                 token_reference=token.get(ref_key) or None if ref_key else None,
-                left_context=" ".join(previous_token),
-                right_context=" ".join(next_token),
+                left_context=left_context if store_context is not False else None,
+                right_context=right_context if store_context is not False else None,
                 corpus=corpus_id,
-                order_id=order_id_offset + i + 1  # Asked by JB Camps...
-            )
-            for k in ("form",):
-                validate_length(k, wt[k], {"form": 128})
-            tokens.append(wt)
-
-        db.session.bulk_insert_mappings(WordToken, tokens)
-        return len(tokens)
+                order_id=(order_id_offset + count_tokens) * order_id_gap  # Asked by JB Camps...
+            ))
+            if len(tokens) >= batch_size:
+                bulk_insert(connection, WordToken.__table__, WordToken.INSERT_COLUMNS, tokens)
+                tokens = []
+
+        bulk_insert(connection, WordToken.__table__, WordToken.INSERT_COLUMNS, tokens)
+        corpus = db.session.get(Corpus, corpus_id)
+        if corpus.validity_current:
+            corpus._set_validity(WordToken.order_id.between(
+                (order_id_offset + 1) * order_id_gap, (order_id_offset + count_tokens) * order_id_gap
+            ))
+        Corpus.increment_token_count(corpus_id, count_tokens)
+        CorpusStats.invalidate_unallowed(corpus_id=corpus_id)
+        SimilarCount.invalidate(corpus_id)
+        return count_tokens
 
     @staticmethod
     def update_batch_context(
             corpus_id: int,
             context_left: int,
             context_right: int,
+            chunk_size: Optional[int] = None,
+            progress: Optional[Callable[[int], None]] = None,
             _commit: bool = True
-    ):
+    ) -> int:
         """
         Recomputes the context around each tokens of a given corpus.
         This method is called after changing corpus left and right context.
+
+        Tokens are processed by chunks of chunk_size: on PostgreSQL, each chunk is a single UPDATE computing
+        contexts with window functions, elsewhere contexts are computed in Python with a sliding window.
+
         :param corpus_id: identifier of the corpus
         :param context_left: left context length
         :param context_right: right context length
-        :param _commit: Autocommit
+        :param chunk_size: Number of tokens updated at once (Defaults to WordToken.INSERT_BATCH_SIZE)
+        :param progress: Callable receiving the number of tokens updated so far after each chunk
+        :param _commit: Autocommit, after each chunk
+        :return: Number of tokens updated
         """
-        tokens = WordToken.query.filter_by(
-            corpus=corpus_id
-        ).order_by(
-            WordToken.order_id
-        ).with_entities(
-            WordToken.id, WordToken.order_id, WordToken.form
-        ).all()
-        token_count = len(tokens)
+        chunk_size = chunk_size or WordToken.INSERT_BATCH_SIZE
+        if db.session.get_bind().dialect.name == "postgresql":
+            chunks = WordToken._update_context_chunks_sql(corpus_id, context_left, context_right, chunk_size)
+        else:
+            chunks = WordToken._update_context_chunks_python(corpus_id, context_left, context_right, chunk_size)
 
-        updated_tokens = []
-        for i, token in enumerate(tokens):
-            left_context = " ".join([
-                tokens[order_id].form for order_id in range(
-                    max(i - context_left, 1), i
-                )
-            ])
-            right_context = " ".join([
-                tokens[order_id].form for order_id in range(
-                    min(token_count, i + 1),
-                    min(token_count, context_right + i + 1)
-                )
-            ])
-            updated_tokens.append(
-                dict(
-                    id=token.id,
-                    left_context=left_context,
-                    right_context=right_context,
-                )
+        updated = 0
+        for chunk in chunks:
+            updated += chunk
+            if progress:
+                progress(updated)
+            if _commit:
+                db.session.commit()
+        return updated
+
+    @staticmethod
+    def _update_context_chunks_python(corpus_id: int, context_left: int, context_right: int, chunk_size: int):
+        """ Write contexts computed with a sliding window over the forms of the corpus, yielding the size of
+        each chunk written """
+        rows = iter_keyset(
+            db.session.query(WordToken.id, WordToken.order_id, WordToken.form).filter(WordToken.corpus == corpus_id),
+            keys=(WordToken.order_id, WordToken.id),
+            chunk_size=chunk_size
+        )
+        buffer = []
+        for token, left_context, right_context in sliding_contexts(
+                rows, context_left, context_right, get_form=lambda row: row.form):
+            buffer.append(dict(id=token.id, left_context=left_context, right_context=right_context))
+            if len(buffer) >= chunk_size:
+                db.session.bulk_update_mappings(WordToken, buffer)
+                yield len(buffer)
+                buffer = []
+        if buffer:
+            db.session.bulk_update_mappings(WordToken, buffer)
+            yield len(buffer)
+
+    @staticmethod
+    def _update_context_chunks_sql(corpus_id: int, context_left: int, context_right: int, chunk_size: int):
+        """ Write contexts computed with string_agg() window functions, yielding the size of each chunk written
+
+        Each chunk only reads the context_left tokens before it and the context_right tokens after it.
+        """
+        def order_id_at(condition, order, offset):
+            return db.session.query(WordToken.order_id).filter(
+                WordToken.corpus == corpus_id, condition
+            ).order_by(order).offset(offset).limit(1).scalar()
+
+        def context(rows):
+            if rows == (0, -1) or rows == (1, 0):
+                return literal("")
+            return func.coalesce(
+                func.string_agg(WordToken.form, literal(" ")).over(order_by=WordToken.order_id, rows=rows),
+                ""
             )
 
-        db.session.bulk_update_mappings(WordToken, updated_tokens)
+        last = None
+        while True:
+            first = order_id_at(
+                WordToken.order_id > last if last is not None else sqlalchemy.true(), WordToken.order_id, 0
+            )
+            if first is None:
+                return
+            end = order_id_at(WordToken.order_id >= first, WordToken.order_id, chunk_size - 1)
+            # Boundaries of the tokens read to compute the context of the chunk
+            low, high = first, end
+            if context_left:
+                low = order_id_at(WordToken.order_id < first, WordToken.order_id.desc(), context_left - 1)
+            if context_right and end is not None:
+                high = order_id_at(WordToken.order_id > end, WordToken.order_id, context_right - 1)
+
+            window = db.session.query(
+                WordToken.id.label("id"),
+                WordToken.order_id.label("order_id"),
+                context((-max(context_left, 0), -1)).label("left_context"),
+                context((1, max(context_right, 0))).label("right_context")
+            ).filter(WordToken.corpus == corpus_id)
+            if low is not None:
+                window = window.filter(WordToken.order_id >= low)
+            if high is not None:
+                window = window.filter(WordToken.order_id <= high)
+            window = window.subquery()
+
+            chunk = window.c.order_id >= first
+            if end is not None:
+                chunk = and_(chunk, window.c.order_id <= end)
+            count = db.session.execute(
+                sqlalchemy.update(WordToken)
+                .where(WordToken.id == window.c.id, chunk)
+                .values(left_context=window.c.left_context, right_context=window.c.right_context)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            yield count
+            if end is None:
+                return
+            last = end
 
+    @staticmethod
+    def has_continuous_order_ids(corpus_id: int) -> bool:
+        """ Check that the order_id of the tokens of a corpus go from one gap to the number of tokens times the
+        gap of the corpus, without missing step nor duplicate
+
+        :param corpus_id: identifier of the corpus
+        """
+        gap = db.session.query(Corpus.order_id_gap).filter(Corpus.id == corpus_id).scalar()
+        count, distinct, lowest, highest, off_step = db.session.query(
+            func.count(WordToken.id),
+            func.count(WordToken.order_id.distinct()),
+            func.min(WordToken.order_id),
+            func.max(WordToken.order_id),
+            func.sum(case((WordToken.order_id % gap != 0, 1), else_=0))
+        ).filter(WordToken.corpus == corpus_id).one()
+        return count == 0 or (count == distinct and lowest == gap and highest == count * gap and not off_step)
+
+    @staticmethod
+    def renumber_order_ids(corpus_id: int, gap: Optional[int] = None, _commit: bool = False):
+        """ Renumber the tokens of a corpus every gap, keeping their current order, and forget the shifts of
+        positions recorded since the previous renumbering
+
+        :param corpus_id: identifier of the corpus
+        :param gap: Spacing of the order ids (Defaults to WordToken.ORDER_ID_GAP)
+        :param _commit: Autocommit
+        """
+        gap = gap or WordToken.ORDER_ID_GAP
+        numbered = db.session.query(
+            WordToken.id.label("id"),
+            func.row_number().over(order_by=(WordToken.order_id, WordToken.id)).label("position")
+        ).filter(WordToken.corpus == corpus_id).subquery()
+        db.session.execute(
+            sqlalchemy.update(WordToken)
+            .where(WordToken.id == numbered.c.id)
+            .values(order_id=numbered.c.position * gap)
+            .execution_options(synchronize_session=False)
+        )
+        TokenOrderShift.query.filter(TokenOrderShift.corpus_id == corpus_id).delete(synchronize_session=False)
+        Corpus.query.filter(Corpus.id == corpus_id).update(
+            {Corpus.order_id_gap: gap}, synchronize_session=False
+        )
         if _commit:
             db.session.commit()
 
-        return len(updated_tokens)
+    @staticmethod
+    def schedule_renumbering(corpus_id: int, force: bool = False) -> Optional[Job]:
+        """ Enqueue the renumbering of the tokens of a corpus (see the corpus.renumber task) once too many positions
+        were shifted, unless one is already queued or running
+
+        :param corpus_id: identifier of the corpus
+        :param force: Renumber the corpus however few positions were shifted
+        :return: Renumbering job of the corpus, None when it does not need one
+        """
+        if not force:
+            shifts = TokenOrderShift.query.filter(TokenOrderShift.corpus_id == corpus_id).count()
+            if shifts <= WordToken.ORDER_ID_MAX_SHIFTS:
+                return None
+        return Job.enqueue_once("corpus.renumber", corpus_id=corpus_id)
+
+    @staticmethod
+    def stitch_contexts(
+            corpus_id: int,
+            context_left: int,
+            context_right: int,
+            chunk_size: int = 1000,
+            _commit: bool = False
+    ) -> int:
+        """ Recompute the contexts of a corpus in one streaming pass and only write the tokens whose context
+        changed, such as the tokens at the boundaries of uploaded chunks.
+
+        :param corpus_id: identifier of the corpus
+        :param context_left: left context length
+        :param context_right: right context length
+        :param chunk_size: Number of tokens read and written at once
+        :param _commit: Autocommit
+        :return: Number of tokens updated
+        """
+        rows = iter_keyset(
+            db.session.query(
+                WordToken.id, WordToken.order_id, WordToken.form, WordToken.left_context, WordToken.right_context
+            ).filter(WordToken.corpus == corpus_id),
+            keys=(WordToken.order_id, WordToken.id),
+            chunk_size=chunk_size
+        )
+        updated, buffer = 0, []
+        for token, left_context, right_context in sliding_contexts(
+                rows, context_left, context_right, get_form=lambda row: row.form):
+            if token.left_context != left_context or token.right_context != right_context:
+                buffer.append(dict(id=token.id, left_context=left_context, right_context=right_context))
+            if len(buffer) >= chunk_size:
+                db.session.bulk_update_mappings(WordToken, buffer)
+                updated += len(buffer)
+                buffer = []
+        if buffer:
+            db.session.bulk_update_mappings(WordToken, buffer)
+            updated += len(buffer)
+
+        if _commit:
+            db.session.commit()
+        return updated
 
     @staticmethod
     def to_input_format(query):
@@ -1392,13 +1853,35 @@ class WordToken(db.Model):
         :return: String representation of the data
         """
         csv_file = io.StringIO()
-        writer = csv.writer(csv_file, **TSV_CONFIG)
-        writer.writerow(["token_id", "form", "lemma", "POS", "morph"])
-        for token in query.order_by(WordToken.order_id).all():
-            writer.writerow([token.id, token.form, token.lemma, token.POS or "_", token.morph or "_"])
-
+        WordToken.write_input_format(query, csv_file)
         return csv_file.getvalue()
 
+    @staticmethod
+    def write_input_format(query, file, chunk_size: Optional[int] = None) -> int:
+        """ Writes query results in the input format to a file as they are read
+
+        Rows are fetched by chunks of chunk_size (with a server-side cursor on PostgreSQL), so that memory does not
+        grow with the size of the corpus.
+
+        .. note:: OrderBy is done inside the function
+
+        :param query: List of tokens from a query
+        :type query: WordToken.query
+        :param file: Text file to write to
+        :param chunk_size: Number of rows fetched at once (Defaults to WordToken.INSERT_BATCH_SIZE)
+        :return: Number of tokens written
+        """
+        writer = csv.writer(file, **TSV_CONFIG)
+        writer.writerow(["token_id", "form", "lemma", "POS", "morph"])
+        count = 0
+        rows = query.with_entities(
+            WordToken.id, WordToken.form, WordToken.lemma, WordToken.POS, WordToken.morph
+        ).order_by(WordToken.order_id).yield_per(chunk_size or WordToken.INSERT_BATCH_SIZE)
+        for token_id, form, lemma, POS, morph in rows:
+            writer.writerow([token_id, form, lemma, POS or "_", morph or "_"])
+            count += 1
+        return count
+
     @staticmethod
     def update(user_id, corpus_id, token_id, lemma=None, POS=None, morph=None, form=None, gloss=None):
         """ Update a given token with lemma, POS and morph value
@@ -1423,7 +1906,7 @@ class WordToken(db.Model):
         :rtype: (WordToken, ChangeRecord)
         """
         user = User.query.filter_by(**{"id": user_id}).first_or_404()
-        corpus = Corpus.query.filter_by(**{"id": corpus_id}).first_or_404()
+        corpus = Corpus.get_or_404(corpus_id)
         token = WordToken.query.filter_by(**{"id": token_id, "corpus": corpus_id}).first_or_404()
         # Strip if things are not None
         form = strip_or_none(form)
@@ -1457,21 +1940,145 @@ class WordToken(db.Model):
             morph = token.morph
 
         record = ChangeRecord.track(user, token, lemma, POS, morph, gloss_new=gloss)
+        SimilarCount.move(corpus.id, [(
+            (token.form, token.lemma, token.POS, token.morph), (token.form, lemma, POS, morph)
+        )])
         token.lemma = lemma
         token.label_uniform = unidecode.unidecode(lemma) if lemma else None
         token.POS = POS
         token.morph = morph
         token.gloss = gloss
         db.session.add(token)
+        corpus.update_validity([token.id])
         db.session.commit()
         return token, record
 
+    @staticmethod
+    def update_many(user_id: int, corpus_id: int, corrections: List[Dict[str, Optional[str]]]) -> List[dict]:
+        """ Update many tokens of a corpus at once. Tokens are loaded with a single query, validated against
+        the same allowed values, change records are inserted in bulk and everything is committed once.
+
+        Each correction is a dictionary with a token_id key and optional lemma, POS, morph, form and gloss keys,
+        whose values are strings or None.
+        As in :meth:`update`, a missing lemma, POS or morph keeps the current value. A missing gloss key keeps
+        the current gloss while an explicit empty gloss clears it.
+
+        :param user_id: ID of the user who performs the update
+        :param corpus_id: Id of the corpus
+        :param corrections: List of corrections
+        :return: Status of each correction, in the same order
+        """
+        corpus = Corpus.get_or_404(corpus_id)
+
+        token_ids = []
+        for correction in corrections:
+            try:
+                token_ids.append(int(correction.get("token_id")))
+            except (TypeError, ValueError):
+                token_ids.append(None)
+
+        known_ids = list({token_id for token_id in token_ids if token_id is not None})
+        tokens = {}
+        for start in range(0, len(known_ids), 500):
+            tokens.update({
+                token.id: token
+                for token in WordToken.query.filter(
+                    WordToken.corpus == corpus_id,
+                    WordToken.id.in_(known_ids[start:start+500])
+                )
+            })
+
+        validator = corpus.get_validator()
+        columns = corpus.displayed_columns_by_name
+        already_corrected = ChangeRecord.corrected_columns_by_token(tokens.keys())
+        contexts = corpus.get_contexts(list(tokens.values()))
+        records = []
+        moves = []
+        deltas = {"changes": 0, "lemma_changed": 0, "POS_changed": 0, "morph_changed": 0}
+        statuses = []
+
+        for token_id, correction in zip(token_ids, corrections):
+            token = tokens.get(token_id)
+            if token is None:
+                statuses.append({"token_id": correction.get("token_id"), "status": False,
+                                 "message": "Token not found"})
+                continue
+
+            wrong_types = [
+                key for key in ("form", "lemma", "POS", "morph", "gloss")
+                if correction.get(key) is not None and not isinstance(correction[key], str)
+            ]
+            if wrong_types:
+                statuses.append({"token_id": token_id, "status": False,
+                                 "message": "Invalid value in {}".format(", ".join(wrong_types)),
+                                 "details": {key: False for key in wrong_types}, "new-values": wrong_types})
+                continue
+
+            form = strip_or_none(correction.get("form"))
+            lemma = strip_or_none(correction.get("lemma"))
+            POS = strip_or_none(correction.get("POS"))
+            morph = strip_or_none(correction.get("morph"))
+            gloss = strip_or_none(correction.get("gloss")) or None if "gloss" in correction else token.gloss
+
+            validity = validator.validate(lemma=lemma, POS=POS, morph=morph, form=form or token.form, columns=columns)
+            invalid_columns = [key for key, valid in validity.items() if valid is False]
+            if invalid_columns:
+                statuses.append({"token_id": token_id, "status": False,
+                                 "message": "Invalid value in {}".format(", ".join(invalid_columns)),
+                                 "details": validity, "new-values": invalid_columns})
+                continue
+
+            lemma = lemma or token.lemma
+            POS = POS or token.POS
+            morph = morph or token.morph
+            if token.lemma == lemma and token.POS == POS and token.morph == morph and token.gloss == gloss:
+                statuses.append({"token_id": token_id, "status": False, "message": "No value where changed"})
+                continue
+
+            records.append(dict(
+                user_id=user_id,
+                corpus=corpus_id, word_token_id=token.id,
+                form=token.form, lemma=token.lemma, POS=token.POS, morph=token.morph, gloss=token.gloss,
+                lemma_new=lemma, POS_new=POS, morph_new=morph, gloss_new=gloss
+            ))
+            deltas["changes"] += 1
+            for col in ChangeRecord.columns_corrected_by(token, lemma, POS, morph):
+                if not already_corrected[token.id][col]:
+                    already_corrected[token.id][col] = True
+                    deltas[col + "_changed"] += 1
+            moves.append(((token.form, token.lemma, token.POS, token.morph), (token.form, lemma, POS, morph)))
+
+            token.lemma = lemma
+            token.label_uniform = unidecode.unidecode(lemma) if lemma else None
+            token.POS = POS
+            token.morph = morph
+            token.gloss = gloss
+            statuses.append({"token_id": token_id, "status": True,
+                             "token": token.to_dict(context=contexts[token.id])})
+
+        if records:
+            db.session.bulk_insert_mappings(ChangeRecord, records)
+            CorpusStats.increment(corpus_id, **deltas)
+            SimilarCount.move(corpus_id, moves)
+            corpus.update_validity([record["word_token_id"] for record in records])
+        db.session.commit()
+        return statuses
+
     @property
     def context(self):
         """ Reformed version of former code for the context column"""
+        return self.format_context()
+
+    def format_context(self, context: Optional[Tuple[str, str]] = None) -> str:
+        """ Context of the token as a single string
+
+        :param context: Left and right contexts of the token (see Corpus.get_contexts), defaults to the
+                        stored ones
+        """
+        left, right = context or (self.left_context, self.right_context)
         return " ".join([
             tok
-            for tok in [self.left_context, self.form, self.right_context]
+            for tok in [left, self.form, right]
             if tok
         ])
 
@@ -1598,6 +2205,290 @@ class TokenHistory(db.Model):
     user = db.relationship(User, lazy='select')
 
 
+class TokenOrderShift(db.Model):
+    """ Insertion (delta of 1) or deletion (delta of -1) of a token since the last renumbering of a corpus,
+    which shifts the position of the tokens from its order id
+
+    :param corpus_id: ID of the corpus
+    :param order_id: Order id of the token inserted or deleted
+    :param delta: Shift of the positions
+    """
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    corpus_id = db.Column(db.Integer, db.ForeignKey('corpus.id', ondelete="CASCADE"), nullable=False)
+    order_id = db.Column(db.BigInteger, nullable=False)
+    delta = db.Column(db.SmallInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('ix_token_order_shift_corpus_order', 'corpus_id', 'order_id'),
+    )
+
+
+class SimilarCount(db.Model):
+    """ Number of tokens of a corpus sharing a form and the values of some of the lemma, POS and morph columns,
+    so that similar tokens are counted by reading a few rows instead of joining the corpus on itself.
+
+    ``mask`` tells which columns are part of the signature (1 for lemma, 2 for POS, 4 for morph), the other
+    ones are NULL. Tokens with a NULL value in a column of the signature are not counted, as NULL never equals
+    NULL in SQL. Counts are built by a job on first read (see Corpus.similar_counts_ready), reads computing the
+    counts of their forms meanwhile, and then moved from a signature to another by the token edition methods.
+
+    :param corpus_id: ID of the corpus
+    :param mask: Columns of the signature
+    :param form: Form of the tokens
+    :param count: Number of tokens having the signature
+    """
+    COLUMNS = ("lemma", "POS", "morph")
+    MASKS = range(1, 2 ** len(COLUMNS))
+    MOVE_BATCH_SIZE = 500
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    corpus_id = db.Column(db.Integer, db.ForeignKey('corpus.id', ondelete="CASCADE"), nullable=False)
+    mask = db.Column(db.SmallInteger, nullable=False)
+    form = db.Column(db.String(128), nullable=False)
+    lemma = db.Column(db.String(128), nullable=True)
+    POS = db.Column(db.String(128), nullable=True)
+    morph = db.Column(db.String(1024), nullable=True)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('ix_similar_count_corpus_form', 'corpus_id', 'form'),
+    )
+
+    @staticmethod
+    def key_columns(table) -> list:
+        """ Columns of the unique key of the counts. Columns which are not part of the signature are NULL, which
+        unique indexes tell apart, hence the coalesce: the mask already tells which ones are NULL.
+
+        :param table: Table of the counts
+        """
+        return [table.c.corpus_id, table.c.mask, table.c.form] + [
+            func.coalesce(table.c[col], literal_column("''")) for col in SimilarCount.COLUMNS
+        ]
+
+    @staticmethod
+    def key(form: str, **values: Optional[str]) -> Optional[Tuple]:
+        """ Key of the row counting tokens of form with the given values, None when a value is NULL
+
+        :param form: Form of the tokens
+        :param values: Values of some of the lemma, POS and morph columns
+        """
+        if any(value is None for value in values.values()):
+            return None
+        mask = sum(2 ** index for index, col in enumerate(SimilarCount.COLUMNS) if col in values)
+        return (mask, form) + tuple(values.get(col) for col in SimilarCount.COLUMNS)
+
+    @staticmethod
+    def signatures(form: str, lemma: Optional[str], POS: Optional[str], morph: Optional[str]) -> List[Tuple]:
+        """ Keys of every row counting a token """
+        values = {"lemma": lemma, "POS": POS, "morph": morph}
+        keys = [
+            SimilarCount.key(form, **{
+                col: values[col] for index, col in enumerate(SimilarCount.COLUMNS) if mask & 2 ** index
+            })
+            for mask in SimilarCount.MASKS
+        ]
+        return [key for key in keys if key is not None]
+
+    @staticmethod
+    def is_ready(corpus_id: int) -> bool:
+        return bool(db.session.query(Corpus.similar_counts_ready).filter(Corpus.id == corpus_id).scalar())
+
+    @staticmethod
+    def invalidate(corpus_id: int):
+        """ Mark the counts of a corpus as stale, they are rebuilt after the next read
+
+        :param corpus_id: ID of the corpus
+        """
+        Corpus.query.filter(Corpus.id == corpus_id).update(
+            {Corpus.similar_counts_ready: False}, synchronize_session=False
+        )
+
+    @staticmethod
+    def _aggregates(corpus_id: int, *filters) -> Iterator[sqlalchemy.Select]:
+        """ Selects counting the tokens of a corpus per signature, one per mask, in the columns of the counts
+
+        :param corpus_id: ID of the corpus
+        :param filters: Conditions on the tokens counted
+        """
+        for mask in SimilarCount.MASKS:
+            columns = [
+                getattr(WordToken, col) if mask & 2 ** index else None
+                for index, col in enumerate(SimilarCount.COLUMNS)
+            ]
+            used = [WordToken.form] + [col for col in columns if col is not None]
+            yield sqlalchemy.select(
+                literal(corpus_id), literal(mask), WordToken.form,
+                *[sqlalchemy.null() if col is None else col for col in columns],
+                func.count(WordToken.id)
+            ).where(
+                WordToken.corpus == corpus_id,
+                *[col.isnot(None) for col in used[1:]],
+                *filters
+            ).group_by(*used)
+
+    @staticmethod
+    def rebuild(corpus_id: int, _commit: bool = True):
+        """ Recompute every count of a corpus with one aggregate per mask. The corpus is locked meanwhile, so that
+        concurrent rebuilds run one after the other.
+
+        :param corpus_id: ID of the corpus
+        :param _commit: Autocommit
+        """
+        Corpus.lock(corpus_id)
+        SimilarCount.query.filter(SimilarCount.corpus_id == corpus_id).delete(synchronize_session=False)
+        for aggregate in SimilarCount._aggregates(corpus_id):
+            db.session.execute(
+                sqlalchemy.insert(SimilarCount).from_select(
+                    ["corpus_id", "mask", "form", *SimilarCount.COLUMNS, "count"], aggregate
+                )
+            )
+        Corpus.query.filter(Corpus.id == corpus_id).update(
+            {Corpus.similar_counts_ready: True}, synchronize_session=False
+        )
+        if _commit:
+            db.session.commit()
+
+    @staticmethod
+    def count_forms(corpus_id: int, forms: List[str]) -> "SimilarCounts":
+        """ Count the tokens of some forms per signature from the tokens themselves, without the stored counts
+
+        :param corpus_id: ID of the corpus
+        :param forms: Forms to count
+        """
+        counts = SimilarCounts()
+        for start in range(0, len(forms), 500):
+            for aggregate in SimilarCount._aggregates(corpus_id, WordToken.form.in_(forms[start:start+500])):
+                for _, mask, form, *values, count in db.session.execute(aggregate):
+                    key = (mask, form, *values)
+                    counts[key] = counts.get(key, 0) + count
+        return counts
+
+    @staticmethod
+    def move(corpus_id: int, changes: Iterable[Tuple[Optional[Tuple], Optional[Tuple]]]):
+        """ Move tokens from a signature to another, does nothing when the counts have not been built yet
+
+        :param corpus_id: ID of the corpus
+        :param changes: Pairs of (form, lemma, POS, morph) before and after the change of a token, None for
+                        a token which did not exist before or does not exist anymore
+        """
+        if not SimilarCount.is_ready(corpus_id):
+            return
+        deltas = {}
+        for old, new in changes:
+            if old == new:
+                continue
+            for signature, delta in ((old, -1), (new, 1)):
+                for key in SimilarCount.signatures(*signature) if signature else []:
+                    deltas[key] = deltas.get(key, 0) + delta
+
+        deltas = [(key, delta) for key, delta in deltas.items() if delta]
+        for start in range(0, len(deltas), SimilarCount.MOVE_BATCH_SIZE):
+            SimilarCount._apply_deltas(corpus_id, dict(deltas[start:start+SimilarCount.MOVE_BATCH_SIZE]))
+
+    @staticmethod
+    def _apply_deltas(corpus_id: int, deltas: Dict[Tuple, int]):
+        """ Add deltas to the counts of some keys with one statement for existing rows and one for new ones
+
+        :param corpus_id: ID of the corpus
+        :param deltas: Delta of each key
+        """
+        existing = {}
+        for row in db.session.query(SimilarCount.id, SimilarCount.mask, SimilarCount.form, *[
+            getattr(SimilarCount, col) for col in SimilarCount.COLUMNS
+        ]).filter(
+            SimilarCount.corpus_id == corpus_id,
+            SimilarCount.form.in_({form for _, form, *_ in deltas})
+        ):
+            existing[tuple(row[1:])] = row.id
+
+        updates = [(existing[key], delta) for key, delta in deltas.items() if key in existing]
+        if updates and db.session.get_bind().dialect.name == "postgresql":
+            values = sqlalchemy.values(
+                sqlalchemy.column("id", db.Integer), sqlalchemy.column("delta", db.Integer), name="deltas"
+            ).data(updates)
+            db.session.execute(
+                sqlalchemy.update(SimilarCount)
+                .where(SimilarCount.id == values.c.id)
+                .values(count=SimilarCount.count + values.c.delta)
+                .execution_options(synchronize_session=False)
+            )
+        elif updates:
+            db.session.connection().execute(
+                sqlalchemy.update(SimilarCount.__table__)
+                .where(SimilarCount.__table__.c.id == sqlalchemy.bindparam("row_id"))
+                .values(count=SimilarCount.__table__.c.count + sqlalchemy.bindparam("delta")),
+                [{"row_id": row_id, "delta": delta} for row_id, delta in updates]
+            )
+
+        columns = ["corpus_id", "mask", "form", *SimilarCount.COLUMNS, "count"]
+        created = [
+            (corpus_id, *key, delta)
+            for key, delta in deltas.items()
+            if key not in existing and delta > 0
+        ]
+        if created and db.session.get_bind().dialect.name == "postgresql":
+            # Another transaction may have created the same keys in the meantime
+            insert = postgresql.insert(SimilarCount.__table__)
+            db.session.execute(
+                insert.on_conflict_do_update(
+                    index_elements=SimilarCount.key_columns(SimilarCount.__table__),
+                    set_={"count": SimilarCount.__table__.c.count + insert.excluded.count}
+                ),
+                [dict(zip(columns, row)) for row in created]
+            )
+        else:
+            bulk_insert(db.session.connection(), SimilarCount.__table__, columns, created)
+
+    @staticmethod
+    def for_forms(corpus_id: int, forms: Iterable[str]) -> "SimilarCounts":
+        """ Read every count of some forms. When the counts of the corpus are not built, their job is enqueued
+        and the counts of the forms are computed from the tokens until it is over.
+
+        :param corpus_id: ID of the corpus
+        :param forms: Forms to read the counts of
+        """
+        forms = list(set(forms))
+        if not SimilarCount.is_ready(corpus_id):
+            Job.enqueue_once("corpus.similar_counts", corpus_id=corpus_id)
+            if not SimilarCount.is_ready(corpus_id):
+                return SimilarCount.count_forms(corpus_id, forms)
+        counts = SimilarCounts()
+        for start in range(0, len(forms), 500):
+            for row in SimilarCount.query.filter(
+                SimilarCount.corpus_id == corpus_id,
+                SimilarCount.form.in_(forms[start:start+500])
+            ):
+                key = (row.mask, row.form) + tuple(getattr(row, col) for col in SimilarCount.COLUMNS)
+                counts[key] = counts.get(key, 0) + row.count
+        return counts
+
+
+db.Index('uq_similar_count_key', *SimilarCount.key_columns(SimilarCount.__table__), unique=True)
+
+
+class SimilarCounts(dict):
+    """ Counts read by :meth:`SimilarCount.for_forms`, indexed by key """
+
+    def count(self, form: str, **values: Optional[str]) -> int:
+        """ Number of tokens of form with all the given values, 0 when one of them is NULL """
+        key = SimilarCount.key(form, **values)
+        return self.get(key, 0) if key is not None else 0
+
+    def count_any(self, form: str, base: Dict[str, Optional[str]], alternatives: Dict[str, Optional[str]]) -> int:
+        """ Number of tokens of form with all the base values and at least one of the alternative values,
+        by inclusion-exclusion over the counts of every combination of alternatives
+
+        :param form: Form of the tokens
+        :param base: Values every token must have
+        :param alternatives: Values of which tokens must have at least one
+        """
+        total = 0
+        for size in range(1, len(alternatives) + 1):
+            for combination in combinations(alternatives.items(), size):
+                total += (-1) ** (size + 1) * self.count(form, **{**base, **dict(combination)})
+        return total
+
+
 class CorpusCustomDictionary(db.Model):
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -1627,6 +2518,20 @@ class CorpusCustomDictionary(db.Model):
     def POS_preproc(string: str, corpus: int) -> Dict[str, str]:
         return {"label": string, "corpus": corpus, "secondary_label": "", "category": "POS"}
 
+    @staticmethod
+    def get_values(corpus_id: int) -> AllowedValues:
+        """ Read every label of the custom dictionary of a corpus
+
+        :param corpus_id: Id of the corpus
+        """
+        values = {"lemma": set(), "POS": set(), "morph": set()}
+        for label, category in db.session.query(
+                CorpusCustomDictionary.label, CorpusCustomDictionary.category
+        ).filter(CorpusCustomDictionary.corpus == corpus_id):
+            if category in values:
+                values[category].add(label)
+        return AllowedValues(**{category: frozenset(labels) for category, labels in values.items()})
+
     @staticmethod
     def get_like(corpus_id, form, group_by, category="lemma"):
         """ Get values starting with given form
@@ -1703,6 +2608,31 @@ class CorpusCustomDictionary(db.Model):
         return query
 
 
+    @staticmethod
+    def search_morph(corpus: Corpus, form: str, limit: int) -> List[Tuple[str, Optional[str]]]:
+        """ Find morph of the custom dictionary whose label or secondary label contains every word of form
+
+        Results are the same as CorpusCustomDictionary.get_like() on morph, read from an inverted index of the
+        dictionary which is rebuilt when the custom dictionary version of the corpus changes.
+
+        :param corpus: Corpus whose custom dictionary is searched
+        :param form: Words to search for
+        :param limit: Maximum number of values
+        :return: (label, secondary label) of the morph
+        """
+        index = AUTOCOMPLETE_CACHE.get_versioned(
+            ("corpus", corpus.id, "morph"), (corpus.created_at, corpus.custom_dictionary_version),
+            lambda: (FragmentIndex(
+                db.session.query(CorpusCustomDictionary.label, CorpusCustomDictionary.secondary_label).filter(
+                    CorpusCustomDictionary.corpus == corpus.id,
+                    CorpusCustomDictionary.category == "morph"
+                ).all(),
+                fields=(0, 1)
+            ), )
+        )[0]
+        return index.search(form.split(), limit)
+
+
 class ChangeRecord(db.Model):
     """ A change record keep track of lemma, POS or morph that have been changed for a particular form"""
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
@@ -1730,7 +2660,20 @@ class ChangeRecord(db.Model):
         :return: Count similar token that look like the original form of the token recorded
         :rtype: int
         """
-        return WordToken.get_similar_to_record(self).count()
+        changed = self.changed
+        if "gloss" in changed:
+            # Glosses are not part of the precomputed counts
+            return WordToken.get_similar_to_record(self).count()
+
+        # Same conditions as WordToken.get_similar_to_record
+        counts = SimilarCount.for_forms(self.corpus, [self.form])
+        alternatives = {attr: getattr(self, attr) for attr in changed}
+        if "lemma" in changed:
+            # Tokens still having the old lemma all match, tokens having the new one match on another value
+            del alternatives["lemma"]
+            return counts.count(self.form, lemma=self.lemma) \
+                + counts.count_any(self.form, {"lemma": self.lemma_new}, alternatives)
+        return counts.count_any(self.form, {"lemma": self.lemma}, alternatives)
 
     @staticmethod
     def track(user, token, lemma_new, POS_new, morph_new, gloss_new=None):
@@ -1749,6 +2692,13 @@ class ChangeRecord(db.Model):
         :return: Change Record history item
         :rtype: ChangeRecord
         """
+        corrected = ChangeRecord.columns_corrected_by(token, lemma_new, POS_new, morph_new)
+        deltas = {"changes": 1}
+        if corrected:
+            already_corrected = ChangeRecord.corrected_columns(token.id)
+            deltas.update({col + "_changed": 1 for col in corrected if not already_corrected[col]})
+        CorpusStats.increment(token.corpus, **deltas)
+
         tracked = ChangeRecord(
             user_id=user.id,
             corpus=token.corpus, word_token_id=token.id,
@@ -1775,28 +2725,257 @@ class ChangeRecord(db.Model):
     def apply_changes_to(self, user_id, token_ids):
         """ Apply the changes recorded by this instance to other tokens
 
+        New values are validated once. Each changed attribute is then set by a single UPDATE on the tokens which
+        still have the recorded old value, and the change records of the tokens are inserted in bulk, all in one
+        transaction. Tokens having none of the old values are left untouched.
+
         :param user_id: The ID of the user performing the change
         :type user_id: int
         :param token_ids: List of tokens ID to be updated
         :type token_ids: [str]
         :return: List of updated tokens
         """
-        changed = []
         if not len(token_ids):
-            return changed
-        watch = {attr: (getattr(self, attr), getattr(self, attr+"_new")) for attr in self.changed}
-        for token in db.session.query(WordToken).filter(
-            db.and_(
-                WordToken.id.in_(tuple([int(i) for i in token_ids])),
-                WordToken.corpus == self.corpus
-            )
-        ).all():
-            apply = {"user_id": user_id, "token_id": token.id, "corpus_id": token.corpus}
-            apply.update({attr: val[1] for attr, val in watch.items() if val[0] == getattr(token, attr)})
-            WordToken.update(**apply)
-            changed.append(token)
+            return []
+        token_ids = list({int(i) for i in token_ids})
+        corpus = db.session.get(Corpus, self.corpus)
+        # As in WordToken.update, an empty lemma, POS or morph never replaces the current value
+        watch = {
+            attr: (getattr(self, attr), getattr(self, attr+"_new"))
+            for attr in self.changed
+            if attr == "gloss" or getattr(self, attr+"_new")
+        }
+
+        validity = WordToken.is_valid(
+            form=self.form, corpus=corpus,
+            **{attr: watch[attr][1] if attr in watch else None for attr in ("lemma", "POS", "morph")}
+        )
+        invalid_columns = [key for key, valid in validity.items() if valid is False]
+        if invalid_columns:
+            error_msg = "Invalid value in {}".format(", ".join(invalid_columns))
+            error = WordToken.ValidityError(error_msg)
+            error.msg = error_msg
+            error.statuses = validity
+            error.invalid_columns = invalid_columns
+            raise error
+
+        columns = ("form", "lemma", "POS", "morph", "gloss")
+        tokens = []
+        for start in range(0, len(token_ids), 500):
+            tokens.extend(db.session.query(WordToken.id, *[getattr(WordToken, col) for col in columns]).filter(
+                WordToken.corpus == self.corpus,
+                WordToken.id.in_(token_ids[start:start+500])
+            ))
+        already_corrected = ChangeRecord.corrected_columns_by_token([token.id for token in tokens])
+
+        records, moves = [], []
+        deltas = {"changes": 0, "lemma_changed": 0, "POS_changed": 0, "morph_changed": 0}
+        updated = {attr: [] for attr in watch}
+        for token in tokens:
+            new = {col: getattr(token, col) for col in columns}
+            for attr, (old, new_value) in watch.items():
+                if getattr(token, attr) == old:
+                    new[attr] = new_value
+                    updated[attr].append(token.id)
+            if all(new[col] == getattr(token, col) for col in columns):
+                continue
+
+            records.append(dict(
+                user_id=user_id,
+                corpus=self.corpus, word_token_id=token.id,
+                **{col: getattr(token, col) for col in columns},
+                **{col + "_new": new[col] for col in columns if col != "form"}
+            ))
+            deltas["changes"] += 1
+            for col in ChangeRecord.columns_corrected_by(token, new["lemma"], new["POS"], new["morph"]):
+                if not already_corrected[token.id][col]:
+                    deltas[col + "_changed"] += 1
+            moves.append((
+                (token.form, token.lemma, token.POS, token.morph),
+                (token.form, new["lemma"], new["POS"], new["morph"])
+            ))
+
+        for attr, (old, new_value) in watch.items():
+            values = {getattr(WordToken, attr): new_value}
+            if attr == "lemma":
+                values[WordToken.label_uniform] = unidecode.unidecode(new_value)
+            for start in range(0, len(updated[attr]), 500):
+                WordToken.query.filter(
+                    WordToken.id.in_(updated[attr][start:start+500]),
+                    getattr(WordToken, attr) == old
+                ).update(values, synchronize_session=False)
+
+        if records:
+            db.session.bulk_insert_mappings(ChangeRecord, records)
+            CorpusStats.increment(self.corpus, **deltas)
+            SimilarCount.move(self.corpus, moves)
+            corpus.update_validity([record["word_token_id"] for record in records])
+        db.session.commit()
+
+        changed_ids = [record["word_token_id"] for record in records]
+        changed = []
+        for start in range(0, len(changed_ids), 500):
+            changed.extend(WordToken.query.filter(WordToken.id.in_(changed_ids[start:start+500])))
         return changed
 
+    @staticmethod
+    def columns_corrected_by(token: "WordToken", lemma_new, POS_new, morph_new) -> List[str]:
+        """ List the annotation columns a change record would count as corrected
+
+        :param token: Token before the change
+        :return: List of column names
+        """
+        new_values = {"lemma": lemma_new, "POS": POS_new, "morph": morph_new}
+        # Same semantic as SQL inequality: NULL values are never counted as a change
+        return [
+            col for col, value in new_values.items()
+            if value is not None and getattr(token, col) is not None and getattr(token, col) != value
+        ]
+
+    @staticmethod
+    def corrected_columns_by_token(token_ids: Iterable[int]) -> Dict[int, Dict[str, bool]]:
+        """ Check which annotation columns of tokens have already been corrected at least once
+
+        :param token_ids: IDs of the tokens
+        :return: Dictionary of lemma, POS and morph booleans for each token ID
+        """
+        columns = ("lemma", "POS", "morph")
+        token_ids = list(token_ids)
+        corrected = {token_id: {col: False for col in columns} for token_id in token_ids}
+        for start in range(0, len(token_ids), 500):
+            for token_id, *counts in db.session.query(ChangeRecord.word_token_id, *[
+                func.count(case((getattr(ChangeRecord, col) != getattr(ChangeRecord, col + "_new"), 1)))
+                for col in columns
+            ]).filter(
+                ChangeRecord.word_token_id.in_(token_ids[start:start+500])
+            ).group_by(ChangeRecord.word_token_id):
+                corrected[token_id] = {col: bool(count) for col, count in zip(columns, counts)}
+        return corrected
+
+    @staticmethod
+    def corrected_columns(token_id: int) -> Dict[str, bool]:
+        """ Check which annotation columns of a token have already been corrected at least once
+
+        :param token_id: ID of the token
+        :return: Dictionary of lemma, POS and morph booleans
+        """
+        return ChangeRecord.corrected_columns_by_token([token_id])[token_id]
+
+
+class CorpusStats(db.Model):
+    """ Materialized statistics of a corpus, maintained incrementally by the token edition methods
+    so that the information page and the browse API read one row instead of scanning the corpus.
+
+    A missing row is built on first read. ``unallowed`` is reset to NULL whenever it cannot
+    be maintained incrementally (new tokens, control list or column changes) and is recomputed on read.
+    """
+    corpus_id = db.Column(db.Integer, db.ForeignKey("corpus.id", ondelete="CASCADE"), primary_key=True)
+    changes = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    forms_edited = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    lemma_changed = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    POS_changed = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    morph_changed = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    needs_review = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    unallowed = db.Column(db.Integer, nullable=True)
+
+    @staticmethod
+    def increment(corpus_id: int, **deltas: int):
+        """ Apply deltas to the counters of a corpus. Does nothing when the row has not been built yet,
+        it will then be built from scratch on first read.
+
+        :param corpus_id: ID of the corpus
+        :param deltas: Counter name and value to add
+        """
+        deltas = {key: value for key, value in deltas.items() if value}
+        if not deltas:
+            return
+        CorpusStats.query.filter(CorpusStats.corpus_id == corpus_id).update(
+            {getattr(CorpusStats, key): getattr(CorpusStats, key) + value for key, value in deltas.items()},
+            synchronize_session=False
+        )
+
+    @staticmethod
+    def invalidate_unallowed(corpus_id: Optional[int] = None, control_list_id: Optional[int] = None):
+        """ Mark the unallowed counter as stale for a corpus or for every corpus using a control list
+
+        :param corpus_id: ID of the corpus
+        :param control_list_id: ID of the control list
+        """
+        query = CorpusStats.query
+        if corpus_id is not None:
+            query = query.filter(CorpusStats.corpus_id == corpus_id)
+        if control_list_id is not None:
+            query = query.filter(CorpusStats.corpus_id.in_(
+                db.session.query(Corpus.id).filter(Corpus.control_lists_id == control_list_id)
+            ))
+        query.update({CorpusStats.unallowed: None}, synchronize_session=False)
+
+    @staticmethod
+    def _checked_columns(corpus: Corpus) -> List[str]:
+        return [col for col in ("lemma", "POS", "morph") if col in corpus.displayed_columns_by_name]
+
+    @staticmethod
+    def count_unallowed(corpus: Corpus) -> int:
+        """ Count the tokens of a corpus whose lemma, POS or morph is not accepted by the control list, as
+        listed by :meth:`Corpus.get_unallowed`, in the displayed columns
+
+        :param corpus: Corpus to count for
+        """
+        corpus.ensure_validity(_commit=False)
+        return corpus.count_invalid()
+
+    @staticmethod
+    def rebuild(corpus: Corpus, _commit: bool = True) -> "CorpusStats":
+        """ Recompute every counter of a corpus from the token, history and change tables
+
+        :param corpus: Corpus to rebuild
+        :param _commit: Autocommit
+        :return: Statistics row
+        """
+        def changed_tokens(col):
+            return db.session.query(func.count(db.distinct(ChangeRecord.word_token_id))).filter(
+                ChangeRecord.corpus == corpus.id,
+                getattr(ChangeRecord, col) != getattr(ChangeRecord, col + "_new")
+            ).scalar()
+
+        stats = db.session.get(CorpusStats, corpus.id) or CorpusStats(corpus_id=corpus.id)
+        stats.changes = db.session.query(func.count(ChangeRecord.id)).filter(
+            ChangeRecord.corpus == corpus.id
+        ).scalar()
+        stats.forms_edited = db.session.query(func.count(TokenHistory.id)).filter(
+            TokenHistory.corpus == corpus.id
+        ).scalar()
+        stats.lemma_changed = changed_tokens("lemma")
+        stats.POS_changed = changed_tokens("POS")
+        stats.morph_changed = changed_tokens("morph")
+        stats.needs_review = db.session.query(func.count(WordToken.id)).filter(
+            WordToken.corpus == corpus.id,
+            WordToken.needs_review == True
+        ).scalar()
+        stats.unallowed = CorpusStats.count_unallowed(corpus)
+        db.session.add(stats)
+        if _commit:
+            db.session.commit()
+        return stats
+
+    @staticmethod
+    def for_corpus(corpus: Corpus, _commit: bool = True) -> "CorpusStats":
+        """ Retrieve the statistics of a corpus, building the row or the stale counters if needed
+
+        :param corpus: Corpus to retrieve statistics for
+        :param _commit: Autocommit when something had to be computed
+        :return: Statistics row
+        """
+        recomputed = corpus.ensure_validity(_commit=False)
+        stats = db.session.get(CorpusStats, corpus.id)
+        if stats is None:
+            return CorpusStats.rebuild(corpus, _commit=_commit)
+        if stats.unallowed is None or recomputed:
+            stats.unallowed = CorpusStats.count_unallowed(corpus)
+            if _commit:
+                db.session.commit()
+        return stats
+
 
 class Bookmark(db.Model):
     corpus_id = db.Column(db.Integer, db.ForeignKey("corpus.id", ondelete='CASCADE'), primary_key=True)
@@ -1833,3 +3012,9 @@ class Favorite(db.Model):
     corpus_id = db.Column(db.Integer, db.ForeignKey("corpus.id", ondelete='CASCADE'), primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='CASCADE'), primary_key=True)
 
+
+@ControlLists.on_allowed_values_change
+def _revalidate_corpora(control_list: ControlLists, change):
+    """ Update the validity flags of the corpora using a control list whose allowed values changed """
+    for corpus in Corpus.query.filter(Corpus.control_lists_id == control_list.id):
+        corpus.apply_allowed_values_change(change)
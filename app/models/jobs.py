@@ -0,0 +1,315 @@
+# Base Python
+import json
+import logging
+import socket
+import os
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+# PIP Packages
+import sqlalchemy
+from flask import current_app
+# APP Logic
+from .. import db
+from ..utils import PyrrhaError
+# Models
+from .user import User
+
+
+logger = logging.getLogger(__name__)
+
+
+class Job(db.Model):
+    """ Long operation run by a worker process (see the ``run-worker`` command) instead of an HTTP request
+
+    Views enqueue jobs with :meth:`enqueue`. Workers claim the oldest queued job with :meth:`claim` and run it
+    with :meth:`run`: failed jobs are queued again after an increasing delay until they reach max_attempts.
+    Tasks report their progress with :meth:`report`, which is also where a cancellation request stops them.
+
+    When BACKGROUND_TASKS is disabled (eg. in tests), jobs are run as soon as they are enqueued.
+
+    :ivar task: Name of the task, see :meth:`register`
+    :ivar arguments: Keyword arguments of the task, stored as JSON
+    :ivar progress: Number of items processed, out of total when it is known
+    :ivar result: JSON serializable value returned by the task
+    """
+    QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+    FINISHED = (DONE, FAILED, CANCELLED)
+    #: Seconds before the first retry of a failed job, doubled after each attempt
+    RETRY_DELAY = 30
+    #: Seconds without report after which a running job is considered lost by its worker
+    STALE_AFTER = 900
+    MAX_ATTEMPTS = 3
+    #: Functions run for each task name
+    TASKS: Dict[str, Callable] = {}
+    #: Tasks which cannot be stopped once enqueued, see :meth:`register`
+    UNCANCELLABLE = set()
+    #: Functions called with the job when a job of a task ends, see :meth:`on_finish`
+    FINISH_HOOKS: Dict[str, Callable[["Job"], None]] = {}
+    #: Databases allowing a single writing transaction at a time, on which a separate connection could not write
+    #: the heartbeat of a task which already wrote
+    SINGLE_WRITER_DIALECTS = {"sqlite"}
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    task = db.Column(db.String(64), nullable=False)
+    args = db.Column(db.Text, nullable=False, default="{}")
+    status = db.Column(db.String(16), nullable=False, default=QUEUED)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=MAX_ATTEMPTS)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    error = db.Column(db.Text, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id, ondelete="SET NULL"), nullable=True)
+    # Not a foreign key: the job deleting a corpus outlives it
+    corpus_id = db.Column(db.Integer, nullable=True)
+    worker = db.Column(db.String(128), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    class Cancelled(PyrrhaError):
+        """ Raised in a running task when its job was cancelled """
+
+    @classmethod
+    def register(cls, name: str, cancellable: bool = True):
+        """ Register the decorated function as the task name. It is called with the job and its arguments.
+
+        :param name: Name of the task
+        :param cancellable: Whether jobs of the task can be cancelled. Tasks whose partial work cannot be left
+            as is (eg. committed by chunks) should not be.
+        """
+        def wrapper(func):
+            cls.TASKS[name] = func
+            if cancellable:
+                cls.UNCANCELLABLE.discard(name)
+            else:
+                cls.UNCANCELLABLE.add(name)
+            return func
+        return wrapper
+
+    @classmethod
+    def on_finish(cls, name: str):
+        """ Register the decorated function to be called with the job, in its transaction, whenever a job of the
+        task name ends: done, failed or cancelled, including when it is cancelled while queued or given up
+        once its worker is lost. Tasks use it to release what they hold for their whole run.
+
+        :param name: Name of the task
+        """
+        def wrapper(func):
+            cls.FINISH_HOOKS[name] = func
+            return func
+        return wrapper
+
+    @property
+    def arguments(self) -> dict:
+        return json.loads(self.args)
+
+    @property
+    def finished(self) -> bool:
+        return self.status in Job.FINISHED
+
+    @property
+    def cancellable(self) -> bool:
+        return self.task not in Job.UNCANCELLABLE and not self.finished
+
+    @staticmethod
+    def enqueue(task: str, user_id: Optional[int] = None, corpus_id: Optional[int] = None,
+                max_attempts: Optional[int] = None, **arguments) -> "Job":
+        """ Record a job to be run by a worker, or run it right away when BACKGROUND_TASKS is disabled
+
+        :param task: Name of the task
+        :param user_id: ID of the user who asked for the job
+        :param corpus_id: ID of the corpus the job works on, also passed to the task
+        :param max_attempts: Number of runs before the job is marked as failed
+        :param arguments: JSON serializable keyword arguments of the task
+        :return: Job, committed
+        """
+        if task not in Job.TASKS:
+            raise ValueError("Unknown task {}".format(task))
+        if corpus_id is not None:
+            arguments["corpus_id"] = corpus_id
+        job = Job(
+            task=task, args=json.dumps(arguments), user_id=user_id, corpus_id=corpus_id,
+            max_attempts=max_attempts or Job.MAX_ATTEMPTS
+        )
+        db.session.add(job)
+        db.session.commit()
+        if not current_app.config.get("BACKGROUND_TASKS", True):
+            job.max_attempts = 1
+            job.start("inline")
+            job.run()
+        return job
+
+    @staticmethod
+    def enqueue_once(task: str, corpus_id: int, **arguments) -> "Job":
+        """ Enqueue a job of a task on a corpus, unless one is already queued or running
+
+        :param task: Name of the task
+        :param corpus_id: ID of the corpus the job works on
+        :param arguments: Arguments of :meth:`enqueue`
+        :return: Job queued or running, or the new one
+        """
+        pending = Job.query.filter(
+            Job.task == task, Job.corpus_id == corpus_id, Job.status.in_((Job.QUEUED, Job.RUNNING))
+        ).order_by(Job.id).first()
+        return pending or Job.enqueue(task, corpus_id=corpus_id, **arguments)
+
+    @staticmethod
+    def worker_name() -> str:
+        return "{}:{}".format(socket.gethostname(), os.getpid())
+
+    def start(self, worker: str, _commit: bool = True):
+        self.status = Job.RUNNING
+        self.worker = worker
+        self.attempts = Job.attempts + 1
+        self.started_at = self.heartbeat_at = datetime.utcnow()
+        if _commit:
+            db.session.commit()
+
+    @staticmethod
+    def claim(worker: str) -> Optional["Job"]:
+        """ Mark the oldest job ready to run as running for worker. The status is changed only if it is still
+        queued, so that two workers never claim the same job.
+
+        :param worker: Name of the worker
+        :return: Claimed job, None when there is nothing to run
+        """
+        now = datetime.utcnow()
+        candidates = db.session.query(Job.id).filter(
+            Job.status == Job.QUEUED,
+            Job.run_after <= now
+        ).order_by(Job.run_after, Job.id).limit(10).all()
+        for (job_id, ) in candidates:
+            claimed = Job.query.filter(Job.id == job_id, Job.status == Job.QUEUED).update({
+                Job.status: Job.RUNNING, Job.worker: worker, Job.attempts: Job.attempts + 1,
+                Job.started_at: now, Job.heartbeat_at: now
+            }, synchronize_session=False)
+            db.session.commit()
+            if claimed:
+                return db.session.get(Job, job_id)
+        return None
+
+    @staticmethod
+    def requeue_stale(_commit: bool = True) -> int:
+        """ Queue again running jobs which did not report for STALE_AFTER seconds, as their worker is
+        probably gone
+
+        :return: Number of jobs queued again
+        """
+        stale = Job.query.filter(
+            Job.status == Job.RUNNING,
+            Job.heartbeat_at < datetime.utcnow() - timedelta(seconds=Job.STALE_AFTER)
+        ).all()
+        for job in stale:
+            job._retry_or_fail("The worker stopped reporting")
+        if _commit:
+            db.session.commit()
+        return len(stale)
+
+    def run(self):
+        """ Run the task of a claimed job and record how it ended """
+        try:
+            result = Job.TASKS[self.task](self, **self.arguments)
+        except Job.Cancelled:
+            db.session.rollback()
+            self._finish(Job.CANCELLED)
+        except Exception as exception:
+            db.session.rollback()
+            logger.exception("Job %s (%s) failed", self.id, self.task)
+            self._retry_or_fail("{}: {}".format(type(exception).__name__, exception))
+        else:
+            self._finish(Job.DONE, result=result)
+        db.session.commit()
+
+    def _finish(self, status: str, result=None):
+        self.status = status
+        self.result = json.dumps(result) if result is not None else None
+        self.finished_at = datetime.utcnow()
+        if self.task in Job.FINISH_HOOKS:
+            Job.FINISH_HOOKS[self.task](self)
+
+    def _retry_or_fail(self, error: str):
+        self.error = error
+        if self.attempts < self.max_attempts and not self.cancel_requested:
+            self.status = Job.QUEUED
+            self.run_after = datetime.utcnow() + timedelta(seconds=Job.RETRY_DELAY * 2 ** max(self.attempts - 1, 0))
+        else:
+            self._finish(Job.CANCELLED if self.cancel_requested else Job.FAILED)
+
+    def report(self, progress: int, total: Optional[int] = None):
+        """ Record the progress and the heartbeat of the running job. They are committed right away by a
+        connection of their own, so that they are seen (eg. by :meth:`requeue_stale`) while the transaction of
+        the task is still open, except on SINGLE_WRITER_DIALECTS where they are written with the changes of the
+        task. Raises :class:`Job.Cancelled` when the job was cancelled in the meantime.
+
+        :param progress: Number of items processed
+        :param total: Number of items to process
+        """
+        table = Job.__table__
+        values = {"progress": progress, "heartbeat_at": datetime.utcnow()}
+        if total is not None:
+            values["total"] = total
+        update = sqlalchemy.update(table).where(table.c.id == self.id).values(**values)
+        cancel_requested = sqlalchemy.select(table.c.cancel_requested).where(table.c.id == self.id)
+        if db.session.get_bind().dialect.name in Job.SINGLE_WRITER_DIALECTS:
+            db.session.execute(update)
+            cancelled = db.session.execute(cancel_requested).scalar()
+        else:
+            with db.engine.begin() as connection:
+                connection.execute(update)
+                cancelled = connection.execute(cancel_requested).scalar()
+        if cancelled:
+            raise Job.Cancelled()
+
+    def cancel(self, _commit: bool = True) -> bool:
+        """ Cancel a queued job right away, or ask a running one to stop at its next report
+
+        :return: Whether the job was cancelled or asked to stop
+        """
+        if not self.cancellable:
+            return False
+        if self.status == Job.QUEUED:
+            self.cancel_requested = True
+            self._finish(Job.CANCELLED)
+        elif self.status == Job.RUNNING:
+            self.cancel_requested = True
+        if _commit:
+            db.session.commit()
+        return True
+
+    def can_be_read_by(self, user: User) -> bool:
+        """ Jobs are visible to the user who enqueued them, to the users of their corpus and to administrators """
+        if user.is_admin() or (self.user_id is not None and self.user_id == user.id):
+            return True
+        if self.corpus_id is not None:
+            from .corpus import Corpus
+            return bool(Corpus.static_has_access(self.corpus_id, user))
+        return False
+
+    def can_be_cancelled_by(self, user: User) -> bool:
+        """ Jobs are cancelled by the user who enqueued them or by administrators """
+        return user.is_admin() or (self.user_id is not None and self.user_id == user.id)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "task": self.task,
+            "status": self.status,
+            "progress": self.progress,
+            "total": self.total,
+            "attempts": self.attempts,
+            "max_attempts": self.max_attempts,
+            "cancellable": self.cancellable,
+            "cancel_requested": self.cancel_requested,
+            "error": self.error,
+            "result": json.loads(self.result) if self.result else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
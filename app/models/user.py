@@ -221,5 +221,6 @@ login_manager.anonymous_user = AnonymousUser
 @login_manager.user_loader
 def load_user(user_id):
     db.session.rollback()
-    return db.session.get(User, int(user_id))
+    # The role is read by every permission check of the request
+    return db.session.get(User, int(user_id), options=[db.joinedload(User.role)])
 
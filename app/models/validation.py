@@ -0,0 +1,202 @@
+# Base Python
+from typing import Dict, FrozenSet, List, NamedTuple, Optional, Tuple
+# PIP Packages
+import regex as re
+import unidecode
+# Application imports
+from .. import db
+from ..utils.cache import LRUCache
+from ..utils.prefix_index import PrefixIndex
+from ..utils.fragment_index import FragmentIndex
+from .control_lists import ControlLists, AllowedLemma, AllowedPOS, AllowedMorph
+
+
+class AllowedValues(NamedTuple):
+    """ Labels accepted for each annotation column """
+    lemma: FrozenSet[str]
+    POS: FrozenSet[str]
+    morph: FrozenSet[str]
+
+
+#: Allowed values of control lists, keyed by control list id and checked against ControlLists.version
+CONTROL_LISTS_CACHE = LRUCache(maxsize=16)
+#: Custom dictionaries of corpora, keyed by corpus id and checked against Corpus.custom_dictionary_version
+CUSTOM_DICTIONARIES_CACHE = LRUCache(maxsize=64)
+#: Memory budget of the autocomplete indexes, in bytes
+AUTOCOMPLETE_INDEX_BUDGET = 128 * 1024 * 1024
+#: Autocomplete indexes of control lists, keyed by control list id and allowed type and checked against
+#: ControlLists.version, and of custom dictionaries, keyed by ("corpus", corpus id, category) and checked against
+#: Corpus.custom_dictionary_version. Indexes are evicted when they exceed AUTOCOMPLETE_INDEX_BUDGET
+AUTOCOMPLETE_CACHE = LRUCache(
+    maxsize=64,
+    max_weight=AUTOCOMPLETE_INDEX_BUDGET,
+    weigh=lambda cached: sum(index.size for index in cached[1])
+)
+
+RE_FILTER_METADATA = re.compile(ControlLists.re_filter_metadata)
+RE_FILTER_IGNORE = re.compile(ControlLists.re_filter_ignore)
+RE_FILTER_PUNCT = re.compile(ControlLists.re_filter_punct)
+RE_FILTER_NUMERAL = re.compile(ControlLists.re_filter_numeral)
+
+
+def clear_caches():
+    """ Empty the allowed values caches of the current process """
+    CONTROL_LISTS_CACHE.clear()
+    CUSTOM_DICTIONARIES_CACHE.clear()
+    AUTOCOMPLETE_CACHE.clear()
+
+
+def load_control_list_values(control_list_id: int) -> AllowedValues:
+    """ Read every allowed label of a control list
+
+    :param control_list_id: ID of the control list
+    """
+    return AllowedValues(*[
+        frozenset(
+            label
+            for label, in db.session.query(cls.label).filter(cls.control_list == control_list_id)
+        )
+        for cls in (AllowedLemma, AllowedPOS, AllowedMorph)
+    ])
+
+
+def load_autocomplete_indexes(control_list_id: int, allowed_type: str) -> Tuple[PrefixIndex, ...]:
+    """ Build the autocomplete indexes of a control list: lemma are searched on their normalised label, or on their
+    label when the search has accents, POS on their label and morph on fragments of their label or readable form.
+
+    :param control_list_id: ID of the control list
+    :param allowed_type: Type of allowed value (lemma, POS or morph)
+    """
+    if allowed_type == "lemma":
+        rows = db.session.query(AllowedLemma.label_uniform, AllowedLemma.label).filter(
+            AllowedLemma.control_list == control_list_id
+        ).all()
+        return PrefixIndex(rows), PrefixIndex((label, label) for _, label in rows)
+    if allowed_type == "morph":
+        rows = db.session.query(AllowedMorph.label, AllowedMorph.readable).filter(
+            AllowedMorph.control_list == control_list_id
+        ).all()
+        return FragmentIndex(rows, fields=(0, 1)),
+    labels = [
+        label
+        for label, in db.session.query(AllowedPOS.label).filter(AllowedPOS.control_list == control_list_id)
+    ]
+    return PrefixIndex((label, label) for label in labels),
+
+
+def search_allowed_values(control_list_id: int, allowed_type: str, form: str, limit: int) -> List[str]:
+    """ Find allowed lemma or POS starting with form from an in-memory index of the control list
+
+    Results are the same as WordToken.get_like() on allowed lists, without scanning the allowed values. The index
+    is built on first use and rebuilt once the version of the control list changes.
+
+    :param control_list_id: ID of the control list
+    :param allowed_type: Type of allowed value (lemma or POS)
+    :param form: Start of the values
+    :param limit: Maximum number of values
+    """
+    version = db.session.query(ControlLists.version).filter(ControlLists.id == control_list_id).scalar()
+    if version is None:
+        return []
+    indexes = AUTOCOMPLETE_CACHE.get_versioned(
+        (control_list_id, allowed_type), version,
+        lambda: load_autocomplete_indexes(control_list_id, allowed_type)
+    )
+    # Like get_like(), accents in a lemma search are matched against the original labels
+    index = indexes[1] if allowed_type == "lemma" and unidecode.unidecode(form) != form else indexes[0]
+    return index.search(form, limit)
+
+
+def search_allowed_morph(control_list_id: int, form: str, limit: int) -> List[Tuple[str, str]]:
+    """ Find allowed morph whose label or readable form contains every word of form
+
+    Results are the same as WordToken.get_like() on the allowed morph, read from an inverted index of the control
+    list instead of scanning the allowed values.
+
+    :param control_list_id: ID of the control list
+    :param form: Words to search for
+    :param limit: Maximum number of values
+    :return: (label, readable) of the morph
+    """
+    version = db.session.query(ControlLists.version).filter(ControlLists.id == control_list_id).scalar()
+    if version is None:
+        return []
+    index, = AUTOCOMPLETE_CACHE.get_versioned(
+        (control_list_id, "morph"), version,
+        lambda: load_autocomplete_indexes(control_list_id, "morph")
+    )
+    return index.search(form.split(), limit)
+
+
+class TokenValidator:
+    """ Checks token values against a control list and a corpus custom dictionary without querying the database
+
+    :param allowed: Labels of the control list
+    :param custom: Labels of the corpus custom dictionary
+    :param control_list: Control list whose filters should be applied
+    """
+    def __init__(self, allowed: AllowedValues, custom: AllowedValues, control_list: Optional[ControlLists] = None):
+        self.allowed = allowed
+        self.custom = custom
+        self.metadata_filter = None
+        self.lemma_filters = ()
+        if control_list:
+            if control_list.filter_metadata:
+                self.metadata_filter = RE_FILTER_METADATA
+            self.lemma_filters = tuple(
+                regex
+                for enabled, regex in [
+                    (control_list.filter_ignore, RE_FILTER_IGNORE),
+                    (control_list.filter_punct, RE_FILTER_PUNCT),
+                    (control_list.filter_numeral, RE_FILTER_NUMERAL),
+                ]
+                if enabled
+            )
+
+    @classmethod
+    def for_control_list(cls, control_list: ControlLists, custom: AllowedValues) -> "TokenValidator":
+        """ Build a validator using the cached values of a control list
+
+        :param control_list: Control list to validate against
+        :param custom: Labels of the corpus custom dictionary
+        """
+        allowed = CONTROL_LISTS_CACHE.get_versioned(
+            control_list.id, control_list.version,
+            lambda: load_control_list_values(control_list.id)
+        )
+        return cls(allowed, custom, control_list)
+
+    def is_metadata(self, form: Optional[str]) -> bool:
+        """ Check if a form is a metadata token ignored by the control list """
+        return bool(form and self.metadata_filter and self.metadata_filter.match(form))
+
+    def is_known(self, category: str, value: str) -> bool:
+        """ Check if a value is part of the control list or of the custom dictionary """
+        return value in getattr(self.allowed, category) or value in getattr(self.custom, category)
+
+    def validate(self, lemma, POS, morph, form, columns) -> Dict[str, bool]:
+        """ Check if a token is valid
+
+        :param lemma: Lemma value of the token to validate
+        :param POS: POS value of the token to validate
+        :param morph: Morphology tag of the token to validate
+        :param form: Form of the token
+        :param columns: Displayed columns of the corpus
+        :return: Dictionary of status
+        """
+        statuses = {"lemma": True, "POS": True, "morph": True}
+        if self.is_metadata(form):
+            return statuses
+
+        if lemma and "lemma" in columns and self.allowed.lemma:
+            ignored_by_regex = any(regex.match(lemma) for regex in self.lemma_filters)
+            if not ignored_by_regex and not self.is_known("lemma", lemma):
+                statuses["lemma"] = False
+
+        if POS is not None and "POS" in columns and self.allowed.POS and not self.is_known("POS", POS):
+            statuses["POS"] = False
+
+        if morph is not None and "morph" in columns and self.allowed.morph and not self.is_known("morph", morph):
+            statuses["morph"] = False
+
+        return statuses
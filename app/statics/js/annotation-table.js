@@ -550,11 +550,11 @@
       };
     },
     template: `
-      <div :class="rowClass" :id="'token_' + token.id + '_row'" :data-token-order="token.order_id">
+      <div :class="rowClass" :id="'token_' + token.id + '_row'" :data-token-order="token.position">
 
         <!-- Col 1: ID spans 2 rows -->
         <div class="at-cell at-cell--id">
-          <a :href="'#tok' + token.order_id" :id="'tok' + token.order_id" class="at-order-id" tabindex="-1">{{ token.token_reference ?? token.order_id }}</a>
+          <a :href="'#tok' + token.position" :id="'tok' + token.position" class="at-order-id" tabindex="-1">{{ token.token_reference ?? token.position }}</a>
           <button :class="['at-review-toggle', state.needs_review && 'at-review-toggle--active']"
                   :title="state.needs_review ? (state.review_comment || 'Flagged for review') : 'Mark for review'"
                   @click="state.showReviewPanel = !state.showReviewPanel" tabindex="-1">⚑</button>
@@ -741,15 +741,23 @@
       const total     = ref(0);
       const loading   = ref(true);
       const loadError = ref(null);
+      // Cursors of the current page: neighbouring pages are read after or before them in constant time
+      const cursors   = { next: null, prev: null };
 
       async function fetchPage(num) {
         loading.value = true;
         loadError.value = null;
         const url = new URL(config.urls.data, window.location.href);
         for (const [k, v] of new URLSearchParams(window.location.search)) {
-          if (k !== 'page') url.searchParams.set(k, v);
+          if (!['page', 'after', 'before', 'total'].includes(k)) url.searchParams.set(k, v);
         }
         url.searchParams.set('page', String(num));
+        const cursor = num === page.value + 1 ? ['after', cursors.next]
+                     : num === page.value - 1 ? ['before', cursors.prev] : [null, null];
+        if (cursor[1]) {
+          url.searchParams.set(cursor[0], cursor[1]);
+          url.searchParams.set('total', String(total.value));
+        }
         try {
           const resp = await fetch(url.toString());
           if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
@@ -758,6 +766,8 @@
           page.value   = data.page;
           pages.value  = data.pages;
           total.value  = data.total;
+          cursors.next = data.next ?? null;
+          cursors.prev = data.prev ?? null;
           const newUrl = new URL(window.location.href);
           newUrl.searchParams.set('page', String(data.page));
           history.pushState({ page: data.page }, '', newUrl.toString());
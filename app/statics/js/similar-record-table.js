@@ -142,11 +142,11 @@
                :class="['at-row at-row--bulk', selected.has(tok.id) && 'at-row--selected', tok.changed && 'at-row--changed']"
                @click="toggleToken(tok.id)">
 
-            <!-- Col 1: checkbox + order_id, spans all 3 rows -->
+            <!-- Col 1: checkbox + position, spans all 3 rows -->
             <div class="at-cell at-cell--id" style="cursor:pointer;flex-direction:column;gap:4px">
               <input type="checkbox" :checked="selected.has(tok.id)"
                      @click.stop @change="toggleToken(tok.id)" />
-              <span class="at-order-id">{{ tok.order_id }}</span>
+              <span class="at-order-id">{{ tok.position }}</span>
             </div>
 
             <!-- Col 2: form spans all 3 rows -->
@@ -0,0 +1,43 @@
+from typing import Dict, Iterable, Sequence, Union
+
+from sqlalchemy import Table
+from sqlalchemy.engine import Connection
+
+
+def bulk_insert(connection: Connection, table: Table, columns: Sequence[str], rows: Iterable[Union[Dict, tuple]]) -> int:
+    """ Insert rows with the fastest path available for the database
+
+    PostgreSQL streams the rows through COPY FROM STDIN, other databases receive a single executemany
+    in the current transaction. Python-side column defaults are not applied: columns which are not listed
+    get their server default.
+
+    :param connection: Connection of the current transaction (eg. db.session.connection())
+    :param table: Table to insert into
+    :param columns: Columns to fill, missing keys of rows are inserted as NULL
+    :param rows: Dictionaries of values, or tuples of values in the order of columns
+    :return: Number of rows inserted
+    """
+    preparer = connection.dialect.identifier_preparer
+    table_name = preparer.format_table(table)
+    column_names = ", ".join(preparer.quote(column) for column in columns)
+
+    if connection.dialect.name == "postgresql":
+        count = 0
+        cursor = connection.connection.cursor()
+        try:
+            with cursor.copy("COPY {} ({}) FROM STDIN".format(table_name, column_names)) as copy:
+                for row in rows:
+                    copy.write_row(row if isinstance(row, tuple) else tuple(row.get(column) for column in columns))
+                    count += 1
+        finally:
+            cursor.close()
+        return count
+
+    placeholder = "?" if connection.dialect.paramstyle == "qmark" else "%s"
+    rows = [row if isinstance(row, tuple) else tuple(row.get(column) for column in columns) for row in rows]
+    if rows:
+        connection.exec_driver_sql(
+            "INSERT INTO {} ({}) VALUES ({})".format(table_name, column_names, ", ".join([placeholder] * len(columns))),
+            rows
+        )
+    return len(rows)
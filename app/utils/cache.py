@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import RLock
+from typing import Any, Callable, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """ Small thread-safe Least Recently Used cache shared by the workers of a process
+
+    :param maxsize: Maximum number of entries kept in the cache
+    :param max_weight: Maximum total weight of the entries, eg. a memory budget in bytes
+    :param weigh: Callable giving the weight of a value, required with max_weight
+    """
+    def __init__(self, maxsize: int = 128, max_weight: Optional[int] = None,
+                 weigh: Optional[Callable[[Any], int]] = None):
+        self.maxsize = maxsize
+        self.max_weight = max_weight
+        self.weigh = weigh
+        self.weight = 0
+        self._data: OrderedDict = OrderedDict()
+        self._weights: Dict[Hashable, int] = {}
+        self._lock = RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def get(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def set(self, key: Hashable, value: Any):
+        with self._lock:
+            self.pop(key)
+            self._data[key] = value
+            if self.max_weight is not None:
+                self._weights[key] = self.weigh(value)
+                self.weight += self._weights[key]
+            # The most recent entry is always kept, even when it exceeds the budget on its own
+            while len(self._data) > 1 and (
+                    len(self._data) > self.maxsize
+                    or (self.max_weight is not None and self.weight > self.max_weight)
+            ):
+                self.pop(next(iter(self._data)))
+
+    def pop(self, key: Hashable, default: Optional[Any] = None) -> Any:
+        with self._lock:
+            self.weight -= self._weights.pop(key, 0)
+            return self._data.pop(key, default)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._weights.clear()
+            self.weight = 0
+
+    def get_versioned(self, key: Hashable, version: Any, factory: Callable[[], Any]) -> Any:
+        """ Retrieve the value cached for key if it was computed for the same version, otherwise
+        compute it with factory and replace the outdated value.
+
+        :param key: Identifier of the cached object (eg. a control list id)
+        :param version: Version of the object the value must match
+        :param factory: Callable computing the value when it is missing or outdated
+        """
+        cached = self.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        value = factory()
+        self.set(key, (version, value))
+        return value
@@ -0,0 +1,39 @@
+from collections import deque
+from typing import Callable, Iterable, Iterator, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def sliding_contexts(
+        items: Iterable[T],
+        context_left: int,
+        context_right: int,
+        get_form: Callable[[T], str] = lambda item: item
+) -> Iterator[Tuple[T, str, str]]:
+    """ Compute the left and right contexts of a stream of tokens in a single pass
+
+    Only context_left + context_right + 1 tokens are kept in memory at any time, whatever the length of the stream.
+
+    :param items: Tokens, in reading order
+    :param context_left: Number of forms in the left context
+    :param context_right: Number of forms in the right context
+    :param get_form: Callable returning the form of an item
+    :return: Tuples of (item, left context, right context)
+    """
+    left = deque(maxlen=max(context_left, 0))
+    window = deque()  # Current item followed by its right context
+    context_right = max(context_right, 0)
+
+    def emit():
+        current = window.popleft()
+        result = current, " ".join(left), " ".join(get_form(item) for item in window)
+        left.append(get_form(current))
+        return result
+
+    for item in items:
+        window.append(item)
+        if len(window) > context_right:
+            yield emit()
+
+    while window:
+        yield emit()
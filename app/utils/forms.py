@@ -1,6 +1,6 @@
-from typing import List, Optional
+from typing import List, Optional, Tuple
 from csv import DictReader
-from sqlalchemy import func
+from sqlalchemy import func, or_
 
 from app.utils import StringDictReader
 from app.utils.tsv import TSV_CONFIG
@@ -38,21 +38,16 @@ def prepare_search_string(string: str) -> List[str]:
     return value
 
 
-def column_search_filter(
-        field: ColumnElement,
-        value: str,
-        case_sensitive: bool = True) -> List[ColumnExpressionArgument]:
-    """ Based on a field name and a string value, computes the list of search WHERE that needs to be \
-    applied to a query
+def parse_search_value(value: str, case_sensitive: bool = True) -> Optional[Tuple[str, str]]:
+    """ Parse a search string into an operator and the value to compare to
 
-    :param field: ORM Field Property
     :param value: Search String
-    :param case_sensitive: Enable case sensitivity
-    :return: List of WHERE clauses
+    :param case_sensitive: Enable case sensitivity, equality values are lower-cased otherwise
+    :return: None when the string does not constrain the search, else a tuple of an operator among eq, ne, like \
+    and notlike and of the value, with LIKE wildcards for like and notlike
     """
-    branch_filters = []
     if not value:
-        return []
+        return None
 
     # Clean-up the string
     value = value.replace(" ", "")
@@ -63,24 +58,12 @@ def column_search_filter(
     value = value.replace('\\!', '¤$$¤')
     value = string_to_none(value)
 
-    # If all operation produced an empty string, return an empty list
+    # If all operation produced an empty string, there is nothing to search for
     if not value or value == "!":
-        return []
-
-    # If we are case-sensitive, we keep using like and or not like
-    if case_sensitive:
-        notlike = lambda x: field.notlike(x, escape="\\")
-        like = lambda x: field.like(x, escape="\\")
-        eq_field = field
-        eq_value = lambda x: x
-    else:
-        notlike = lambda x: field.notilike(x, escape="\\")
-        like = lambda x: field.ilike(x, escape="\\")
-        eq_field = func.lower(field)
-        eq_value = lambda x: x.lower()
+        return None
 
     # distinguish LIKE from EQ when wild cards are used
-    if value is not None and "*" in value:
+    if "*" in value:
         # Replace unescaped * as LIKE operator wildcards
         value = value.replace("*", "%")
         # Re-introduce previously escaped * (as ¤$¤) as the search character *
@@ -89,9 +72,9 @@ def column_search_filter(
         # Then we check if we are in a not or not request
         if value.startswith("!") and len(value) > 1:
             value = value[1:]
-            operator = notlike
+            operator = "notlike"
         else:
-            operator = like
+            operator = "like"
     else:
         # Re-introduce previously escaped * (as ¤$¤) as the search character *
         value = value.replace('¤$¤', '*')
@@ -99,16 +82,83 @@ def column_search_filter(
         # Then we check if we are in a not or not request
         if value.startswith("!") and len(value) > 1:
             value = value[1:]
-            operator = eq_field.__ne__
+            operator = "ne"
         else:
-            operator = eq_field.__eq__
+            operator = "eq"
 
-        value = eq_value(value)
+        if not case_sensitive:
+            value = value.lower()
 
     # Re-introduce previously escaped ! (as ¤$$¤) as the search character !
     value = value.replace('¤$$¤', '!')
-    branch_filters.append(operator(value))
-    return branch_filters
+    return operator, value
+
+
+def _search_condition(field: ColumnElement, operator: str, value, case_sensitive: bool) -> ColumnElement:
+    """ SQL condition of a parsed search value (See parse_search_value) """
+    if operator == "like":
+        return field.like(value, escape="\\") if case_sensitive else field.ilike(value, escape="\\")
+    elif operator == "notlike":
+        return field.notlike(value, escape="\\") if case_sensitive else field.notilike(value, escape="\\")
+    eq_field = field if case_sensitive else func.lower(field)
+    if operator == "in":
+        return eq_field.in_(value)
+    elif operator == "ne":
+        return eq_field != value
+    return eq_field == value
+
+
+def column_search_filter(
+        field: ColumnElement,
+        value: str,
+        case_sensitive: bool = True) -> List[ColumnExpressionArgument]:
+    """ Based on a field name and a string value, computes the list of search WHERE that needs to be \
+    applied to a query
+
+    :param field: ORM Field Property
+    :param value: Search String
+    :param case_sensitive: Enable case sensitivity
+    :return: List of WHERE clauses
+    """
+    parsed = parse_search_value(value, case_sensitive=case_sensitive)
+    if parsed is None:
+        return []
+    return [_search_condition(field, *parsed, case_sensitive=case_sensitive)]
+
+
+def column_search_alternatives(
+        field: ColumnElement,
+        values: List[str],
+        case_sensitive: bool = True) -> Optional[ColumnElement]:
+    """ Computes the WHERE clause matching any of the alternative search strings of a field, eg. those of
+    a search string split by prepare_search_string
+
+    Equality alternatives are collapsed into a single IN (lower(field) IN when case-insensitive), wildcard and
+    negated alternatives are kept as their own conditions of the disjunction.
+
+    :param field: ORM Field Property
+    :param values: Alternative search strings
+    :param case_sensitive: Enable case sensitivity
+    :return: None if one of the alternatives matches anything, the WHERE clause otherwise
+    """
+    equal = {}
+    conditions = []
+    for value in values:
+        parsed = parse_search_value(value, case_sensitive=case_sensitive)
+        if parsed is None:
+            return None
+        operator, value = parsed
+        if operator == "eq":
+            equal[value] = None
+        else:
+            conditions.append(_search_condition(field, operator, value, case_sensitive))
+    if len(equal) == 1:
+        conditions.insert(0, _search_condition(field, "eq", next(iter(equal)), case_sensitive))
+    elif equal:
+        conditions.insert(0, _search_condition(field, "in", list(equal), case_sensitive))
+    if len(conditions) == 1:
+        return conditions[0]
+    return or_(*conditions)
 
 
 def read_input_lemma(values: str) -> List[str]:
@@ -0,0 +1,78 @@
+import sys
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+
+class FragmentIndex:
+    """ Case-insensitive search of the rows having a field which contains every fragment of a query, kept in
+    memory as an inverted index from the n-grams of each field to the rows
+
+    Fragments up to GRAM characters long are n-grams themselves and are read from their posting list. Longer
+    fragments intersect the posting lists of their n-grams, and candidates are then checked against the fragment.
+
+    :param rows: Tuples returned by searches, in the order of their values
+    :param fields: Positions of the searched fields in the rows
+    """
+    GRAM = 3
+
+    def __init__(self, rows: Iterable[Tuple], fields: Sequence[int]):
+        self.rows: List[Tuple] = sorted(set(rows), key=lambda row: tuple(value or "" for value in row))
+        self.texts: List[List[str]] = [[(row[field] or "").lower() for field in fields] for row in self.rows]
+        self.postings: List[Dict[str, List[int]]] = [{} for _ in fields]
+        for row_id, texts in enumerate(self.texts):
+            for postings, text in zip(self.postings, texts):
+                for gram in self.grams(text):
+                    postings.setdefault(gram, []).append(row_id)
+        #: Approximate memory used by the index, in bytes
+        self.size: int = (
+            sum(sys.getsizeof(text) for texts in self.texts for text in texts) * 2
+            + sum(sys.getsizeof(gram) + sys.getsizeof(posting) for postings in self.postings
+                  for gram, posting in postings.items())
+        )
+
+    def __len__(self):
+        return len(self.rows)
+
+    @classmethod
+    def grams(cls, text: str) -> Set[str]:
+        """ Every substring of text up to GRAM characters """
+        return {
+            text[start:start + size]
+            for size in range(1, cls.GRAM + 1)
+            for start in range(len(text) - size + 1)
+        }
+
+    @classmethod
+    def query_grams(cls, fragment: str) -> List[str]:
+        """ N-grams whose posting lists contain every text containing fragment """
+        if len(fragment) <= cls.GRAM:
+            return [fragment]
+        return [fragment[start:start + cls.GRAM] for start in range(len(fragment) - cls.GRAM + 1)]
+
+    def search(self, fragments: Iterable[str], limit: Optional[int] = None) -> List[Tuple]:
+        """ Rows with a field containing every fragment, in the order of their values
+
+        :param fragments: Strings which must all be found in the same field, case-insensitive
+        :param limit: Maximum number of rows returned
+        """
+        fragments = [fragment.lower() for fragment in fragments]
+        if not fragments:
+            return self.rows[:limit]
+
+        matches = set()
+        for field, postings in enumerate(self.postings):
+            # Start from the shortest posting lists to keep the intersections small
+            lists = sorted(
+                (postings.get(gram, ()) for fragment in fragments for gram in self.query_grams(fragment)),
+                key=len
+            )
+            candidates = set(lists[0])
+            for posting in lists[1:]:
+                if not candidates:
+                    break
+                candidates.intersection_update(posting)
+            matches.update(
+                row_id
+                for row_id in candidates
+                if all(fragment in self.texts[row_id][field] for fragment in fragments)
+            )
+        return [self.rows[row_id] for row_id in sorted(matches)][:limit]
@@ -0,0 +1,134 @@
+import base64
+import json
+from math import ceil
+from typing import Iterator, Optional, Sequence
+
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Query
+from werkzeug.exceptions import BadRequest
+
+
+def iter_keyset(query: Query, keys: Sequence, chunk_size: int = 1000) -> Iterator:
+    """ Iterate over the rows of a query chunk by chunk, each chunk starting after the key of the last row read
+
+    Contrary to offsets, the cost of each chunk does not grow with its position and, as rows are read one
+    chunk at a time, memory stays flat whatever the size of the result.
+
+    :param query: Query of columns (not of ORM objects, which would fill the identity map)
+    :param keys: Columns ordering the rows, which together must be unique. They need to be part of the selected columns.
+    :param chunk_size: Number of rows fetched per query
+    """
+    last = None
+    while True:
+        chunk = query
+        if last is not None:
+            chunk = chunk.filter(tuple_(*keys) > tuple_(*last))
+        rows = chunk.order_by(*keys).limit(chunk_size).all()
+        yield from rows
+        if len(rows) < chunk_size:
+            return
+        last = tuple(getattr(rows[-1], key.key) for key in keys)
+
+
+class KeysetStream:
+    """ Re-iterable wrapper around iter_keyset, so that templates can loop several times over the same rows
+
+    :param query: Query of columns
+    :param keys: Columns ordering the rows
+    :param chunk_size: Number of rows fetched per query
+    """
+    def __init__(self, query: Query, keys: Sequence, chunk_size: int = 1000):
+        self.query = query
+        self.keys = keys
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        return iter_keyset(self.query, self.keys, self.chunk_size)
+
+
+def encode_cursor(values: Sequence) -> str:
+    """ Opaque cursor pointing at a row from the values of its keys
+
+    :param values: Values of the keys of the row
+    """
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, length: Optional[int] = None) -> tuple:
+    """ Values of the keys of the row a cursor points at
+
+    :param cursor: Cursor built by encode_cursor
+    :param length: Number of keys the cursor must hold
+    :raises BadRequest: When the cursor is malformed
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (ValueError, TypeError):
+        raise BadRequest("Invalid cursor")
+    if not isinstance(values, list) or (length is not None and len(values) != length) \
+            or not all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        raise BadRequest("Invalid cursor")
+    return tuple(values)
+
+
+class KeysetPagination:
+    """ Page of a query read after or before a cursor, or at a page number for the first request
+
+    Only per_page + 1 rows are read to know whether there is a following page, so the cost of a page does not
+    depend on its position when a cursor is given. The total is never counted when it is provided.
+
+    :param query: Query of ORM objects
+    :param keys: Columns ordering the rows, which together must be unique, mapped to attributes of the objects
+    :param per_page: Number of rows per page
+    :param page: Number of the page, used as an offset when there is no cursor and echoed otherwise
+    :param after: Cursor of the row preceding the page
+    :param before: Cursor of the row following the page
+    :param total: Known or cached number of rows, counted when None
+    :param descending: Whether rows are read in the descending order of the keys
+    """
+    def __init__(self, query: Query, keys: Sequence, per_page: int, page: int = 1,
+                 after: Optional[str] = None, before: Optional[str] = None, total: Optional[int] = None,
+                 descending: bool = False):
+        self.per_page = max(per_page, 1)
+        self.page = max(page, 1)
+        self.keys = keys
+        self.total = total if total is not None else query.order_by(None).count()
+
+        backward = before is not None
+        ordered = query.order_by(None)
+        if after is not None or before is not None:
+            values = tuple_(*decode_cursor(after if after is not None else before, len(keys)))
+            if backward != descending:
+                ordered = ordered.filter(tuple_(*keys) < values)
+            else:
+                ordered = ordered.filter(tuple_(*keys) > values)
+        ordered = ordered.order_by(*[key.desc() if backward != descending else key for key in keys])
+        if after is None and before is None and self.page > 1:
+            ordered = ordered.offset((self.page - 1) * self.per_page)
+
+        items = ordered.limit(self.per_page + 1).all()
+        more = len(items) > self.per_page
+        items = items[:self.per_page]
+        if backward:
+            items.reverse()
+            self.has_prev, self.has_next = more, True
+        else:
+            self.has_prev, self.has_next = after is not None or self.page > 1, more
+        self.items = items
+
+    @property
+    def pages(self) -> int:
+        return ceil(self.total / self.per_page)
+
+    def _cursor(self, item) -> str:
+        return encode_cursor([getattr(item, key.key) for key in self.keys])
+
+    @property
+    def next_cursor(self) -> Optional[str]:
+        """ Cursor to read the following page, None on the last page """
+        return self._cursor(self.items[-1]) if self.has_next and self.items else None
+
+    @property
+    def prev_cursor(self) -> Optional[str]:
+        """ Cursor to read the previous page, None on the first page """
+        return self._cursor(self.items[0]) if self.has_prev and self.items else None
@@ -0,0 +1,142 @@
+""" Compiled language packs of the default control lists
+
+A language pack is a folder of app/configurations/langs with a metadata.yaml and lemma.txt, POS.txt and morph.txt
+in the input format of the control list editor. Reading those means parsing ~210k lines and normalizing each lemma
+with unidecode, so each pack is compiled once into a single TSV next to its sources, holding rows ready to be
+bulk inserted::
+
+    #pyrrha-pack    <PACK_FORMAT_VERSION>    <checksum of the sources>
+    lemma    <label>    <label_uniform>
+    POS      <label>
+    morph    <label>    <readable>
+
+The artifact is rebuilt whenever the sources or the format change. The checksum is also stored on the control list
+loaded from the pack, so that unchanged packs are not loaded again.
+"""
+import csv
+import glob
+import hashlib
+import logging
+import os
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional
+
+import unidecode
+import yaml
+
+from app.utils import PyrrhaError
+from app.utils.forms import read_input_lemma, read_input_POS, read_input_morph
+
+
+logger = logging.getLogger(__name__)
+
+#: Bumped whenever the layout or the content of compiled packs changes
+PACK_FORMAT_VERSION = 1
+PACK_SOURCES = ("metadata.yaml", "lemma.txt", "POS.txt", "morph.txt")
+COMPILED_NAME = "compiled.tsv"
+DEFAULT_PACKS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "configurations", "langs", "**")
+
+_HEADER = "#pyrrha-pack"
+_CSV_CONFIG = dict(delimiter="\t", quoting=csv.QUOTE_MINIMAL, lineterminator="\n")
+
+
+class Pack(NamedTuple):
+    """ Content of a compiled language pack
+
+    :ivar name: Name of the folder of the pack
+    :ivar checksum: Checksum of the sources and of the format version
+    :ivar metadata: Attributes of the control list
+    :ivar lemma: Lemma rows (label, label_uniform)
+    :ivar POS: POS rows (label, )
+    :ivar morph: Morph rows (label, readable)
+    """
+    name: str
+    checksum: str
+    metadata: dict
+    lemma: List[tuple]
+    POS: List[tuple]
+    morph: List[tuple]
+
+
+def pack_directories(path: Optional[str] = None) -> List[str]:
+    """ Folders of the language packs matching a glob pattern (Defaults to the shipped packs) """
+    return sorted(directory for directory in glob.glob(path or DEFAULT_PACKS) if os.path.isdir(directory))
+
+
+def pack_checksum(directory: str) -> str:
+    """ SHA-256 of the format version and of the sources of a pack """
+    digest = hashlib.sha256(str(PACK_FORMAT_VERSION).encode())
+    for source in PACK_SOURCES:
+        filepath = os.path.join(directory, source)
+        if os.path.exists(filepath):
+            digest.update(source.encode())
+            with open(filepath, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def _parse_sources(directory: str) -> Dict[str, List[tuple]]:
+    """ Read the allowed values of a pack from its sources """
+    rows = {"lemma": [], "POS": [], "morph": []}
+    for allowed_type, parser in (("lemma", read_input_lemma), ("POS", read_input_POS), ("morph", read_input_morph)):
+        filepath = os.path.join(directory, allowed_type + ".txt")
+        if not os.path.exists(filepath):
+            continue
+        with open(filepath, encoding="utf-8") as f:
+            values = parser(f.read())
+        if allowed_type == "lemma":
+            duplicates = [lemma for lemma, cnt in Counter(values).items() if cnt > 1]
+            if duplicates:
+                raise PyrrhaError("Following values are duplicated: " + ", ".join(duplicates))
+            rows["lemma"] = [(label, unidecode.unidecode(label)) for label in values]
+        elif allowed_type == "POS":
+            rows["POS"] = [(label, ) for label in values]
+        else:
+            rows["morph"] = [(item["label"], item.get("readable") or item["label"]) for item in values]
+    return rows
+
+
+def _read_compiled(filepath: str, checksum: str) -> Optional[Dict[str, List[tuple]]]:
+    """ Rows of a compiled pack, or None when it is missing or outdated """
+    if not os.path.exists(filepath):
+        return None
+    with open(filepath, encoding="utf-8", newline="") as f:
+        reader = csv.reader(f, **_CSV_CONFIG)
+        if next(reader, None) != [_HEADER, str(PACK_FORMAT_VERSION), checksum]:
+            return None
+        rows = {"lemma": [], "POS": [], "morph": []}
+        for allowed_type, *values in reader:
+            rows[allowed_type].append(tuple(values))
+    return rows
+
+
+def _write_compiled(filepath: str, checksum: str, rows: Dict[str, List[tuple]]):
+    """ Write a compiled pack, replacing the previous one only once it is complete """
+    temporary = "{}.{}.tmp".format(filepath, os.getpid())
+    with open(temporary, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f, **_CSV_CONFIG)
+        writer.writerow([_HEADER, PACK_FORMAT_VERSION, checksum])
+        for allowed_type, values in rows.items():
+            writer.writerows((allowed_type, *value) for value in values)
+    os.replace(temporary, filepath)
+
+
+def load_pack(directory: str, write: bool = True) -> Pack:
+    """ Read a language pack from its compiled artifact, compiling it first if it is missing or outdated
+
+    :param directory: Folder of the pack
+    :param write: Write the artifact when it is outdated. It is skipped, with a warning, on read-only installs.
+    """
+    checksum = pack_checksum(directory)
+    with open(os.path.join(directory, "metadata.yaml")) as f:
+        metadata = yaml.safe_load(f)
+    compiled = os.path.join(directory, COMPILED_NAME)
+    rows = _read_compiled(compiled, checksum)
+    if rows is None:
+        rows = _parse_sources(directory)
+        if write:
+            try:
+                _write_compiled(compiled, checksum, rows)
+            except OSError as error:
+                logger.warning("Pack %s could not be compiled: %s", directory, error)
+    return Pack(os.path.basename(os.path.normpath(directory)), checksum, metadata, **rows)
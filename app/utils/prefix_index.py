@@ -0,0 +1,43 @@
+import sys
+from bisect import bisect_left
+from typing import Iterable, List, Tuple
+
+
+class PrefixIndex:
+    """ Case-insensitive prefix search over labels, kept in memory as a sorted array of lowercased keys
+
+    A search is a binary search for the first key starting with the prefix followed by a scan of the
+    matching keys, which stops as soon as enough labels were found.
+
+    :param entries: Pairs of (key to search on, label returned)
+    """
+    def __init__(self, entries: Iterable[Tuple[str, str]]):
+        pairs = sorted({(key.lower(), label) for key, label in entries if key is not None})
+        self.keys: List[str] = [key for key, _ in pairs]
+        self.labels: List[str] = [label for _, label in pairs]
+        #: Approximate memory used by the index, in bytes
+        self.size: int = (
+            sys.getsizeof(self.keys) + sys.getsizeof(self.labels)
+            + sum(sys.getsizeof(key) for key in self.keys)
+            + sum(sys.getsizeof(label) for label in self.labels)
+        )
+
+    def __len__(self):
+        return len(self.keys)
+
+    def search(self, prefix: str, limit: int) -> List[str]:
+        """ Labels whose key starts with prefix, in the order of the keys and without duplicate
+
+        :param prefix: Start of the keys, case-insensitive
+        :param limit: Maximum number of labels returned
+        """
+        prefix = prefix.lower()
+        labels, seen = [], set()
+        for index in range(bisect_left(self.keys, prefix), len(self.keys)):
+            if len(labels) >= limit or not self.keys[index].startswith(prefix):
+                break
+            label = self.labels[index]
+            if label not in seen:
+                seen.add(label)
+                labels.append(label)
+        return labels
@@ -0,0 +1,210 @@
+""" Count and time the SQL statements of each request
+
+Statements are timed with the cursor events of the engine and recorded by every active :class:`QueryRecorder`:
+the one of the current request (see :class:`SQLMetrics`) and those opened with :func:`count_queries`, which
+tests use to assert query budgets. Per endpoint aggregates are kept in memory, by process, and shown to
+administrators at /admin/metrics.
+"""
+import heapq
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, g, request
+from sqlalchemy import event
+
+
+slow_query_logger = logging.getLogger("app.sql.slow")
+
+#: Recorders statements are reported to, innermost last
+_recorders: ContextVar[Tuple["QueryRecorder", ...]] = ContextVar("sql_recorders", default=())
+
+#: Length at which statements are cut in metrics and logs
+STATEMENT_MAX_LENGTH = 2000
+
+
+def _keep_slowest(slowest: List[Tuple[float, str]], duration: float, statement: str, size: int):
+    """ Keep the size slowest (duration, statement) in a min-heap """
+    if len(slowest) < size:
+        heapq.heappush(slowest, (duration, statement))
+    elif duration > slowest[0][0]:
+        heapq.heapreplace(slowest, (duration, statement))
+
+
+class QueryRecorder:
+    """ Statements run while the recorder is active
+
+    :param slowest: Number of slowest statements kept
+    :ivar count: Number of statements
+    :ivar duration: Time spent in the database, in seconds
+    :ivar statements: Every statement run, in order
+    """
+    def __init__(self, slowest: int = 5):
+        self.count = 0
+        self.duration = 0.0
+        self.statements: List[str] = []
+        self.size = slowest
+        self._slowest: List[Tuple[float, str]] = []
+
+    def record(self, statement: str, duration: float):
+        self.count += 1
+        self.duration += duration
+        self.statements.append(statement)
+        _keep_slowest(self._slowest, duration, statement, self.size)
+
+    @property
+    def slowest(self) -> List[Tuple[float, str]]:
+        """ Slowest statements with their duration, slowest first """
+        return sorted(self._slowest, reverse=True)
+
+
+@contextmanager
+def count_queries(slowest: int = 5) -> Iterator[QueryRecorder]:
+    """ Record the statements run in the block, eg. to check the query budget of an endpoint in a test
+
+    >>> client = app.test_client()
+    >>> with count_queries() as queries:
+    ...     client.get("/corpus/1/info")
+    >>> assert queries.count <= 10
+    """
+    recorder = QueryRecorder(slowest)
+    token = _recorders.set(_recorders.get() + (recorder, ))
+    try:
+        yield recorder
+    finally:
+        _recorders.reset(token)
+
+
+class EndpointMetrics:
+    """ Aggregated queries of the requests of an endpoint """
+    def __init__(self, endpoint: str):
+        self.endpoint = endpoint
+        self.requests = 0
+        self.queries = 0
+        self.max_queries = 0
+        self.db_time = 0.0
+        self.request_time = 0.0
+        self.slowest: List[Tuple[float, str]] = []
+
+    def add(self, recorder: QueryRecorder, request_time: float, size: int):
+        self.requests += 1
+        self.queries += recorder.count
+        self.max_queries = max(self.max_queries, recorder.count)
+        self.db_time += recorder.duration
+        self.request_time += request_time
+        for duration, statement in recorder.slowest:
+            _keep_slowest(self.slowest, duration, statement, size)
+
+    def to_dict(self) -> dict:
+        return {
+            "endpoint": self.endpoint,
+            "requests": self.requests,
+            "queries": self.queries,
+            "avg_queries": self.queries / self.requests,
+            "max_queries": self.max_queries,
+            "db_time_ms": self.db_time * 1000,
+            "avg_db_time_ms": self.db_time * 1000 / self.requests,
+            "avg_request_time_ms": self.request_time * 1000 / self.requests,
+            "slowest": [
+                {"duration_ms": duration * 1000, "statement": statement}
+                for duration, statement in sorted(self.slowest, reverse=True)
+            ]
+        }
+
+
+class SQLMetrics:
+    """ Instrumentation of the SQL statements of requests
+
+    Configuration:
+
+    - SQL_METRICS: Enables the instrumentation
+    - SQL_METRICS_SLOWEST: Number of slowest statements kept per request and per endpoint
+    - SLOW_QUERY_THRESHOLD: Duration in seconds above which a statement is logged
+    - SLOW_QUERY_LOG: File the slow statements are appended to (Defaults to the application log)
+
+    Each response gets a Server-Timing header with the time spent in the database and in the whole request.
+    """
+    def __init__(self, app: Optional[Flask] = None):
+        self.endpoints: Dict[str, EndpointMetrics] = {}
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app: Flask):
+        app.extensions["sql_metrics"] = self
+        if not app.config.get("SQL_METRICS", True):
+            return
+        self.slowest = app.config.get("SQL_METRICS_SLOWEST", 5)
+        self.threshold = app.config.get("SLOW_QUERY_THRESHOLD", 0.5)
+        log_path = app.config.get("SLOW_QUERY_LOG")
+        if log_path and not any(
+                getattr(handler, "baseFilename", None) == log_path for handler in slow_query_logger.handlers):
+            slow_query_logger.addHandler(logging.FileHandler(log_path))
+
+        from app import db
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._end_request)
+        app.teardown_request(self._teardown_request)
+
+    @staticmethod
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("sql_metrics_start", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info["sql_metrics_start"].pop()
+        statement = statement[:STATEMENT_MAX_LENGTH]
+        for recorder in _recorders.get():
+            recorder.record(statement, duration)
+        if duration >= self.threshold:
+            slow_query_logger.warning(
+                "Slow query (%.1f ms) on %s: %s", duration * 1000,
+                getattr(g, "sql_endpoint", None) or "<no request>", statement
+            )
+
+    def _start_request(self):
+        g.sql_recorder = QueryRecorder(self.slowest)
+        g.sql_endpoint = request.endpoint or "<unmatched>"
+        g.sql_started = time.perf_counter()
+        g.sql_token = _recorders.set(_recorders.get() + (g.sql_recorder, ))
+
+    def _end_request(self, response):
+        recorder = g.get("sql_recorder")
+        if recorder is None:
+            return response
+        request_time = time.perf_counter() - g.sql_started
+        # Streamed responses keep reading after this point: only what ran before is counted
+        response.headers.add(
+            "Server-Timing",
+            'db;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(
+                recorder.duration * 1000, recorder.count, request_time * 1000
+            )
+        )
+        with self._lock:
+            endpoint = self.endpoints.get(g.sql_endpoint)
+            if endpoint is None:
+                endpoint = self.endpoints[g.sql_endpoint] = EndpointMetrics(g.sql_endpoint)
+            endpoint.add(recorder, request_time, self.slowest)
+        return response
+
+    @staticmethod
+    def _teardown_request(exception=None):
+        token = g.pop("sql_token", None)
+        if token is not None:
+            _recorders.reset(token)
+
+    def snapshot(self) -> List[dict]:
+        """ Metrics of every endpoint, the most time spent in the database first """
+        with self._lock:
+            metrics = [endpoint.to_dict() for endpoint in self.endpoints.values()]
+        return sorted(metrics, key=lambda endpoint: endpoint["db_time_ms"], reverse=True)
+
+    def reset(self):
+        with self._lock:
+            self.endpoints.clear()
@@ -0,0 +1,13 @@
+""" Benchmarks of the hot paths of Pyrrha on synthetic corpora
+
+Corpora of any size are generated from the distributions of the test fixtures and of the control lists shipped
+in app/configurations/langs (see :mod:`benchmarks.generator`), then each case of :mod:`benchmarks.cases` is run
+a number of rounds. Results are written as JSON, which ``profiling.py compare`` reads to spot regressions
+between two commits.
+
+The database of the chosen configuration is dropped and recreated: run them against the test configuration,
+with ``TEST_DBMS=postgresql`` to benchmark PostgreSQL.
+"""
+from .core import BENCHMARKS, Benchmark, BenchmarkContext, compare, load_results, register, run_benchmarks
+from . import cases
+from .generator import TokenGenerator, create_corpus, parse_size
@@ -0,0 +1,166 @@
+""" Benchmark cases, timing the hot paths the way views and jobs call them """
+import random
+from itertools import cycle
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Corpus, CorpusStats, WordToken
+from .core import Benchmark, BenchmarkContext, register
+from .generator import TokenGenerator
+
+
+#: Number of tokens of a page of the annotation table
+PAGE_SIZE = 100
+
+
+def _page(query) -> int:
+    """ Count the results of a token query and read its first page, as paginated views do """
+    total = query.order_by(None).count()
+    query.limit(PAGE_SIZE).all()
+    return total
+
+
+def _most_frequent(corpus_id: int, column, offset: int = 0) -> str:
+    return db.session.query(column).filter(WordToken.corpus == corpus_id, column.isnot(None)).group_by(column)\
+        .order_by(func.count(WordToken.id).desc(), column).offset(offset).limit(1).scalar()
+
+
+@register("add_batch")
+def add_batch(benchmark: Benchmark, context: BenchmarkContext):
+    """ Write 10,000 tokens (or the size of the corpus if smaller) to a new corpus """
+    tokens = list(TokenGenerator(seed=context.seed + 1).tokens(min(context.size, 10_000)))
+    benchmark.extra_info["tokens"] = len(tokens)
+
+    def setup():
+        return Corpus.create_shell("add_batch", context_left=3, context_right=3, columns=[]).id
+
+    def target(corpus_id):
+        WordToken.add_batch(corpus_id, tokens)
+        db.session.commit()
+
+    def teardown(corpus_id):
+        WordToken.query.filter(WordToken.corpus == corpus_id).delete(synchronize_session=False)
+        db.session.delete(db.session.get(Corpus, corpus_id))
+        db.session.commit()
+
+    benchmark.pedantic(target, setup=setup, teardown=teardown)
+
+
+@register("get_similar_for_batch")
+def get_similar_for_batch(benchmark: Benchmark, context: BenchmarkContext):
+    """ Similar counts of a page of tokens taken at random """
+    rng = random.Random(context.seed)
+    corpus = context.corpus
+
+    def setup():
+        offset = rng.randrange(max(context.size - PAGE_SIZE, 1))
+        return WordToken.query.filter(WordToken.corpus == corpus.id).order_by(WordToken.order_id)\
+            .offset(offset).limit(PAGE_SIZE).all()
+
+    benchmark.pedantic(lambda tokens: WordToken.get_similar_for_batch(corpus, tokens), setup=setup)
+
+
+@register("is_valid")
+def is_valid(benchmark: Benchmark, context: BenchmarkContext):
+    """ Validate the values of 1,000 tokens """
+    tokens = list(TokenGenerator(seed=context.seed + 2).tokens(1000))
+    corpus = context.corpus
+
+    def target():
+        for token in tokens:
+            WordToken.is_valid(token["lemma"], token["POS"], token["morph"], corpus, token["form"])
+
+    benchmark(target)
+
+
+def _token_search(benchmark: Benchmark, context: BenchmarkContext, search: dict):
+    corpus = context.corpus
+    benchmark.extra_info["search"] = search
+    benchmark.extra_info["results"] = benchmark(lambda: _page(corpus.token_search(search)[0]))
+
+
+@register("token_search_equality")
+def token_search_equality(benchmark: Benchmark, context: BenchmarkContext):
+    """ Search tokens by lemma and POS """
+    _token_search(benchmark, context, {
+        "lemma": _most_frequent(context.corpus_id, WordToken.lemma, offset=5),
+        "POS": _most_frequent(context.corpus_id, WordToken.POS)
+    })
+
+
+@register("token_search_alternatives")
+def token_search_alternatives(benchmark: Benchmark, context: BenchmarkContext):
+    """ Search tokens matching one of several lemmas and one of several POS """
+    lemmas = [_most_frequent(context.corpus_id, WordToken.lemma, offset=offset) for offset in range(3, 8)]
+    POS = [_most_frequent(context.corpus_id, WordToken.POS, offset=offset) for offset in range(3)]
+    _token_search(benchmark, context, {"lemma": "|".join(lemmas), "POS": "|".join(POS)})
+
+
+@register("token_search_wildcard")
+def token_search_wildcard(benchmark: Benchmark, context: BenchmarkContext):
+    """ Search tokens by form prefix, excluding a POS """
+    form = _most_frequent(context.corpus_id, WordToken.form, offset=10)
+    POS = _most_frequent(context.corpus_id, WordToken.POS)
+    _token_search(benchmark, context, {"form": form[:2] + "*", "POS": "!" + POS})
+
+
+def _get_unallowed(benchmark: Benchmark, context: BenchmarkContext, allowed_type: str):
+    corpus = context.corpus
+    benchmark.extra_info["results"] = benchmark(lambda: _page(corpus.get_unallowed(allowed_type)))
+
+
+@register("get_unallowed_lemma")
+def get_unallowed_lemma(benchmark: Benchmark, context: BenchmarkContext):
+    _get_unallowed(benchmark, context, "lemma")
+
+
+@register("get_unallowed_POS")
+def get_unallowed_POS(benchmark: Benchmark, context: BenchmarkContext):
+    _get_unallowed(benchmark, context, "POS")
+
+
+@register("get_unallowed_morph")
+def get_unallowed_morph(benchmark: Benchmark, context: BenchmarkContext):
+    _get_unallowed(benchmark, context, "morph")
+
+
+@register("statistics")
+def corpus_statistics(benchmark: Benchmark, context: BenchmarkContext):
+    """ Statistics of the corpus, with the unallowed counter to rebuild """
+    corpus = context.corpus
+
+    def setup():
+        CorpusStats.invalidate_unallowed(corpus_id=corpus.id)
+        db.session.commit()
+
+    benchmark.pedantic(lambda: corpus.statistics, setup=setup)
+
+
+def _export(benchmark: Benchmark, context: BenchmarkContext, format: str):
+    def target():
+        response = context.client.get("/corpus/{}/tokens?format={}".format(context.corpus_id, format))
+        assert response.status_code == 200, response.status_code
+        return len(response.get_data())
+
+    benchmark.extra_info["bytes"] = benchmark(target)
+
+
+@register("export_tsv")
+def export_tsv(benchmark: Benchmark, context: BenchmarkContext):
+    _export(benchmark, context, "tsv")
+
+
+@register("export_tei")
+def export_tei(benchmark: Benchmark, context: BenchmarkContext):
+    _export(benchmark, context, "tei-msd")
+
+
+@register("update_batch_context")
+def update_batch_context(benchmark: Benchmark, context: BenchmarkContext):
+    """ Recompute the stored contexts of every token, alternating between two lengths """
+    lengths = cycle([(2, 4), (3, 3)])
+    benchmark.pedantic(
+        lambda pair: WordToken.update_batch_context(context.corpus_id, *pair),
+        setup=lambda: next(lengths)
+    )
@@ -0,0 +1,244 @@
+""" Timing of the benchmark cases and their JSON results
+
+Cases are functions registered with :func:`register`, receiving a :class:`Benchmark` and the
+:class:`BenchmarkContext` of a generated corpus. As with pytest-benchmark, they time a callable with
+``benchmark(function)`` or, when each round needs a fresh state, with
+``benchmark.pedantic(target, setup=..., teardown=...)``.
+"""
+import datetime
+import json
+import platform
+import statistics
+import subprocess
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from flask import Flask, url_for
+from flask.testing import FlaskClient
+
+from app import db
+from app.models import Corpus, Role, User
+from tests.conftest import teardown_db
+from .generator import create_corpus
+
+
+#: Cases run for each corpus size, by name
+BENCHMARKS: Dict[str, Callable[["Benchmark", "BenchmarkContext"], None]] = {}
+#: Version of the JSON results
+RESULTS_VERSION = 1
+
+
+def register(name: str):
+    """ Register the decorated function as the benchmark case name """
+    def wrapper(func):
+        BENCHMARKS[name] = func
+        return func
+    return wrapper
+
+
+@dataclass
+class BenchmarkContext:
+    """ What cases work on
+
+    :ivar corpus_id: ID of the generated corpus
+    :ivar size: Number of tokens of the corpus
+    :ivar seed: Seed of the random generators of the cases
+    :ivar client: Test client logged in as an administrator, to benchmark views
+    """
+    corpus_id: int
+    size: int
+    seed: int
+    client: FlaskClient
+
+    @property
+    def corpus(self) -> Corpus:
+        return db.session.get(Corpus, self.corpus_id)
+
+
+class Benchmark:
+    """ Times a case over a number of rounds, after warmup rounds which are not recorded
+
+    :param name: Name of the case
+    :param rounds: Number of recorded rounds
+    :param warmup_rounds: Number of rounds run first, to fill caches
+    """
+    def __init__(self, name: str, rounds: int = 5, warmup_rounds: int = 1):
+        self.name = name
+        self.rounds = rounds
+        self.warmup_rounds = warmup_rounds
+        self.timings: List[float] = []
+        self.extra_info: Dict[str, object] = {}
+
+    def __call__(self, function: Callable, *args, **kwargs):
+        """ Time function called with args and kwargs, returns its last result """
+        return self.pedantic(function, args=args, kwargs=kwargs)
+
+    def pedantic(self, target: Callable, setup: Optional[Callable] = None, teardown: Optional[Callable] = None,
+                 args: tuple = (), kwargs: Optional[dict] = None):
+        """ Time target, preparing each round with setup and cleaning it with teardown, which are not timed.
+        When setup returns a value, it is given to target and teardown instead of args.
+
+        :return: Last result of target
+        """
+        kwargs = kwargs or {}
+        result = None
+        for round_number in range(self.warmup_rounds + self.rounds):
+            round_args = args
+            if setup is not None:
+                prepared = setup()
+                if prepared is not None:
+                    round_args = (prepared, )
+            start = time.perf_counter()
+            result = target(*round_args, **kwargs)
+            elapsed = time.perf_counter() - start
+            if teardown is not None:
+                teardown(*round_args)
+            if round_number >= self.warmup_rounds:
+                self.timings.append(elapsed)
+        return result
+
+    def stats(self) -> Dict[str, float]:
+        timings = self.timings
+        if not timings:
+            return {"rounds": 0}
+        quartiles = statistics.quantiles(timings, n=4) if len(timings) > 1 else [timings[0]] * 3
+        return {
+            "min": min(timings),
+            "max": max(timings),
+            "mean": statistics.fmean(timings),
+            "stddev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+            "median": statistics.median(timings),
+            "iqr": quartiles[2] - quartiles[0],
+            "rounds": len(timings),
+            "total": sum(timings),
+            "ops": len(timings) / sum(timings) if sum(timings) else 0.0,
+            "data": timings
+        }
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.run(["git", *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+
+def commit_info() -> dict:
+    return {
+        "id": _git("rev-parse", "HEAD"),
+        "branch": _git("rev-parse", "--abbrev-ref", "HEAD"),
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no"))
+    }
+
+
+def machine_info() -> dict:
+    dialect = db.engine.dialect
+    return {
+        "node": platform.node(),
+        "machine": platform.machine(),
+        "system": platform.system(),
+        "python_version": platform.python_version(),
+        "database": dialect.name,
+        "database_version": ".".join(str(part) for part in dialect.server_version_info or ())
+    }
+
+
+def _login_client(app: Flask) -> FlaskClient:
+    """ Test client logged in as the default administrator """
+    client = app.test_client()
+    with app.test_request_context():
+        login = url_for("account.login")
+    client.post(login, data={"email": app.config["ADMIN_EMAIL"], "password": app.config["ADMIN_PASSWORD"]})
+    return client
+
+
+def run_benchmarks(app: Flask, sizes: Iterable[int], names: Optional[Iterable[str]] = None,
+                   language: str = "old_french", seed: int = 0, rounds: int = 5, warmup_rounds: int = 1,
+                   echo: Callable[[str], None] = print) -> dict:
+    """ Generate a corpus of each size in a recreated database and run the cases on it
+
+    :param app: Application, whose database is dropped
+    :param sizes: Numbers of tokens of the corpora
+    :param names: Names of the cases to run (Defaults to all)
+    :param language: Language of the corpora, see benchmarks.generator.LANGUAGES
+    :param seed: Seed of the corpora and of the cases
+    :param rounds: Number of recorded rounds of each case
+    :param warmup_rounds: Number of unrecorded rounds before them
+    :param echo: Called with a line of progress
+    :return: JSON serializable results
+    """
+    names = list(names or BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        raise ValueError("Unknown benchmarks: {}".format(", ".join(sorted(unknown))))
+
+    results = []
+
+    def record(bench: Benchmark, size: int):
+        stats = bench.stats()
+        echo("{:<32} {:>10} tokens  median {:.4f}s  ({} rounds)".format(
+            bench.name, size, stats.get("median", 0), stats["rounds"]
+        ))
+        results.append({
+            "group": str(size),
+            "name": bench.name,
+            "fullname": "{}[{}]".format(bench.name, size),
+            "params": {"size": size, "language": language, "seed": seed},
+            "extra_info": bench.extra_info,
+            "stats": stats
+        })
+
+    with app.app_context():
+        for size in sizes:
+            teardown_db()
+            db.create_all()
+            Role.add_default_roles()
+            User.add_default_users()
+
+            generation = Benchmark("create_corpus", rounds=1, warmup_rounds=0)
+            corpus = generation(create_corpus, "Benchmark {}".format(size), size, language=language, seed=seed)
+            record(generation, size)
+
+            context = BenchmarkContext(corpus_id=corpus.id, size=size, seed=seed, client=_login_client(app))
+            for name in names:
+                bench = Benchmark(name, rounds=rounds, warmup_rounds=warmup_rounds)
+                BENCHMARKS[name](bench, context)
+                db.session.rollback()
+                record(bench, size)
+        info = machine_info()
+        teardown_db()
+
+    return {
+        "version": RESULTS_VERSION,
+        "datetime": datetime.datetime.utcnow().isoformat(),
+        "machine_info": info,
+        "commit_info": commit_info(),
+        "benchmarks": results
+    }
+
+
+def compare(previous: dict, current: dict, threshold: float = 1.2) -> List[Tuple[str, float, float, float, bool]]:
+    """ Compare the medians of the cases run in both results
+
+    :param previous: Results of the reference commit
+    :param current: Results to check
+    :param threshold: Ratio of the medians above which a case is a regression
+    :return: (fullname, previous median, current median, ratio) of every case run in both, slowest first, and
+             whether it is a regression
+    """
+    before = {bench["fullname"]: bench["stats"]["median"] for bench in previous["benchmarks"]}
+    rows = []
+    for bench in current["benchmarks"]:
+        name = bench["fullname"]
+        if name not in before or not before[name]:
+            continue
+        median = bench["stats"]["median"]
+        ratio = median / before[name]
+        rows.append((name, before[name], median, ratio, ratio > threshold))
+    return sorted(rows, key=lambda row: row[3], reverse=True)
+
+
+def load_results(path: str) -> dict:
+    with open(path) as file:
+        return json.load(file)
@@ -0,0 +1,140 @@
+""" Synthetic corpora with the token distributions of real ones
+
+Tokens are drawn from two sources:
+
+- the annotated tokens of the test fixtures (Wauchier and Floovant for Old French, the Priapees for Latin),
+  with their observed frequency, which gives realistic form/lemma/POS/morph combinations and repetitions;
+- the lemma, POS and morph lists shipped in app/configurations/langs, ranked in a random (seeded) order and
+  drawn with a Zipf distribution, so that the vocabulary keeps growing with the size of the corpus as it does
+  in real texts.
+
+A small share of lemmas is misspelled so that corpora have unallowed values. Generation is deterministic for a
+given seed.
+"""
+import os
+import random
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, Iterator, List, Tuple
+
+from app import db
+from app.models import Corpus, Column
+from app.utils.forms import read_input_lemma, read_input_POS, read_input_morph
+from tests.db_fixtures import DB_CORPORA
+
+
+LANGS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app", "configurations", "langs")
+
+#: Fixture corpora and shipped control list used for each language
+LANGUAGES = {
+    "old_french": (("wauchier", "floovant"), "old_french"),
+    "latin": (("priapees", ), "lasla_la"),
+}
+
+SIZE_SUFFIXES = {"k": 1_000, "m": 1_000_000}
+
+
+def parse_size(size: str) -> int:
+    """ Read a number of tokens such as 10k or 5M """
+    size = size.strip().lower()
+    if size and size[-1] in SIZE_SUFFIXES:
+        return int(float(size[:-1]) * SIZE_SUFFIXES[size[-1]])
+    return int(size)
+
+
+def _read(lang: str, filename: str, parser) -> list:
+    path = os.path.join(LANGS, lang, filename)
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as file:
+        return parser(file.read())
+
+
+def _zipf(count: int, exponent: float) -> List[float]:
+    """ Cumulative weights of a Zipf distribution over count ranks """
+    return list(accumulate(1 / rank ** exponent for rank in range(1, count + 1)))
+
+
+class TokenGenerator:
+    """ Draw tokens of a language
+
+    :param language: Key of LANGUAGES
+    :param seed: Seed of the random generator
+    :param lexicon_share: Share of tokens drawn from the shipped lists rather than from the fixtures
+    :param unallowed_share: Share of tokens whose lemma is misspelled
+    :param exponent: Exponent of the Zipf distribution of the shipped lists
+    """
+    def __init__(self, language: str = "old_french", seed: int = 0, lexicon_share: float = 0.4,
+                 unallowed_share: float = 0.02, exponent: float = 1.1):
+        fixtures, lang = LANGUAGES[language]
+        self.random = random.Random(seed)
+        self.lexicon_share = lexicon_share
+        self.unallowed_share = unallowed_share
+
+        observed = Counter(
+            (token.form, token.lemma, token.POS, token.morph)
+            for fixture in fixtures for token in DB_CORPORA[fixture]["tokens"]
+        )
+        self.observed = list(observed)
+        self.observed_weights = list(accumulate(observed.values()))
+
+        self.lemmas = _read(lang, "lemma.txt", read_input_lemma)
+        self.POS = _read(lang, "POS.txt", read_input_POS)
+        self.morph_rows = _read(lang, "morph.txt", read_input_morph)
+        self.morphs = [morph["label"] for morph in self.morph_rows]
+        for values in (self.lemmas, self.POS, self.morphs):
+            self.random.shuffle(values)
+        self.lemma_weights = _zipf(len(self.lemmas), exponent)
+        self.POS_weights = _zipf(len(self.POS), exponent)
+        self.morph_weights = _zipf(len(self.morphs), exponent)
+
+    def allowed_values(self) -> Dict[str, list]:
+        """ Shipped lists of the language, as given to Corpus.create """
+        return {"lemma": sorted(self.lemmas), "POS": sorted(self.POS), "morph": self.morph_rows}
+
+    def _draw(self, values: list, weights: List[float]):
+        if not values:
+            return None
+        return self.random.choices(values, cum_weights=weights)[0]
+
+    def _lexicon_token(self) -> Tuple[str, str, str, str]:
+        lemma = self._draw(self.lemmas, self.lemma_weights)
+        form = lemma.rstrip("0123456789")
+        if self.random.random() < 0.3:
+            # Inflected forms share the lemma but not the form
+            form += self.random.choice("seztn")
+        return form, lemma, self._draw(self.POS, self.POS_weights), self._draw(self.morphs, self.morph_weights)
+
+    def tokens(self, size: int) -> Iterator[Dict[str, str]]:
+        """ Yield size token dicts with form, lemma, POS and morph keys """
+        for _ in range(size):
+            if self.lemmas and self.random.random() < self.lexicon_share:
+                form, lemma, POS, morph = self._lexicon_token()
+            else:
+                form, lemma, POS, morph = self.random.choices(self.observed, cum_weights=self.observed_weights)[0]
+            if lemma and self.random.random() < self.unallowed_share:
+                lemma += "x"
+            yield {"form": form, "lemma": lemma, "POS": POS, "morph": morph}
+
+
+def create_corpus(name: str, size: int, language: str = "old_french", seed: int = 0,
+                  context_left: int = 3, context_right: int = 3) -> Corpus:
+    """ Create a corpus of size synthetic tokens with the shipped control list of the language
+
+    :param name: Name of the corpus
+    :param size: Number of tokens
+    :param language: Key of LANGUAGES
+    :param seed: Seed of the random generator
+    """
+    generator = TokenGenerator(language, seed=seed)
+    allowed = generator.allowed_values()
+    corpus = Corpus.create(
+        name, generator.tokens(size),
+        allowed_lemma=allowed["lemma"], allowed_POS=allowed["POS"],
+        allowed_morph=allowed["morph"],
+        context_left=context_left, context_right=context_right,
+        columns=[Column(heading=heading) for heading in ("Lemma", "POS", "Morph", "Similar")]
+    )
+    db.session.commit()
+    return corpus
+
@@ -1,4 +1,5 @@
 import os
+import tempfile
 from app.lemmatizers import LemmatizerService
 from typing import List
 from sqlalchemy.pool import NullPool
@@ -39,10 +40,31 @@ class Config:
     # Defaults
     PAGINATION_DEFAULT_TOKENS = 100
     CORPUS_UPLOAD_CHUNK_SIZE = int(os.environ.get("CORPUS_UPLOAD_CHUNK_SIZE", 2000))
+    EXPORT_CHUNK_SIZE = int(os.environ.get("EXPORT_CHUNK_SIZE", 1000))
+    # Run long tasks in the background: jobs are run by the run-worker command
+    BACKGROUND_TASKS = True
+    # Files written by jobs, such as exports
+    JOBS_FOLDER = os.environ.get("JOBS_FOLDER", os.path.join(basedir, "jobs"))
     PENDING_CORPUS_MAX_AGE_HOURS = int(os.environ.get("PENDING_CORPUS_MAX_AGE_HOURS", 24))
 
     # Lemmatizer (until Deucalion client)
     LEMMATIZERS: List[LemmatizerService] = []
+    # Server-side lemmatization: words per request, concurrent requests, retries and timeout of each request
+    LEMMATIZER_BATCH_SIZE = int(os.environ.get("LEMMATIZER_BATCH_SIZE", 1000))
+    LEMMATIZER_WORKERS = int(os.environ.get("LEMMATIZER_WORKERS", 4))
+    LEMMATIZER_RETRIES = int(os.environ.get("LEMMATIZER_RETRIES", 3))
+    LEMMATIZER_TIMEOUT = float(os.environ.get("LEMMATIZER_TIMEOUT", 60))
+
+    # SQL instrumentation: query counts and timings per endpoint, shown at /admin/metrics
+    SQL_METRICS = True
+    SQL_METRICS_SLOWEST = int(os.environ.get("SQL_METRICS_SLOWEST", 5))
+    # Statements slower than this many seconds are logged, to SLOW_QUERY_LOG if set
+    SLOW_QUERY_THRESHOLD = float(os.environ.get("SLOW_QUERY_THRESHOLD", 0.5))
+    SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG")
+
+    # Seconds the favorites and control lists of the navigation bar are cached for, 0 to disable. Changes made by
+    # this process are seen at once, changes made by other processes after at most this delay
+    NAV_CACHE_TTL = int(os.environ.get("NAV_CACHE_TTL", 30))
 
     # Change automatically the Postgresql instance language if not english
     FORCE_PSQL_EN_LOCALE = True
@@ -120,6 +142,9 @@ class BaseTestConfig(Config):
 
     # Disable CSRF for login purpose
     WTF_CSRF_ENABLED = False
+    # Tasks run within the request so that tests can check their results
+    BACKGROUND_TASKS = False
+    JOBS_FOLDER = os.path.join(tempfile.gettempdir(), "pyrrha-test-jobs")
 
     # Email
     MAIL_SERVER = os.environ.get('MAIL_SERVER') or 'smtp.mailgun.org'
@@ -0,0 +1,40 @@
+"""Precompute the number of tokens sharing a form and annotation values to count similar tokens
+
+Revision ID: a3c9e5f7b8d1
+Revises: f2b8d4e6a7c9
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'a3c9e5f7b8d1'
+down_revision = 'f2b8d4e6a7c9'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Counts are built on the first read of each corpus
+    op.add_column('corpus', sa.Column('similar_counts_ready', sa.Boolean(), nullable=False, server_default='0'))
+    op.create_table(
+        'similar_count',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('corpus_id', sa.Integer(), nullable=False),
+        sa.Column('mask', sa.SmallInteger(), nullable=False),
+        sa.Column('form', sa.String(length=128), nullable=False),
+        sa.Column('lemma', sa.String(length=128), nullable=True),
+        sa.Column('POS', sa.String(length=128), nullable=True),
+        sa.Column('morph', sa.String(length=1024), nullable=True),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['corpus_id'], ['corpus.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_similar_count_corpus_form', 'similar_count', ['corpus_id', 'form'])
+
+
+def downgrade():
+    op.drop_index('ix_similar_count_corpus_form', table_name='similar_count')
+    op.drop_table('similar_count')
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('similar_counts_ready')
@@ -0,0 +1,36 @@
+"""Add materialized corpus statistics
+
+Revision ID: a7c3e9f1b2d4
+Revises: 06ee9da93d69
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'a7c3e9f1b2d4'
+down_revision = '06ee9da93d69'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Rows are built lazily on first read or with `corpus-stats-rebuild`
+    op.create_table(
+        'corpus_stats',
+        sa.Column('corpus_id', sa.Integer(), nullable=False),
+        sa.Column('word_count', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('changes', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('forms_edited', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('lemma_changed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('POS_changed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('morph_changed', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('needs_review', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('unallowed', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['corpus_id'], ['corpus.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('corpus_id'),
+    )
+
+
+def downgrade():
+    op.drop_table('corpus_stats')
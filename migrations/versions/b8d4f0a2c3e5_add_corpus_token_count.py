@@ -0,0 +1,36 @@
+"""Add cached token count to corpus
+
+Revision ID: b8d4f0a2c3e5
+Revises: a7c3e9f1b2d4
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'b8d4f0a2c3e5'
+down_revision = 'a7c3e9f1b2d4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('corpus', sa.Column('token_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE corpus SET token_count = "
+        "(SELECT COUNT(*) FROM word_token WHERE word_token.corpus = corpus.id)"
+    )
+    # The word count of corpus_stats is superseded by corpus.token_count
+    with op.batch_alter_table('corpus_stats', schema=None) as batch_op:
+        batch_op.drop_column('word_count')
+
+
+def downgrade():
+    with op.batch_alter_table('corpus_stats', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('word_count', sa.Integer(), nullable=False, server_default='0'))
+    op.execute(
+        "UPDATE corpus_stats SET word_count = "
+        "(SELECT token_count FROM corpus WHERE corpus.id = corpus_stats.corpus_id)"
+    )
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('token_count')
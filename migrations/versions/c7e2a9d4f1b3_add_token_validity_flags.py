@@ -0,0 +1,41 @@
+"""Store whether the lemma, POS and morph of each token are allowed, so that unallowed tokens are read from an index
+
+Revision ID: c7e2a9d4f1b3
+Revises: b4d1f6a8c9e2
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'c7e2a9d4f1b3'
+down_revision = 'b4d1f6a8c9e2'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ("lemma", "POS", "morph")
+
+
+def upgrade():
+    # Flags are computed on the first read of each corpus, as its validity_version is NULL
+    op.add_column('corpus', sa.Column('validity_version', sa.String(length=64), nullable=True))
+    for column in COLUMNS:
+        op.add_column(
+            'word_token',
+            sa.Column('{}_valid'.format(column), sa.Boolean(), nullable=False, server_default='1')
+        )
+        op.create_index(
+            'ix_word_token_{}_invalid'.format(column.lower()), 'word_token', ['corpus', 'order_id'],
+            postgresql_where=sa.text('NOT "{}_valid"'.format(column)),
+            sqlite_where=sa.text('"{}_valid" = 0'.format(column))
+        )
+
+
+def downgrade():
+    for column in COLUMNS:
+        op.drop_index('ix_word_token_{}_invalid'.format(column.lower()), table_name='word_token')
+    with op.batch_alter_table('word_token', schema=None) as batch_op:
+        for column in COLUMNS:
+            batch_op.drop_column('{}_valid'.format(column))
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('validity_version')
@@ -0,0 +1,26 @@
+"""Add version counters to control lists and corpus custom dictionaries
+
+Revision ID: c9e5a1b3d4f6
+Revises: b8d4f0a2c3e5
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'c9e5a1b3d4f6'
+down_revision = 'b8d4f0a2c3e5'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('control_lists', sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+    op.add_column('corpus', sa.Column('custom_dictionary_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('custom_dictionary_version')
+    with op.batch_alter_table('control_lists', schema=None) as batch_op:
+        batch_op.drop_column('version')
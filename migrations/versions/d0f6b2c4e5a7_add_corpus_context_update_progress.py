@@ -0,0 +1,23 @@
+"""Track the progress of context updates running in the background
+
+Revision ID: d0f6b2c4e5a7
+Revises: c9e5a1b3d4f6
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'd0f6b2c4e5a7'
+down_revision = 'c9e5a1b3d4f6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('corpus', sa.Column('context_update_progress', sa.Integer(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('context_update_progress')
@@ -0,0 +1,57 @@
+"""Record the language pack default control lists were loaded from and the checksum of its sources
+
+Revision ID: d8b3f5a1c6e4
+Revises: c7e2a9d4f1b3
+Create Date: 2026-10-18
+
+"""
+import glob
+import os
+
+import sqlalchemy as sa
+import yaml
+from alembic import op
+
+revision = 'd8b3f5a1c6e4'
+down_revision = 'c7e2a9d4f1b3'
+branch_labels = None
+depends_on = None
+
+PACKS = os.path.join(os.path.dirname(__file__), "..", "..", "app", "configurations", "langs", "*", "metadata.yaml")
+
+
+def upgrade():
+    op.add_column('control_lists', sa.Column('pack', sa.String(length=64), nullable=True))
+    op.add_column('control_lists', sa.Column('pack_checksum', sa.String(length=64), nullable=True))
+    op.create_index('ix_control_lists_pack', 'control_lists', ['pack'], unique=True)
+
+    # Link the default lists already loaded to their pack by name, the oldest list of a name first. Without a
+    # checksum, add_default_lists leaves them as they are until their pack changes.
+    control_lists = sa.table(
+        'control_lists', sa.column('id', sa.Integer), sa.column('name', sa.String),
+        sa.column('public', sa.String), sa.column('pack', sa.String)
+    )
+    connection = op.get_bind()
+    for metadata_path in sorted(glob.glob(PACKS)):
+        with open(metadata_path, encoding="utf-8") as f:
+            name = yaml.safe_load(f)["name"]
+        list_id = connection.execute(
+            sa.select(control_lists.c.id).where(
+                control_lists.c.name == name,
+                control_lists.c.public == "public",
+                control_lists.c.pack.is_(None)
+            ).order_by(control_lists.c.id).limit(1)
+        ).scalar()
+        if list_id is not None:
+            connection.execute(
+                control_lists.update().where(control_lists.c.id == list_id).values(
+                    pack=os.path.basename(os.path.dirname(metadata_path))
+                )
+            )
+
+
+def downgrade():
+    op.drop_index('ix_control_lists_pack', table_name='control_lists')
+    with op.batch_alter_table('control_lists', schema=None) as batch_op:
+        batch_op.drop_column('pack_checksum')
+        batch_op.drop_column('pack')
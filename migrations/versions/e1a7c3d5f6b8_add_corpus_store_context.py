@@ -0,0 +1,23 @@
+"""Allow corpora to compute contexts when tokens are read instead of storing them
+
+Revision ID: e1a7c3d5f6b8
+Revises: d0f6b2c4e5a7
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'e1a7c3d5f6b8'
+down_revision = 'd0f6b2c4e5a7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('corpus', sa.Column('store_context', sa.Boolean(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('store_context')
@@ -0,0 +1,46 @@
+"""Space token order ids so that tokens are inserted and deleted without renumbering the corpus
+
+Revision ID: f2b8d4e6a7c9
+Revises: e1a7c3d5f6b8
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'f2b8d4e6a7c9'
+down_revision = 'e1a7c3d5f6b8'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Existing order ids are kept with a gap of 1: corpora are renumbered at their first insertion
+    op.add_column('corpus', sa.Column('order_id_gap', sa.Integer(), nullable=False, server_default='1'))
+    with op.batch_alter_table('word_token', schema=None) as batch_op:
+        batch_op.alter_column('order_id', existing_type=sa.Integer(), type_=sa.BigInteger())
+    op.create_table(
+        'token_order_shift',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('corpus_id', sa.Integer(), nullable=False),
+        sa.Column('order_id', sa.BigInteger(), nullable=False),
+        sa.Column('delta', sa.SmallInteger(), nullable=False),
+        sa.ForeignKeyConstraint(['corpus_id'], ['corpus.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_token_order_shift_corpus_order', 'token_order_shift', ['corpus_id', 'order_id'])
+
+
+def downgrade():
+    # Positions are only derived from the shifts: order ids go back to 1, 2, 3...
+    op.execute(
+        "UPDATE word_token SET order_id = numbered.position FROM ("
+        " SELECT id, row_number() OVER (PARTITION BY corpus ORDER BY order_id, id) AS position FROM word_token"
+        ") AS numbered WHERE word_token.id = numbered.id"
+    )
+    op.drop_index('ix_token_order_shift_corpus_order', table_name='token_order_shift')
+    op.drop_table('token_order_shift')
+    with op.batch_alter_table('word_token', schema=None) as batch_op:
+        batch_op.alter_column('order_id', existing_type=sa.BigInteger(), type_=sa.Integer())
+    with op.batch_alter_table('corpus', schema=None) as batch_op:
+        batch_op.drop_column('order_id_gap')
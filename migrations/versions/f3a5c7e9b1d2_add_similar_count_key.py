@@ -0,0 +1,32 @@
+"""Make the signatures of the similar counts unique so that concurrent builds cannot count tokens twice
+
+Revision ID: f3a5c7e9b1d2
+Revises: d8b3f5a1c6e4
+Create Date: 2026-10-18
+
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = 'f3a5c7e9b1d2'
+down_revision = 'd8b3f5a1c6e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Counts may hold duplicates, they are built again on the next read of each corpus
+    op.execute("DELETE FROM similar_count")
+    op.execute(sa.text("UPDATE corpus SET similar_counts_ready = :ready").bindparams(ready=False))
+    op.create_index(
+        'uq_similar_count_key', 'similar_count',
+        [
+            'corpus_id', 'mask', 'form',
+            sa.text("coalesce(lemma, '')"), sa.text("coalesce(\"POS\", '')"), sa.text("coalesce(morph, '')")
+        ],
+        unique=True
+    )
+
+
+def downgrade():
+    op.drop_index('uq_similar_count_key', table_name='similar_count')
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+""" Run the benchmarks of the benchmarks package and compare their results
+
+    python profiling.py run --size 10k --size 100k --output results.json
+    TEST_DBMS=postgresql python profiling.py run --size 1M --output results-psql.json
+    python profiling.py compare previous.json results.json
+"""
+import json
+
+import click
+
+from app import create_app
+
+
+@click.group()
+def cli():
+    """ Benchmarks of Pyrrha on synthetic corpora """
+
+
+@cli.command("run", help="Generate corpora of the given sizes and time the benchmark cases on them. "
+                         "The database of the configuration is dropped.")
+@click.option("--config", default="test", show_default=True, help="Configuration whose database is used")
+@click.option("--size", "sizes", multiple=True, default=["10k"], show_default=True,
+              help="Number of tokens of a corpus, such as 10k, 100k, 1M or 5M (repeatable)")
+@click.option("--benchmark", "names", multiple=True, help="Name of a case to run (repeatable, defaults to all)")
+@click.option("--language", type=click.Choice(["old_french", "latin"]), default="old_french", show_default=True)
+@click.option("--seed", type=click.INT, default=0, show_default=True)
+@click.option("--rounds", type=click.INT, default=5, show_default=True, help="Number of recorded rounds")
+@click.option("--warmup", type=click.INT, default=1, show_default=True, help="Number of rounds run first")
+@click.option("--output", type=click.Path(dir_okay=False), default=None, help="JSON file to write the results to")
+@click.option("--yes", is_flag=True, default=False, help="Do not ask before dropping a non test database")
+def run(config, sizes, names, language, seed, rounds, warmup, output=None, yes=False):
+    from benchmarks import parse_size, run_benchmarks
+
+    if config != "test" and not yes:
+        click.confirm("The database of the {} configuration will be dropped. Continue?".format(config), abort=True)
+    results = run_benchmarks(
+        create_app(config), [parse_size(size) for size in sizes], names=names or None, language=language,
+        seed=seed, rounds=rounds, warmup_rounds=warmup, echo=click.echo
+    )
+    if output:
+        with open(output, "w") as file:
+            json.dump(results, file, indent=2)
+        click.echo("Results written to {}".format(output))
+
+
+@cli.command("compare", help="Compare the median timings of two result files. Exits with 1 on regressions.")
+@click.argument("previous", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current", type=click.Path(exists=True, dir_okay=False))
+@click.option("--threshold", type=click.FLOAT, default=1.2, show_default=True,
+              help="Ratio of the medians above which a case is a regression")
+def compare_results(previous, current, threshold):
+    from benchmarks import compare, load_results
+
+    rows = compare(load_results(previous), load_results(current), threshold=threshold)
+    for name, before, after, ratio, regression in rows:
+        click.echo("{:<45} {:>10.4f}s {:>10.4f}s {:>7.2f}x{}".format(
+            name, before, after, ratio, "  REGRESSION" if regression else ""
+        ))
+    if any(row[4] for row in rows):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    cli()
@@ -1,8 +1,13 @@
 from sqlalchemy import text
 from app import db
+from app.models.validation import clear_caches
+from app.main.views.utils import NAV_CACHE
 
 
 def teardown_db():
+    # Databases are recreated with the same IDs and versions between tests
+    clear_caches()
+    NAV_CACHE.clear()
     db.session.remove()
     if db.engine.dialect.name == "postgresql":
         with db.engine.connect() as conn:
@@ -164,6 +164,7 @@ def add_corpus(
                 z.label_uniform = unidecode.unidecode(z.label_uniform)
             db.session.add(z)
             index += 1
+        corpus_object.token_count = index
 
     db.session.commit()
     
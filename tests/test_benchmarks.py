@@ -0,0 +1,30 @@
+from unittest import TestCase
+
+from app import create_app
+from benchmarks import TokenGenerator, compare, parse_size, run_benchmarks
+
+
+class TestBenchmarks(TestCase):
+    def test_generator(self):
+        """ Synthetic tokens are the same for a given seed and use the shipped control lists """
+        tokens = list(TokenGenerator(seed=3).tokens(500))
+        self.assertEqual(tokens, list(TokenGenerator(seed=3).tokens(500)))
+        self.assertNotEqual(tokens, list(TokenGenerator(seed=4).tokens(500)))
+        allowed = set(TokenGenerator().allowed_values()["lemma"])
+        self.assertGreater(sum(token["lemma"] in allowed for token in tokens), 250)
+        self.assertEqual([parse_size(size) for size in ("10k", "1M", "5m", "300")], [10_000, 1_000_000, 5_000_000, 300])
+
+    def test_run_and_compare(self):
+        """ Every case runs on a small corpus and results can be compared """
+        results = run_benchmarks(create_app("test"), [300], rounds=1, warmup_rounds=0, echo=lambda line: None)
+        names = [bench["fullname"] for bench in results["benchmarks"]]
+        self.assertIn("create_corpus[300]", names)
+        self.assertIn("update_batch_context[300]", names)
+        self.assertTrue(all(bench["stats"]["rounds"] == 1 for bench in results["benchmarks"]))
+
+        slower = {"benchmarks": [
+            dict(bench, stats=dict(bench["stats"], median=bench["stats"]["median"] * 2))
+            for bench in results["benchmarks"]
+        ]}
+        self.assertTrue(all(row[4] for row in compare(results, slower)))
+        self.assertFalse(any(row[4] for row in compare(results, results)))
@@ -4,6 +4,7 @@ function should be done in their respective test modules (see .test_collatinus)
 
 """
 
+import gzip
 import os
 import shutil
 from csv import reader
@@ -20,7 +21,9 @@ from app.models import (
     AllowedLemma,
     AllowedMorph,
     AllowedPOS,
-    WordToken
+    WordToken,
+    Corpus,
+    CorpusStats
 )
 from tests.db_fixtures import add_corpus
 
@@ -206,6 +209,42 @@ class TestCorpusScript(TestCase):
         self.assertIn("1\t| Wauchier", result.output)
         self.assertIn("2\t| Floovant", result.output)
 
+    def test_corpus_stats_rebuild(self):
+        """ Test that statistics are rebuilt for the requested corpora """
+        with self.app.app_context():
+            add_corpus("wauchier", db, tokens_up_to=3)
+            add_corpus("floovant", db, tokens_up_to=5)
+        result = self.invoke("corpus-stats-rebuild", "2")
+        self.assertIn("--- Floovant (2): 5 tokens, 0 changes", result.output)
+        self.assertNotIn("Wauchier", result.output)
+        with self.app.app_context():
+            self.assertEqual(CorpusStats.query.count(), 1)
+
+        result = self.invoke("corpus-stats-rebuild")
+        self.assertIn("--- Wauchier (1): 3 tokens, 0 changes", result.output)
+        with self.app.app_context():
+            self.assertEqual(CorpusStats.query.count(), 2)
+
+    def test_corpus_token_count(self):
+        """ Test that wrong cached token counts are reported and repaired """
+        with self.app.app_context():
+            add_corpus("wauchier", db, tokens_up_to=3)
+            add_corpus("floovant", db, tokens_up_to=5)
+            db.session.get(Corpus, 2).token_count = 12
+            db.session.commit()
+
+        result = self.invoke("corpus-token-count")
+        self.assertIn("--- Floovant (2): 12 cached, 5 actual", result.output)
+        self.assertNotIn("Wauchier", result.output)
+        self.assertIn("1 inconsistent corpora", result.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Corpus, 2).token_count, 12, "Check does not repair")
+
+        result = self.invoke("corpus-token-count", "--repair")
+        self.assertIn("1 corpora repaired", result.output)
+        with self.app.app_context():
+            self.assertEqual(db.session.get(Corpus, 2).token_count, 5)
+
     def test_corpus_dump(self):
         """ Test that data export works correctly """
         # Ingest data this way, not the best practice, but the shortest. Will allow file comparison down the lane
@@ -252,6 +291,31 @@ class TestCorpusScript(TestCase):
             )
             self.assertIn("--- Allowed Morphological Values dumped", result.output)
 
+    def test_corpus_dump_several(self):
+        """ Test that several corpora are dumped in parallel to compressed files, each in its own directory """
+        with self.app.app_context():
+            add_corpus("wauchier", db, with_token=True, with_allowed_lemma=True)
+            add_corpus("floovant", db, tokens_up_to=3, with_allowed_lemma=True, partial_allowed_lemma=True)
+            expected = {
+                corpus_id: WordToken.to_input_format(WordToken.query.filter(WordToken.corpus == corpus_id))
+                for corpus_id in (1, 2)
+            }
+
+        with self.runner.isolated_filesystem() as f:
+            result = self.invoke("corpus-dump", "--all", "--path", "dumps", "--compress", "gzip", "--jobs", "2")
+            self.assertIn("--- Corpus 1 dumped (354 tokens)", result.output)
+            self.assertIn("--- Corpus 2 dumped (3 tokens)", result.output)
+            for corpus_id in (1, 2):
+                with gzip.open(os.path.join(str(f), "dumps", str(corpus_id), "tokens.csv.gz"), "rt", newline="") as file:
+                    self.assertEqual(file.read(), expected[corpus_id])
+            with gzip.open(os.path.join(str(f), "dumps", "2", "allowed_lemma.txt.gz"), "rt") as file:
+                self.assertEqual(file.read(), "escouter\nor4\nseignor")
+
+            result = self.invoke("corpus-dump", "--corpus", "2", "--corpus", "3", "--path", "in_process", "--jobs", "1")
+            self.assertIn("--- Corpus 2 dumped (3 tokens)", result.output)
+            self.assertIn("Corpus 3 not found", result.output)
+            self.assertEqual(os.listdir(os.path.join(str(f), "in_process")), ["2"])
+
     def test_corpus_dump_not_found(self):
         """ Test that data export works correctly by not raising an issue if Corpus does not exist """
         # Ingest data this way, not the best practice, but the shortest. Will allow file comparison down the lane
@@ -275,6 +339,19 @@ class TestCorpusScript(TestCase):
                 "There should be no files"
             )
 
+    def test_corpus_dump_empty(self):
+        """ Test that a corpus without tokens is dumped rather than reported as missing """
+        with self.app.app_context():
+            add_corpus("floovant", db, tokens_up_to=0)
+
+        with self.runner.isolated_filesystem() as f:
+            result = self.invoke("corpus-dump", "2", "--path", "some_dir")
+            self.assertNotIn("Corpus not found", result.output)
+            self.assertHasContents(
+                os.path.join(str(f), "some_dir", "tokens.csv").replace("\r", ""),
+                "token_id	form	lemma	POS	morph\n"
+            )
+
     def  make_test(self, tests, context):
         with self.app.app_context():
             with self.runner.isolated_filesystem() as f:
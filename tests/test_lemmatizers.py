@@ -0,0 +1,78 @@
+import threading
+from unittest import TestCase
+
+from werkzeug.serving import make_server
+
+from app.lemmatizers import LemmatizationPipeline, LemmatizerError, sentence_batches
+from dummy_lemmatizer_service import app as dummy_app
+
+
+class DummyService:
+    """ Serves dummy_lemmatizer_service.py on a free port, failing the first `failures` requests with a 503 """
+    def __init__(self, failures=0, status=503):
+        self.failures = failures
+        self.status = status
+        self.requests = 0
+        self.server = make_server("127.0.0.1", 0, self.wsgi, threaded=True)
+        self.uri = "http://127.0.0.1:{}/lemma".format(self.server.server_port)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def wsgi(self, environ, start_response):
+        self.requests += 1
+        if self.requests <= self.failures:
+            start_response("{} Failure".format(self.status), [("Content-Length", "0")])
+            return [b""]
+        return dummy_app(environ, start_response)
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args):
+        self.server.shutdown()
+        self.thread.join()
+
+
+TEXT = "Lors vint li rois. A la porte il vit le chevalier! Qui dormoit\n\nEt puis"
+
+
+class TestLemmatizationPipeline(TestCase):
+    def test_sentence_batches(self):
+        """ Batches are made of whole sentences, and long sentences are cut """
+        self.assertEqual(
+            list(sentence_batches(TEXT, 8)),
+            ["Lors vint li rois.", "A la porte il vit le chevalier!", "Qui dormoit Et puis"]
+        )
+        self.assertEqual(
+            list(sentence_batches(TEXT, 3)),
+            ["Lors vint li", "rois.", "A la porte", "il vit le", "chevalier!", "Qui dormoit", "Et puis"]
+        )
+        self.assertEqual(list(sentence_batches(" \n ", 3)), [])
+
+    def test_tokens_come_in_order(self):
+        """ Batches are lemmatized concurrently but tokens come back in the order of the text """
+        with DummyService() as service:
+            pipeline = LemmatizationPipeline(service.uri, batch_size=8, max_workers=2, max_pending=2)
+            tokens = list(pipeline.tokens(TEXT))
+        self.assertEqual([token["form"] for token in tokens], TEXT.split())
+        # The dummy service numbers the tokens of each request
+        self.assertEqual(
+            [token["lemma"] for token in tokens],
+            ["0", "1", "2", "3", "0", "1", "2", "3", "4", "5", "6", "0", "1", "2", "3"]
+        )
+        self.assertEqual(service.requests, 3)
+
+    def test_retries(self):
+        """ Failed requests are sent again, unless the service refused them """
+        with DummyService(failures=2) as service:
+            pipeline = LemmatizationPipeline(service.uri, batch_size=100, retries=2, retry_delay=0)
+            self.assertEqual(len(list(pipeline.tokens(TEXT))), 15)
+        with DummyService(failures=3) as service:
+            pipeline = LemmatizationPipeline(service.uri, batch_size=100, retries=2, retry_delay=0)
+            with self.assertRaisesRegex(LemmatizerError, "HTTP 503"):
+                list(pipeline.tokens(TEXT))
+        with DummyService(failures=1, status=400) as service:
+            pipeline = LemmatizationPipeline(service.uri, batch_size=100, retries=2, retry_delay=0)
+            with self.assertRaisesRegex(LemmatizerError, "HTTP 400"):
+                list(pipeline.tokens(TEXT))
+            self.assertEqual(service.requests, 1)
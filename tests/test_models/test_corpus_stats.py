@@ -0,0 +1,62 @@
+from app.models import WordToken, Corpus, CorpusStats, User
+from .base import TestModels
+
+
+COUNTERS = ("changes", "forms_edited", "lemma_changed", "POS_changed", "morph_changed",
+            "needs_review", "unallowed")
+
+
+class TestCorpusStats(TestModels):
+
+    def snapshot(self, stats):
+        return {counter: getattr(stats, counter) for counter in COUNTERS}
+
+    def assertMatchesRebuild(self, corpus):
+        """ Incremental counters should always be what a full rebuild computes """
+        incremental = self.snapshot(CorpusStats.for_corpus(corpus))
+        rebuilt = self.snapshot(CorpusStats.rebuild(corpus))
+        self.assertEqual(incremental, rebuilt)
+        return rebuilt
+
+    def test_built_on_first_read(self):
+        """ Reading statistics creates the materialized row """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertIsNone(self.db.session.get(CorpusStats, 1))
+        statistics = corpus.statistics
+        self.assertEqual(statistics.word_count, 354)
+        self.assertEqual(statistics.changes, 0)
+        self.assertIsNotNone(self.db.session.get(CorpusStats, 1))
+
+    def test_incremental_updates(self):
+        """ Token updates and form editions are counted without rebuilding """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        user = self.db.session.get(User, 1)
+        CorpusStats.for_corpus(corpus)
+
+        WordToken.update(user_id=1, corpus_id=1, token_id=1, lemma="saint")
+        WordToken.update(user_id=1, corpus_id=1, token_id=1, lemma="de")
+        WordToken.update(user_id=1, corpus_id=1, token_id=2, POS="NOMpro")
+        self.db.session.get(WordToken, 3).add_form("Saint", corpus, user)
+        self.db.session.get(WordToken, 5).edit_form("moult", corpus, user)
+        self.db.session.get(WordToken, 2).del_form(corpus, user)
+        self.db.session.commit()
+
+        counters = self.assertMatchesRebuild(corpus)
+        self.assertEqual(corpus.token_count, 354)
+        self.assertEqual(counters["changes"], 3)
+        self.assertEqual(counters["forms_edited"], 3)
+        self.assertEqual(counters["lemma_changed"], 1)
+        self.assertEqual(counters["POS_changed"], 0, "The corrected token was deleted")
+
+    def test_unallowed_invalidated_by_batch(self):
+        """ Adding tokens in batch marks the unallowed counter as stale """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        CorpusStats.for_corpus(corpus)
+        WordToken.add_batch(1, [{"form": "Cil", "lemma": "cil"}], order_id_offset=354)
+        self.db.session.commit()
+        self.assertIsNone(self.db.session.get(CorpusStats, 1).unallowed)
+        self.assertMatchesRebuild(corpus)
+        self.assertEqual(corpus.token_count, 355)
@@ -0,0 +1,95 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from .base import TestModels
+from app.models import ControlLists, AllowedLemma, AllowedMorph, AllowedPOS, PublicationStatus
+from app.utils import packs
+from app.utils.packs import load_pack, COMPILED_NAME
+
+
+class TestDefaultLists(TestModels):
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        self.pack = os.path.join(self.directory, "old_french")
+        os.makedirs(self.pack)
+        self.write("metadata.yaml", 'name: "Ancien Français"\nlanguage: "fro"\n')
+        self.write("lemma.txt", "seignor\nchevalier\névesque\n")
+        self.write("POS.txt", "NOMcom,VERcjg")
+        self.write("morph.txt", "label\treadable\nNOMB.=s|GENRE=m\tsingulier, masculin\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+        super().tearDown()
+
+    def write(self, name, content):
+        with open(os.path.join(self.pack, name), "w", encoding="utf-8") as f:
+            f.write(content)
+
+    def load(self):
+        return ControlLists.add_default_lists(os.path.join(self.directory, "**"))
+
+    def test_compiled_pack(self):
+        """ Packs are compiled once with their normalized lemma, and compiled again when their sources change """
+        pack = load_pack(self.pack)
+        self.assertTrue(os.path.exists(os.path.join(self.pack, COMPILED_NAME)))
+        self.assertEqual(pack.lemma, [("seignor", "seignor"), ("chevalier", "chevalier"), ("évesque", "evesque")])
+        self.assertEqual(pack.POS, [("NOMcom", ), ("VERcjg", )])
+        self.assertEqual(pack.morph, [("NOMB.=s|GENRE=m", "singulier, masculin")])
+
+        with mock.patch.object(packs, "_parse_sources", wraps=packs._parse_sources) as parse:
+            self.assertEqual(load_pack(self.pack), pack)
+            self.assertFalse(parse.called, "The compiled pack should have been read")
+            self.write("lemma.txt", "seignor\n")
+            self.assertEqual(load_pack(self.pack).lemma, [("seignor", "seignor")])
+            self.assertTrue(parse.called, "The outdated compiled pack should have been replaced")
+
+    def test_add_default_lists(self):
+        """ Lists are created from their pack, skipped when it did not change and updated when it did """
+        self.assertEqual(self.load(), {"old_french": "created"})
+        control_list = ControlLists.query.filter_by(pack="old_french").one()
+        self.assertEqual(control_list.name, "Ancien Français")
+        self.assertEqual(
+            [(lemma.label, lemma.label_uniform) for lemma in control_list.get_allowed_values("lemma", order_by="id")],
+            [("seignor", "seignor"), ("chevalier", "chevalier"), ("évesque", "evesque")]
+        )
+        self.assertEqual(AllowedPOS.query.filter_by(control_list=control_list.id).count(), 2)
+        self.assertEqual(AllowedMorph.query.filter_by(control_list=control_list.id).one().readable,
+                         "singulier, masculin")
+
+        version = control_list.version
+        self.assertEqual(self.load(), {"old_french": "unchanged"})
+        self.assertEqual(self.db.session.get(ControlLists, control_list.id).version, version)
+
+        kept = AllowedLemma.query.filter_by(control_list=control_list.id, label="seignor").one().id
+        self.write("lemma.txt", "seignor\névesque\nroi\n")
+        self.assertEqual(self.load(), {"old_french": "updated"})
+        self.assertEqual(
+            [(lemma.id == kept, lemma.label) for lemma in control_list.get_allowed_values("lemma", order_by="id")],
+            [(True, "seignor"), (False, "évesque"), (False, "roi")]
+        )
+        self.assertEqual(ControlLists.query.filter_by(pack="old_french").count(), 1)
+
+    def test_lists_loaded_before_packs(self):
+        """ A list loaded before lists recorded their pack is linked to it by name instead of being copied """
+        control_list = ControlLists(name="Ancien Français", public=PublicationStatus.public)
+        self.db.session.add(control_list)
+        self.db.session.flush()
+        AllowedLemma.add_batch(["seignor", "edited"], control_list.id, _commit=True)
+
+        self.assertEqual(self.load(), {"old_french": "linked"})
+        self.assertEqual(ControlLists.query.filter_by(name="Ancien Français").count(), 1)
+        self.assertEqual(self.db.session.get(ControlLists, control_list.id).pack, "old_french")
+        self.assertEqual(
+            [lemma.label for lemma in control_list.get_allowed_values("lemma", order_by="id")], ["seignor", "edited"],
+            "The values of the list are left as they are"
+        )
+
+        self.assertEqual(self.load(), {"old_french": "unchanged"})
+        self.write("lemma.txt", "seignor\nroi\n")
+        self.assertEqual(self.load(), {"old_french": "updated"})
+        self.assertEqual(
+            [lemma.label for lemma in control_list.get_allowed_values("lemma", order_by="id")], ["seignor", "roi"]
+        )
@@ -0,0 +1,132 @@
+from datetime import timedelta
+from unittest.mock import patch
+
+from flask import current_app
+
+from .base import TestModels
+from app.jobs import Worker
+from app.models import Job, Corpus, WordToken, User
+
+
+@Job.register("test.flaky")
+def flaky_task(job, failures):
+    """ Fails at each of the first attempts """
+    if job.attempts <= failures:
+        raise RuntimeError("Attempt {}".format(job.attempts))
+    return {"attempts": job.attempts}
+
+
+@Job.register("test.cancelled")
+def cancelled_task(job):
+    """ Is cancelled while running """
+    job.cancel()
+    job.report(1, total=2)
+
+
+class TestJobs(TestModels):
+    def enqueue(self, task, **kwargs) -> int:
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            job = Job.enqueue(task, **kwargs)
+        self.assertEqual(job.status, Job.QUEUED)
+        return job.id
+
+    def test_worker_runs_queued_jobs(self):
+        """ Jobs enqueued in the background are run by the worker and report their progress """
+        self.addCorpus("wauchier", with_token=True)
+        job_id = self.enqueue("corpus.delete", corpus_id=1, chunk_size=100)
+        self.assertEqual(self.db.session.get(Corpus, 1).token_count, 354, "Nothing is done before the worker runs")
+
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        job = self.db.session.get(Job, job_id)
+        self.assertEqual(
+            (job.status, job.progress, job.total, job.to_dict()["result"]),
+            (Job.DONE, 354, 354, {"tokens": 354})
+        )
+        self.assertIsNone(self.db.session.get(Corpus, 1))
+        self.assertEqual(WordToken.query.count(), 0)
+
+    def test_failed_jobs_are_retried(self):
+        """ Failed jobs are queued again until they reach their maximum number of attempts """
+        succeeding = self.enqueue("test.flaky", failures=1)
+        failing = self.enqueue("test.flaky", failures=5, max_attempts=2)
+        with patch.object(Job, "RETRY_DELAY", 0):
+            self.assertEqual(Worker(interval=0).run(burst=True), 4)
+
+        job = self.db.session.get(Job, succeeding)
+        self.assertEqual((job.status, job.attempts, job.to_dict()["result"]), (Job.DONE, 2, {"attempts": 2}))
+        job = self.db.session.get(Job, failing)
+        self.assertEqual((job.status, job.attempts, job.error), (Job.FAILED, 2, "RuntimeError: Attempt 2"))
+
+    def test_cancellation(self):
+        """ Queued jobs are cancelled right away, running jobs at their next report """
+        queued = self.enqueue("test.flaky", failures=0)
+        self.db.session.get(Job, queued).cancel()
+        running = self.enqueue("test.cancelled")
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+
+        self.assertEqual(self.db.session.get(Job, queued).status, Job.CANCELLED)
+        self.assertEqual(self.db.session.get(Job, queued).attempts, 0, "The queued job never ran")
+        self.assertEqual(self.db.session.get(Job, running).status, Job.CANCELLED)
+
+    def test_uncancellable_jobs(self):
+        """ Corpus deletions are not stopped halfway, and only the user who asked for a job can cancel it """
+        self.addCorpus("wauchier", with_token=True)
+        deletion = self.enqueue("corpus.delete", corpus_id=1, user_id=1)
+        job = self.db.session.get(Job, deletion)
+        self.assertFalse(job.cancel())
+        self.assertEqual((job.status, job.cancel_requested), (Job.QUEUED, False))
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        self.assertEqual(self.db.session.get(Job, deletion).status, Job.DONE)
+        self.assertIsNone(self.db.session.get(Corpus, 1))
+
+        export = self.db.session.get(Job, self.enqueue("test.flaky", failures=0, user_id=1))
+        self.assertTrue(export.cancellable)
+        self.assertTrue(export.can_be_cancelled_by(self.db.session.get(User, 1)))
+        self.assertTrue(export.cancel())
+        self.assertFalse(export.cancellable, "Finished jobs cannot be cancelled")
+
+    def test_context_update_released_when_job_ends(self):
+        """ A context update cancelled while queued or lost by its worker does not block the next ones """
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            corpus.update_contexts(2, 2)
+        job = Job.query.filter_by(task="corpus.contexts").one()
+        self.assertEqual(self.db.session.get(Corpus, 1).context_update_progress, 0)
+        job.cancel()
+        self.assertIsNone(self.db.session.get(Corpus, 1).context_update_progress)
+
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            corpus.update_contexts(1, 1)
+        job = Job.query.filter_by(task="corpus.contexts", status=Job.QUEUED).one()
+        job.start("lost", _commit=False)
+        job.heartbeat_at = job.heartbeat_at - timedelta(seconds=Job.STALE_AFTER + 1)
+        job.max_attempts = 1
+        self.db.session.commit()
+        self.assertEqual(Job.requeue_stale(), 1)
+        self.assertEqual(self.db.session.get(Job, job.id).status, Job.FAILED)
+        self.assertIsNone(self.db.session.get(Corpus, 1).context_update_progress)
+
+        corpus.update_contexts(3, 2)
+        self.assertEqual(WordToken.query.filter_by(corpus=1, order_id=2).one().right_context, "Martin mout")
+
+    def test_jobs_run_inline_without_background_tasks(self):
+        """ Jobs are run when they are enqueued when background tasks are disabled """
+        job = Job.enqueue("test.flaky", failures=1)
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 1), "Inline jobs are not retried")
+        job = Job.enqueue("test.flaky", failures=0)
+        self.assertEqual(job.status, Job.DONE)
+
+    def test_heartbeat_committed_while_task_runs(self):
+        """ Reports are seen by other connections before the transaction of the task ends """
+        job = self.db.session.get(Job, self.enqueue("test.flaky", failures=0))
+        job.start("worker")
+        job.heartbeat_at = job.heartbeat_at - timedelta(seconds=Job.STALE_AFTER + 1)
+        self.db.session.commit()
+        with patch.object(Job, "SINGLE_WRITER_DIALECTS", set()):
+            job.report(5, total=10)
+            with self.db.engine.connect() as connection:
+                self.assertEqual(connection.execute(Job.__table__.select()).one().progress, 5)
+                self.assertEqual(Job.requeue_stale(), 0, "The job is not considered lost")
+        self.db.session.rollback()
+        self.assertEqual((self.db.session.get(Job, job.id).progress, job.total), (5, 10))
@@ -1,4 +1,4 @@
-from app.models import ChangeRecord, WordToken, Corpus, ControlLists, ControlListsUser, CorpusUser, Column
+from app.models import ChangeRecord, WordToken, Corpus, ControlLists, ControlListsUser, CorpusUser, Column, CorpusStats
 from .base import TestModels
 import copy
 
@@ -79,6 +79,7 @@ class TestChangeRecord(TestModels):
             [4, 5],
             "4 and 5 are similar"
         )
+        self.assertEqual(change_record.similar_remaining, 2, "Precomputed counts agree with the query")
 
         tokens = change_record.apply_changes_to(user_id=1, token_ids=[4, 5])
         tok_4 = self.tok_with_id(tokens, 4)
@@ -110,8 +111,13 @@ class TestChangeRecord(TestModels):
             [3, 4, 5],
             "4 and 5 are similar; 3 has a common lemma with the new lemma created"
         )
+        self.assertEqual(change_record.similar_remaining, 3, "Precomputed counts agree with the query")
 
         tokens = change_record.apply_changes_to(user_id=1, token_ids=[3, 4, 5])
+        self.assertEqual(
+            change_record.similar_remaining, WordToken.get_similar_to_record(change_record).count(),
+            "Counts are maintained by the updates"
+        )
         # 3 : Common lemma new with already "cil" in this token, but different P that needs to be updated
         tok_3 = self.tok_with_id(tokens, 3)
         self.assertEqual(tok_3.lemma, "cil", "Lemma was already the same")
@@ -155,3 +161,29 @@ class TestChangeRecord(TestModels):
 
 
 
+
+    def test_apply_changes_in_bulk(self):
+        """ Changes are applied to the tokens having the old values, with one record per updated token """
+        self.load_fixtures()
+        corpus = self.db.session.get(Corpus, 1)
+        CorpusStats.for_corpus(corpus)
+        _, change_record = WordToken.update(user_id=1, token_id=1, corpus_id=1, lemma="cil", POS="u")
+
+        tokens = change_record.apply_changes_to(user_id=1, token_ids=["2", "3", "4", "5", "6"])
+        self.assertCountEqual(
+            [(tok.id, tok.lemma, tok.POS, tok.morph, tok.label_uniform) for tok in tokens],
+            [(3, "cil", "u", "smn", "cil"), (4, "cil", "u", "mmn", "cil"),
+             (5, "cil", "n", "mmn", "cil"), (6, "cel", "u", "smn", "cel")],
+            "2 has none of the old values and is left untouched"
+        )
+        self.assertEqual(
+            [(rec.word_token_id, rec.lemma, rec.lemma_new, rec.POS, rec.POS_new)
+             for rec in ChangeRecord.query.filter(ChangeRecord.id != change_record.id).order_by(ChangeRecord.word_token_id)],
+            [(3, "cil", "cil", "p", "u"), (4, "celui", "cil", "p", "u"),
+             (5, "celui", "cil", "n", "n"), (6, "cel", "cel", "p", "u")]
+        )
+        stats = CorpusStats.for_corpus(corpus)
+        incremental = (stats.changes, stats.lemma_changed, stats.POS_changed, stats.unallowed)
+        stats = CorpusStats.rebuild(corpus)
+        self.assertEqual(incremental, (stats.changes, stats.lemma_changed, stats.POS_changed, stats.unallowed))
+        self.assertEqual(stats.changes, 5)
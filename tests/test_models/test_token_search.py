@@ -0,0 +1,71 @@
+from itertools import product
+
+from sqlalchemy import and_, or_
+
+from .base import TestModels
+from app.models import Corpus, WordToken
+from app.utils.forms import column_search_filter, prepare_search_string
+
+
+class TestTokenSearch(TestModels):
+    SEARCHES = [
+        {},
+        {"lemma": "et"},
+        {"form": "Et|de|bien", "POS": "CONcoo|PRE|ADVgen"},
+        {"form": "et|de|.|,", "lemma": "et|de|le|a", "POS": "PRE|CONcoo|PONfrt"},
+        {"form": "b*|!e*", "lemma": "!de"},
+        {"lemma": "faire|f*|!il|!le", "POS": "VER*|NOMcom"},
+        {"lemma": "de|", "POS": "PRE"},
+        {"lemma": "None|de", "form": "!|de"},
+        {"form": "\\*|\\!|%|a\\|b", "lemma": "!bien"},
+        {"morph": "None", "POS": "!NOMcom|!PRE"},
+    ]
+
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier")
+        self.corpus = self.db.session.get(Corpus, 1)
+
+    def branches_search(self, token_dict, case_sensitive):
+        """ Former implementation, with one OR'ed branch per combination of alternatives """
+        fields = [
+            [(name, value) for value in prepare_search_string(token_dict[name])]
+            for name in ("form", "lemma", "POS", "morph")
+            if token_dict.get(name, "").strip()
+        ]
+        branches = [
+            and_(WordToken.corpus == self.corpus.id, *[
+                condition
+                for name, value in branch
+                for condition in column_search_filter(getattr(WordToken, name), value, case_sensitive=case_sensitive)
+            ])
+            for branch in product(*fields)
+        ]
+        return [token.id for token in WordToken.query.filter(or_(*branches)).order_by(WordToken.order_id)]
+
+    def test_same_results_as_branches(self):
+        """ Collapsing alternatives per field finds the same tokens as combining every alternative """
+        for case_sensitive in (True, False):
+            for search in self.SEARCHES:
+                with self.subTest(search=search, case_sensitive=case_sensitive):
+                    tokens, _, _ = self.corpus.token_search(search, case_sensitive=case_sensitive)
+                    self.assertEqual(
+                        [token.id for token in tokens], self.branches_search(search, case_sensitive)
+                    )
+        tokens, _, _ = self.corpus.token_search({"lemma": "et|de"})
+        self.assertEqual(tokens.count(), 44)
+
+    def test_equalities_are_collapsed(self):
+        """ Equality alternatives of a field become a single IN, other alternatives stay OR'ed """
+        tokens, _, _ = self.corpus.token_search(
+            {"form": "a|b|c|d", "lemma": "w|x|y|z*", "POS": "NOM|VER|ADJ"}, case_sensitive=True
+        )
+        sql = str(tokens.statement.compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("word_token.form IN ('a', 'b', 'c', 'd')", sql)
+        self.assertIn("word_token.lemma IN ('w', 'x', 'y') OR word_token.lemma LIKE 'z%'", sql)
+        self.assertIn("word_token.\"POS\" IN ('NOM', 'VER', 'ADJ')", sql)
+        self.assertEqual(sql.count(" OR "), 1)
+
+        tokens, _, _ = self.corpus.token_search({"form": "Et|De"})
+        sql = str(tokens.statement.compile(compile_kwargs={"literal_binds": True}))
+        self.assertIn("lower(word_token.form) IN ('et', 'de')", sql)
@@ -0,0 +1,121 @@
+from sqlalchemy import event
+
+from app.models import WordToken, Corpus, AllowedLemma, CorpusCustomDictionary
+from app.models.validation import search_allowed_values, search_allowed_morph
+from app.utils.cache import LRUCache
+from .base import TestModels
+
+
+class TestValidator(TestModels):
+
+    def is_lemma_valid(self, corpus, lemma):
+        return WordToken.is_valid(lemma=lemma, POS=None, morph=None, corpus=corpus, form="form")["lemma"]
+
+    def count_queries(self, callback):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        event.listen(self.db.engine, "before_cursor_execute", record)
+        try:
+            callback()
+        finally:
+            event.remove(self.db.engine, "before_cursor_execute", record)
+        return len(statements)
+
+    def test_no_query_in_steady_state(self):
+        """ Once the control list is cached, validating a token does not hit the database """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertTrue(self.is_lemma_valid(corpus, "saint"))
+        self.assertEqual(
+            self.count_queries(lambda: (self.is_lemma_valid(corpus, "saint"), self.is_lemma_valid(corpus, "seint"))),
+            0
+        )
+        self.assertFalse(self.is_lemma_valid(corpus, "seint"))
+
+    def test_control_list_change_invalidates(self):
+        """ Adding allowed values bumps the control list version and refreshes the cache """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertFalse(self.is_lemma_valid(corpus, "seint"))
+        AllowedLemma.add_batch(["seint"], corpus.control_lists_id, _commit=True)
+        self.assertTrue(self.is_lemma_valid(corpus, "seint"))
+
+    def test_custom_dictionary_change_invalidates(self):
+        """ Updating the custom dictionary bumps its version and refreshes the cache """
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True)
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertFalse(self.is_lemma_valid(corpus, "seint"))
+        corpus.custom_dictionaries_update("lemma", "seint\nmout")
+        self.assertTrue(self.is_lemma_valid(corpus, "seint"))
+        corpus.custom_dictionaries_update("lemma", "mout")
+        self.assertFalse(self.is_lemma_valid(corpus, "seint"))
+
+
+class TestAutocompleteIndex(TestModels):
+
+    def get_like(self, control_list_id, allowed_type, form):
+        return sorted(
+            label
+            for label, in WordToken.get_like(control_list_id, form, group_by=True, type_like=allowed_type,
+                                             allowed_list=True)
+        )
+
+    def test_same_values_as_get_like(self):
+        """ The index finds the same lemma and POS as the SQL prefix search """
+        self.addCorpus("wauchier", with_allowed_lemma=True, with_allowed_pos=True)
+        control_list_id = self.db.session.get(Corpus, 1).control_lists_id
+        for allowed_type, form in [("lemma", "s"), ("lemma", "SA"), ("lemma", "öi"), ("lemma", "oi"),
+                                   ("lemma", ""), ("lemma", "zzz"), ("POS", "v"), ("POS", "ADJ")]:
+            self.assertEqual(
+                sorted(search_allowed_values(control_list_id, allowed_type, form, 10000)),
+                self.get_like(control_list_id, allowed_type, form),
+                (allowed_type, form)
+            )
+        self.assertEqual(len(search_allowed_values(control_list_id, "lemma", "", 5)), 5)
+
+    def test_control_list_change_invalidates(self):
+        """ Adding allowed values rebuilds the index """
+        self.addCorpus("wauchier", with_allowed_lemma=True)
+        control_list_id = self.db.session.get(Corpus, 1).control_lists_id
+        self.assertEqual(search_allowed_values(control_list_id, "lemma", "zz", 20), [])
+        AllowedLemma.add_batch(["zzyzx"], control_list_id, _commit=True)
+        self.assertEqual(search_allowed_values(control_list_id, "lemma", "zz", 20), ["zzyzx"])
+
+    def test_memory_budget(self):
+        """ Least recently used entries are evicted once the budget is exceeded """
+        cache = LRUCache(maxsize=10, max_weight=10, weigh=len)
+        cache.set("a", "aaaa")
+        cache.set("b", "bbbb")
+        cache.get("a")
+        cache.set("c", "cccc")
+        self.assertEqual(("a" in cache, "b" in cache, "c" in cache), (True, False, True))
+        self.assertEqual(cache.weight, 8)
+        cache.set("d", "d" * 20)
+        self.assertEqual((len(cache), cache.weight), (1, 20))
+
+    def test_same_morph_as_get_like(self):
+        """ The inverted index finds the same morph as the SQL fragment search, for control lists and custom
+        dictionaries """
+        self.addCorpus("floovant", with_allowed_morph=True)
+        corpus = Corpus.query.one()
+        corpus.custom_dictionaries_update(
+            "morph", "MODE=ind|TEMPS=pst\tindicatif présent\nNOMB.=p|CAS=r\tpluriel régime\nCAS=n"
+        )
+        for form in ["2 plur", "=r =p", "PLURIEL", "régime", "mode=imp pers", "p", "", "zz", "s=p"]:
+            self.assertEqual(
+                search_allowed_morph(corpus.control_lists_id, form, 10000),
+                sorted(WordToken.get_like(corpus.control_lists_id, form, group_by=True, type_like="morph",
+                                          allowed_list=True).all()),
+                form
+            )
+            if not form:
+                continue  # The custom dictionary API does not search for empty forms
+            self.assertEqual(
+                CorpusCustomDictionary.search_morph(corpus, form, 10000),
+                sorted(CorpusCustomDictionary.get_like(corpus.id, form, group_by=True, category="morph").all(),
+                       key=lambda row: (row[0], row[1] or "")),
+                form
+            )
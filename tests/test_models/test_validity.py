@@ -0,0 +1,153 @@
+from flask import current_app
+from unittest.mock import patch
+
+from app.jobs import Worker
+from app.models import WordToken, Corpus, CorpusStats, ControlLists, AllowedLemma, User, Job
+from .base import TestModels
+
+
+class TestValidityFlags(TestModels):
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier", with_allowed_lemma=True, partial_allowed_lemma=True,
+                       with_allowed_pos=True, partial_allowed_pos=True)
+        self.corpus = self.db.session.get(Corpus, 1)
+
+    def scan(self, allowed_type):
+        """ Unallowed tokens found by checking every token against the allowed values """
+        return [
+            token.id
+            for token in WordToken.query.filter(
+                WordToken.corpus == self.corpus.id, *self.corpus._unallowed_conditions(allowed_type)
+            ).order_by(WordToken.order_id)
+        ]
+
+    def assertFlagsMatchScan(self):
+        for allowed_type in ("lemma", "POS", "morph"):
+            self.assertEqual(
+                [token.id for token in self.corpus.get_unallowed(allowed_type)], self.scan(allowed_type),
+                "Unallowed {} should be the same with flags and with a scan".format(allowed_type)
+            )
+        stats = CorpusStats.for_corpus(self.corpus)
+        self.assertEqual(stats.unallowed, self.corpus.count_invalid())
+        self.assertEqual(stats.unallowed, CorpusStats.rebuild(self.corpus).unallowed)
+
+    def test_flags_set_on_read(self):
+        """ Flags are computed on first read and then follow the allowed values """
+        self.assertIsNone(self.corpus.validity_version)
+        self.assertFlagsMatchScan()
+        self.assertTrue(self.corpus.validity_current)
+        self.assertGreater(len(self.scan("lemma")), 0)
+
+    def test_control_list_changes(self):
+        """ Adding allowed values, changing filters and switching control lists recompute the flags """
+        self.assertFlagsMatchScan()
+        AllowedLemma.add_batch(["seignor", "avoir"], control_lists_id=self.corpus.control_lists_id)
+        self.assertFalse(self.corpus.validity_current)
+        self.assertFlagsMatchScan()
+
+        control_list = self.db.session.get(ControlLists, self.corpus.control_lists_id)
+        control_list.filter_punct = True
+        control_list.filter_metadata = True
+        self.db.session.commit()
+        self.assertFlagsMatchScan()
+
+        self.db.session.add(ControlLists(id=2, name="Empty"))
+        self.corpus.control_lists_id = 2
+        self.db.session.commit()
+        self.assertFlagsMatchScan()
+
+    def test_stale_flags_refreshed_by_a_job(self):
+        """ Unallowed tokens are checked on the fly while the flags are stale, a job recomputes the flags """
+        self.assertFlagsMatchScan()
+        flagged = [token.id for token in self.corpus.get_unallowed("lemma")]
+        AllowedLemma.add_batch(["seignor", "avoir"], control_lists_id=self.corpus.control_lists_id)
+        self.db.session.commit()
+        self.assertEqual([token.id for token in self.corpus.get_unallowed("lemma")], self.scan("lemma"))
+        self.assertFalse(self.corpus.validity_current, "Reading does not recompute the flags")
+        self.assertEqual(
+            [token.id for token in WordToken.query.filter_by(corpus=1, lemma_valid=False).order_by("order_id")],
+            flagged
+        )
+
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            Corpus.schedule_validity(control_list_id=self.corpus.control_lists_id)
+            Corpus.schedule_validity(corpus_id=1)
+        self.assertEqual([job.status for job in Job.query.filter_by(task="corpus.validity")], [Job.QUEUED])
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        self.corpus = self.db.session.get(Corpus, 1)
+        self.assertTrue(self.corpus.validity_current)
+        self.assertFlagsMatchScan()
+
+    def test_custom_dictionary(self):
+        """ Values of the custom dictionary are allowed """
+        lemma = self.db.session.get(WordToken, self.scan("lemma")[0]).lemma
+        self.corpus.custom_dictionaries_update("lemma", lemma)
+        self.assertFlagsMatchScan()
+        self.assertNotIn(lemma, [token.lemma for token in self.corpus.get_unallowed("lemma")])
+
+    def test_token_edition(self):
+        """ Edited, added and removed tokens keep their flags and the unallowed counter up to date """
+        self.assertFlagsMatchScan()
+        user = self.db.session.get(User, 1)
+        unallowed = self.scan("lemma")
+        WordToken.update(user_id=1, corpus_id=1, token_id=unallowed[0], lemma="saint")
+        WordToken.update_many(1, 1, [{"token_id": unallowed[1], "lemma": "de"}])
+        self.assertFlagsMatchScan()
+        self.assertNotIn(unallowed[0], self.scan("lemma"))
+
+        self.db.session.get(WordToken, 3).add_form("Saint", self.corpus, user)
+        self.db.session.get(WordToken, unallowed[2]).del_form(self.corpus, user)
+        self.db.session.get(WordToken, 5).edit_form("moult", self.corpus, user)
+        self.assertFlagsMatchScan()
+
+        WordToken.add_batch(1, [{"form": "Cil", "lemma": "cil"}, {"form": "vint", "lemma": "venir"}],
+                            order_id_offset=354)
+        self.db.session.commit()
+        self.assertFlagsMatchScan()
+
+    def test_allowed_values_update(self):
+        """ Updating the allowed values writes the difference and revalidates the tokens of the changed labels """
+        self.assertFlagsMatchScan()
+        control_list = self.db.session.get(ControlLists, self.corpus.control_lists_id)
+        current = control_list.get_allowed_values("lemma", order_by="id").all()
+        kept = {allowed.label: allowed.id for allowed in current[1:]}
+        removed = current[0].label
+        added = self.db.session.get(WordToken, self.scan("lemma")[0]).lemma
+
+        change = control_list.update_allowed_values("lemma", list(kept) + [added, "zzyzx"])
+        self.assertEqual((change.added, change.removed, change.updated), ([added, "zzyzx"], [removed], []))
+        self.assertEqual(change.to_dict(), {"added": 2, "removed": 1, "updated": 0})
+        self.assertEqual(
+            {allowed.label: allowed.id for allowed in control_list.get_allowed_values("lemma")
+             if allowed.label in kept}, kept, "Kept values should not be rewritten"
+        )
+        self.assertTrue(self.corpus.validity_current, "Flags should have been updated, not marked as stale")
+        self.assertIn(removed, [token.lemma for token in self.corpus.get_unallowed("lemma")])
+        self.assertNotIn(added, [token.lemma for token in self.corpus.get_unallowed("lemma")])
+        self.assertFlagsMatchScan()
+
+        version = self.db.session.get(ControlLists, self.corpus.control_lists_id).version
+        change = control_list.update_allowed_values("lemma", list(kept) + [added, "zzyzx"])
+        self.assertFalse(change.changed)
+        self.assertEqual(self.db.session.get(ControlLists, self.corpus.control_lists_id).version, version)
+
+    def test_allowed_morph_update(self):
+        """ Readable forms of kept morphs are updated in place """
+        control_list = self.db.session.get(ControlLists, self.corpus.control_lists_id)
+        control_list.update_allowed_values("morph", [
+            {"label": "NOMB.=s|GENRE=m|CAS=n", "readable": "singulier masculin nominatif"},
+            {"label": "NOMB.=p|GENRE=m|CAS=n", "readable": "pluriel masculin nominatif"}
+        ])
+        self.assertFlagsMatchScan()
+        change = control_list.update_allowed_values("morph", [
+            {"label": "NOMB.=s|GENRE=m|CAS=n", "readable": "nominatif singulier masculin"},
+            {"label": "_", "readable": "pas de morphologie"}
+        ])
+        self.assertEqual(change.to_dict(), {"added": 1, "removed": 1, "updated": 1})
+        self.assertEqual(
+            [(allowed.label, allowed.readable) for allowed in control_list.get_allowed_values("morph", order_by="id")],
+            [("NOMB.=s|GENRE=m|CAS=n", "nominatif singulier masculin"), ("_", "pas de morphologie")]
+        )
+        self.assertTrue(self.corpus.validity_current)
+        self.assertFlagsMatchScan()
@@ -1,6 +1,15 @@
+from flask import current_app
+
 from .base import TestModels
-from app.models import WordToken, Corpus
+from app.jobs import Worker
+from app.models import WordToken, Corpus, TokenHistory, TokenOrderShift, User, SimilarCount, Job
 from app.utils import ValidationError
+from app.errors import MissingTokenColumnValue
+from app.utils.sql_metrics import count_queries
+import math
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.exc import IntegrityError
+from unittest.mock import Mock, patch
 import random
 import string
 
@@ -58,11 +67,127 @@ class TestGetSimilarForBatch(TestModels):
         WordToken.get_similar_for_batch(corpus, page_tokens)
         self.assertEqual(page_tokens[0].similar, 0)
 
+    def test_similar_count_long_morph(self):
+        """Morph values longer than 128 characters are counted like the others"""
+        corpus, tokens = self._make_corpus()
+        morph = "|".join("FEAT{}=value".format(index) for index in range(30))
+        self.assertGreater(len(morph), 128)
+        for token in tokens[:2]:
+            token.morph = morph
+        self.db.session.commit()
+        for column in ("form", "lemma", "POS", "morph"):
+            self.assertGreaterEqual(
+                SimilarCount.__table__.c[column].type.length, WordToken.__table__.c[column].type.length,
+                "Any value of the token should fit in the counts"
+            )
+        WordToken.get_similar_for_batch(corpus, tokens[:2])
+        self.assertEqual([token.similar for token in tokens[:2]], [1, 1])
+        self.assertEqual(SimilarCount.for_forms(corpus.id, ["vos"]).count("vos", morph=morph), 2)
+
     def test_similar_count_empty_batch(self):
         """Empty token list should not raise."""
         corpus, _ = self._make_corpus()
         WordToken.get_similar_for_batch(corpus, [])  # must not raise
 
+    def test_similar_counts_maintained_on_edits(self):
+        """Counts built on first read follow updates, form editions, insertions and deletions"""
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        user = User.query.first()
+
+        def expected(tokens):
+            return {
+                tok.id: sum(
+                    1 for other in tokens
+                    if other.id != tok.id and other.form == tok.form and any(
+                        getattr(other, col) is not None and getattr(other, col) == getattr(tok, col)
+                        for col in ("lemma", "POS", "morph")
+                    )
+                )
+                for tok in tokens
+            }
+
+        def similar(tokens):
+            WordToken.get_similar_for_batch(corpus, tokens)
+            return {tok.id: tok.similar for tok in tokens}
+
+        tokens = corpus.get_tokens().all()
+        self.assertEqual(similar(tokens), expected(tokens))
+        self.assertTrue(corpus.similar_counts_ready)
+
+        WordToken.update(user_id=user.id, corpus_id=1, token_id=1, lemma="saint", POS="NOMpro")
+        WordToken.update_many(user.id, 1, [
+            {"token_id": 3, "lemma": "de", "POS": "PRE", "morph": "MORPH=empty"},
+            {"token_id": 4, "lemma": "seint"}
+        ])
+        self.db.session.get(WordToken, 5).edit_form("De", corpus, user)
+        self.db.session.get(WordToken, 6).add_form("De", corpus, user)
+        self.db.session.get(WordToken, 7).del_form(corpus, user)
+
+        tokens = corpus.get_tokens().all()
+        self.assertEqual(similar(tokens), expected(tokens))
+        counts = SimilarCount.for_forms(1, [tok.form for tok in tokens])
+        SimilarCount.rebuild(1)
+        self.assertEqual(
+            {key: count for key, count in counts.items() if count},
+            SimilarCount.for_forms(1, [tok.form for tok in tokens]),
+            "Incremental counts are the same as rebuilt ones"
+        )
+
+    def test_similar_counts_moved_in_batches(self):
+        """Moving many tokens issues a bounded number of statements and keeps the counts exact"""
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        tokens = corpus.get_tokens().all()
+        WordToken.get_similar_for_batch(corpus, tokens)
+
+        moves = [
+            ((tok.form, tok.lemma, tok.POS, tok.morph), (tok.form, "moved{}".format(tok.id % 3), tok.POS, tok.morph))
+            for tok in tokens
+        ]
+        keys = {key for move in moves for signature in move for key in SimilarCount.signatures(*signature)}
+        with count_queries() as queries:
+            SimilarCount.move(1, moves)
+        self.assertGreater(len(keys), SimilarCount.MOVE_BATCH_SIZE, "The moves span several batches")
+        self.assertLessEqual(
+            queries.count, 1 + 3 * math.ceil(len(keys) / SimilarCount.MOVE_BATCH_SIZE),
+            "A read, an update and an insert per batch"
+        )
+        counts = SimilarCount.for_forms(1, [tok.form for tok in tokens])
+        WordToken.query.filter(WordToken.corpus == 1).update(
+            {WordToken.lemma: "moved" + (WordToken.id % 3).cast(self.db.String)}, synchronize_session=False
+        )
+        SimilarCount.rebuild(1)
+        self.assertEqual(
+            {key: count for key, count in counts.items() if count},
+            SimilarCount.for_forms(1, [tok.form for tok in tokens])
+        )
+
+    def test_similar_counts_built_once_by_a_job(self):
+        """Reads before the counts are built compute them on the fly and queue a single job building them"""
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        forms = [tok.form for tok in corpus.get_tokens()]
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            on_the_fly = SimilarCount.for_forms(1, forms)
+            self.assertEqual(SimilarCount.for_forms(1, forms), on_the_fly)
+        self.assertEqual(SimilarCount.query.count(), 0, "Nothing is written by the reads")
+        self.assertEqual([job.status for job in Job.query.filter_by(task="corpus.similar_counts")], [Job.QUEUED])
+
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        self.assertTrue(self.db.session.get(Corpus, 1).similar_counts_ready)
+        self.assertEqual(SimilarCount.for_forms(1, forms), on_the_fly)
+
+        SimilarCount.rebuild(1)
+        self.assertEqual(SimilarCount.for_forms(1, forms), on_the_fly, "Rebuilding does not count tokens twice")
+        row = SimilarCount.query.filter(SimilarCount.lemma.is_(None)).first()
+        self.db.session.add(SimilarCount(
+            corpus_id=1, mask=row.mask, form=row.form, POS=row.POS, morph=row.morph, count=1
+        ))
+        with self.assertRaises(IntegrityError, msg="Signatures are unique"):
+            self.db.session.commit()
+        self.db.session.rollback()
+
 
 class TestWordToken(TestModels):
     def test_to_input_format(self):
@@ -129,6 +254,53 @@ class TestWordToken(TestModels):
         ]
         self.assertEqual(order_ids, list(range(1, 7)))
 
+    def test_add_batch_streaming(self):
+        """Tokens are read lazily and written in several batches with contexts spanning the batches.
+
+        Trying: a generator of 10 tokens written 3 by 3 with a context of 2 on each side
+        """
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus_id = Corpus.query.one().id
+        forms = [f"w{i}" for i in range(10)]
+        self.assertEqual(
+            WordToken.add_batch(corpus_id, ({"form": form} for form in forms), 2, 2, batch_size=3),
+            len(forms)
+        )
+        self.db.session.commit()
+        tokens = WordToken.query.filter_by(corpus=corpus_id).order_by(WordToken.order_id).all()
+        self.assertEqual([tok.order_id for tok in tokens], list(range(1, 11)))
+        self.assertEqual(
+            [(tok.left_context, tok.right_context) for tok in tokens[:3]],
+            [("", "w1 w2"), ("w0", "w2 w3"), ("w0 w1", "w3 w4")]
+        )
+        self.assertEqual((tokens[-1].left_context, tokens[-1].right_context), ("w7 w8", ""))
+        self.assertEqual(self.db.session.get(Corpus, corpus_id).token_count, 10)
+        self.db.session.expire_all()
+        self.assertIs(self.db.session.get(WordToken, tokens[0].id).needs_review, False,
+                      "Columns which are not inserted get their server default")
+
+    def test_add_batch_copy(self):
+        """On PostgreSQL, tokens are streamed through COPY and get the server defaults of the missing columns"""
+        if self.db.engine.dialect.name != "postgresql":
+            self.skipTest("COPY is only used with PostgreSQL")
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus_id = Corpus.query.one().id
+        WordToken.add_batch(corpus_id, [{"form": "Cil", "lemma": "cil"}, {"form": "vint", "lemma": "venir"}])
+        self.db.session.commit()
+        self.db.session.expire_all()
+        tokens = WordToken.query.filter_by(corpus=corpus_id).order_by(WordToken.order_id).all()
+        self.assertEqual([(tok.form, tok.lemma) for tok in tokens], [("Cil", "cil"), ("vint", "venir")])
+        self.assertIs(tokens[0].needs_review, False)
+        self.assertIsNone(tokens[0].review_comment)
+
+    def test_add_batch_missing_form(self):
+        """A missing form is reported with its line"""
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus_id = Corpus.query.one().id
+        with self.assertRaises(MissingTokenColumnValue) as error:
+            WordToken.add_batch(corpus_id, [{"form": "a"}, {"form": "b"}, {"form": ""}, {"form": "d"}])
+        self.assertEqual(error.exception.line, 3)
+
     def test_update_batch_context(self):
         """Test updating left and right context.
 
@@ -157,6 +329,180 @@ class TestWordToken(TestModels):
         self.assertEqual(right_context[0], form_list[15]["form"])
         self.assertEqual(right_context[3], form_list[18]["form"])
 
+    def test_update_batch_context_chunked(self):
+        """Contexts are updated chunk by chunk, reporting the progress, and start with the first token.
+
+        Trying: 10 tokens updated 4 by 4 with a context of 3 on the left and 1 on the right
+        """
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus_id = Corpus.query.one().id
+        WordToken.add_batch(corpus_id, [{"form": f"w{i}"} for i in range(10)])
+        progress = []
+        self.assertEqual(WordToken.update_batch_context(corpus_id, 3, 1, chunk_size=4, progress=progress.append), 10)
+        self.assertEqual(progress, [4, 8, 10])
+        tokens = WordToken.query.filter_by(corpus=corpus_id).order_by(WordToken.order_id).all()
+        self.assertEqual(
+            [(tok.left_context, tok.right_context) for tok in tokens[:4]],
+            [("", "w1"), ("w0", "w2"), ("w0 w1", "w3"), ("w0 w1 w2", "w4")]
+        )
+        self.assertEqual((tokens[-1].left_context, tokens[-1].right_context), ("w6 w7 w8", ""))
+
+    def test_update_batch_context_sql(self):
+        """On PostgreSQL, each chunk is a single UPDATE reading the forms around it with string_agg() windows.
+
+        Trying: 10 tokens updated 4 by 4 with a context of 3 on the left and 1 on the right
+        """
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus_id = Corpus.query.one().id
+        WordToken.add_batch(corpus_id, [{"form": f"w{i}"} for i in range(10)])
+        updates = []
+        execute = self.db.session.execute
+
+        def compile_updates(statement, *args, **kwargs):
+            if not statement.is_dml:
+                return execute(statement, *args, **kwargs)
+            updates.append(" ".join(str(statement.compile(
+                dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+            )).split()))
+            return Mock(rowcount=4)
+
+        with patch.object(self.db.session, "execute", side_effect=compile_updates):
+            self.assertEqual(list(WordToken._update_context_chunks_sql(corpus_id, 3, 1, chunk_size=4)), [4, 4, 4])
+        self.assertEqual(len(updates), 3, "One UPDATE per chunk")
+        self.assertIn(
+            "coalesce(string_agg(word_token.form, ' ') OVER (ORDER BY word_token.order_id "
+            "ROWS BETWEEN 3 PRECEDING AND 1 PRECEDING), '') AS left_context", updates[0]
+        )
+        self.assertIn(
+            "coalesce(string_agg(word_token.form, ' ') OVER (ORDER BY word_token.order_id "
+            "ROWS BETWEEN 1 FOLLOWING AND 1 FOLLOWING), '') AS right_context", updates[0]
+        )
+        # Each chunk reads the tokens of its contexts only and writes its own tokens
+        self.assertIn("WHERE word_token.corpus = {} AND word_token.order_id <= 5)".format(corpus_id), updates[0])
+        self.assertTrue(updates[0].endswith(
+            "WHERE word_token.id = anon_1.id AND anon_1.order_id >= 1 AND anon_1.order_id <= 4"
+        ))
+        self.assertIn("AND word_token.order_id >= 2 AND word_token.order_id <= 9)", updates[1])
+        self.assertTrue(updates[1].endswith("anon_1.order_id >= 5 AND anon_1.order_id <= 8"))
+        self.assertIn("AND word_token.order_id >= 6)", updates[2])
+        self.assertTrue(updates[2].endswith("anon_1.order_id >= 9"))
+
+    def test_update_batch_context_sql_matches_python(self):
+        """Contexts written with window functions are the same as the ones of the sliding window"""
+        if self.db.engine.dialect.name != "postgresql":
+            self.skipTest("string_agg() windows are only used with PostgreSQL")
+        self.addCorpus("wauchier", with_token=True)
+
+        def contexts(chunks):
+            self.assertEqual(sum(chunks), 354)
+            self.db.session.expire_all()
+            return [
+                (tok.left_context, tok.right_context)
+                for tok in WordToken.query.filter_by(corpus=1).order_by(WordToken.order_id)
+            ]
+
+        window = contexts(WordToken._update_context_chunks_sql(1, 3, 2, chunk_size=50))
+        self.assertEqual(window, contexts(WordToken._update_context_chunks_python(1, 3, 2, chunk_size=50)))
+
+    def test_contexts_computed_on_read(self):
+        """Corpora which do not store contexts get them from the neighbours of the tokens read."""
+        self.addCorpus("floovant", tokens_up_to=0)
+        corpus = Corpus.query.one()
+        corpus.store_context = False
+        corpus.context_left, corpus.context_right = 2, 3
+        self.db.session.commit()
+        forms = [f"w{i}" for i in range(300)]
+        WordToken.add_batch(corpus.id, [{"form": form} for form in forms])
+        self.db.session.commit()
+        tokens = corpus.get_tokens().all()
+        self.assertEqual({tok.left_context for tok in tokens} | {tok.right_context for tok in tokens}, {None})
+
+        def expected(tok):
+            i = tok.order_id - 1
+            return " ".join(forms[max(i - 2, 0):i]), " ".join(forms[i + 1:i + 4])
+
+        page = tokens[5:10]
+        self.assertEqual(corpus.get_contexts(page, contiguous=True), {tok.id: expected(tok) for tok in page})
+        scattered = [tokens[0], tokens[7], tokens[9], tokens[19]]
+        self.assertEqual(corpus.get_contexts(scattered), {tok.id: expected(tok) for tok in scattered})
+        scattered = tokens[::-1]
+        self.assertEqual(
+            corpus.get_contexts(scattered), {tok.id: expected(tok) for tok in scattered},
+            "Neighbours of more tokens than SQLite unites in one statement are read in several queries"
+        )
+
+    def test_add_and_delete_forms_keep_order_ids(self):
+        """Inserting and deleting tokens only shifts the positions of the following tokens
+
+        Trying: insert twice after the same token, then delete a token, in a corpus numbered 1, 2, 3...
+        """
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        user = User.query.first()
+
+        self.db.session.get(WordToken, 2).add_form("Saint", corpus, user)
+        # The first insertion renumbers the corpus to leave room between tokens
+        self.assertEqual(corpus.order_id_gap, WordToken.ORDER_ID_GAP)
+        order_ids = {tok.id: tok.order_id for tok in WordToken.query.filter_by(corpus=1)}
+
+        self.db.session.get(WordToken, 2).add_form("Sainz", corpus, user)
+        self.db.session.get(WordToken, 4).del_form(corpus, user)
+        tokens = corpus.get_tokens().all()
+        self.assertEqual(
+            {tok.id: tok.order_id for tok in tokens if tok.id in order_ids},
+            {id_: order_id for id_, order_id in order_ids.items() if id_ != 4},
+            "Tokens which were already there keep their order id"
+        )
+        self.assertEqual(
+            [tok.form for tok in tokens[:6]],
+            ["De", "seint", "Sainz", "Saint", "Martin", "doit"]
+        )
+        self.assertEqual(corpus.get_positions(tokens), {tok.id: i for i, tok in enumerate(tokens, 1)})
+        self.assertEqual(
+            [tok.order_id for tok in TokenHistory.query.order_by(TokenHistory.id)], [3, 3, 6],
+            "History records the positions"
+        )
+        for i, tok in enumerate(tokens[:9]):
+            self.assertEqual(
+                (tok.left_context, tok.right_context),
+                (" ".join(t.form for t in tokens[max(i - 3, 0):i]), " ".join(t.form for t in tokens[i + 1:i + 4]))
+            )
+
+    def test_order_ids_renumbered_after_many_shifts(self):
+        """Corpora are renumbered once too many tokens were inserted or deleted"""
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        user = User.query.first()
+        WordToken.ORDER_ID_MAX_SHIFTS, max_shifts = 2, WordToken.ORDER_ID_MAX_SHIFTS
+        try:
+            for token_id in (1, 2, 3):
+                self.db.session.get(WordToken, token_id).del_form(corpus, user)
+        finally:
+            WordToken.ORDER_ID_MAX_SHIFTS = max_shifts
+        self.assertEqual(TokenOrderShift.query.count(), 0)
+        self.assertTrue(WordToken.has_continuous_order_ids(1))
+        self.assertEqual(self.db.session.get(WordToken, 4).position, 1)
+        self.assertEqual([job.status for job in Job.query.filter_by(task="corpus.renumber")], [Job.DONE])
+
+    def test_insertion_waits_for_renumbering_job(self):
+        """Corpora without room between their tokens are renumbered by a single job before insertions"""
+        self.addCorpus("wauchier", with_token=True)
+        corpus = self.db.session.get(Corpus, 1)
+        user = User.query.first()
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            for _ in range(2):
+                with self.assertRaises(WordToken.RenumberingPending):
+                    self.db.session.get(WordToken, 2).add_form("Saint", corpus, user)
+                self.db.session.rollback()
+        self.assertEqual([job.status for job in Job.query.filter_by(task="corpus.renumber")], [Job.QUEUED])
+        self.assertEqual(self.db.session.get(Corpus, 1).order_id_gap, 1, "Nothing is renumbered in the request")
+
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertEqual(corpus.order_id_gap, WordToken.ORDER_ID_GAP)
+        self.db.session.get(WordToken, 2).add_form("Saint", corpus, User.query.first())
+        self.assertEqual([tok.form for tok in corpus.get_tokens().limit(3)], ["De", "seint", "Saint"])
+
     def test_remove_corpus(self):
         self.addCorpus("wauchier")
         self.assertEqual(self.db.session.get(Corpus, 1).name, "Wauchier", "The corpus exists")
@@ -6,6 +6,7 @@ from app.models import User, Role
 from app import create_app, db
 from sqlalchemy_utils import database_exists, create_database
 from tests.conftest import teardown_db
+from app.utils.sql_metrics import count_queries
 
 
 class TestBase(TestCase):
@@ -44,6 +45,20 @@ class TestBase(TestCase):
         else:
             add_corpus("floovant", db, *args, **kwargs)
 
+    def assertMaxQueries(self, budget, url, method="get", **kwargs):
+        """ Request url and check that it runs at most budget SQL statements
+
+        :returns: Response
+        """
+        with count_queries() as queries:
+            response = getattr(self.client, method)(url, **kwargs)
+        self.assertLessEqual(
+            queries.count, budget,
+            "{} ran {} queries for a budget of {}:\n{}".format(
+                url, queries.count, budget, "\n".join(queries.statements))
+        )
+        return response
+
     @staticmethod
     def admin_login(app, client):
         Role.add_default_roles()
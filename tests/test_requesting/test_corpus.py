@@ -1,6 +1,11 @@
+from unittest.mock import patch
+
 from tests.test_requesting.base import TestBase
-from flask import url_for
-from app.models import WordToken, Corpus
+from tests.test_lemmatizers import DummyService
+from app.lemmatizers import LemmatizerService
+from app.jobs import Worker
+from flask import url_for, current_app
+from app.models import WordToken, Corpus, CorpusUser, Job, User, Role
 
 
 class TestCorpus(TestBase):
@@ -11,3 +16,141 @@ class TestCorpus(TestBase):
     def test_reach_creation_page(self):
         response = self.client.get(url_for("main.corpus_new"))
         self.assertEqual(response.status_code, 200, "Display of form should work")
+
+
+class TestChunkedUpload(TestBase):
+    FORMS = ["Lors", "vint", "li", "rois", "a", "la", "porte", "et", "vit", "le", "chevalier", "qui", "dormoit"]
+
+    def _upload(self, offsets, chunk_size=4):
+        resp = self.client.post("/corpus/new/init", json={"name": "Chunked", "context_left": 2, "context_right": 2})
+        corpus_id = resp.json["corpus_id"]
+        tokens = [{"form": form, "lemma": form.lower()} for form in self.FORMS]
+        for offset in offsets:
+            self.client.post(f"/corpus/{corpus_id}/tokens/upload",
+                             json={"tokens": tokens[offset:offset + chunk_size], "token_offset": offset})
+        resp = self.client.post(f"/corpus/{corpus_id}/tokens/finalize")
+        self.assertEqual(resp.status_code, 200)
+        return WordToken.query.filter_by(corpus=corpus_id).order_by(WordToken.order_id).all()
+
+    def test_contexts_are_stitched_across_chunks(self):
+        """Contexts of the tokens at chunk boundaries are the same as in a single upload"""
+        tokens = self._upload([0, 4, 8, 12])
+        self.assertEqual([tok.form for tok in tokens], self.FORMS)
+        self.assertEqual([tok.position for tok in tokens], list(range(1, len(self.FORMS) + 1)))
+        for i, tok in enumerate(tokens):
+            self.assertEqual(tok.left_context, " ".join(self.FORMS[max(i - 2, 0):i]))
+            self.assertEqual(tok.right_context, " ".join(self.FORMS[i + 1:i + 3]))
+
+    def test_order_ids_are_renumbered(self):
+        """Gaps in the offsets sent by the client are removed at finalization"""
+        tokens = self._upload([0, 4, 8, 12], chunk_size=3)
+        self.assertEqual([tok.order_id for tok in tokens], [i * WordToken.ORDER_ID_GAP for i in range(1, len(tokens) + 1)])
+        self.assertEqual(tokens[3].left_context, "vint li")
+        self.assertEqual(tokens[3].right_context, "la porte")
+
+    def test_new_corpus_keeps_corpora_being_finalized(self):
+        """Starting a new corpus removes abandoned uploads but not those a job is still finalizing"""
+        self.client.post("/corpus/new/init", json={"name": "Abandoned"})
+        corpus_id = self.client.post("/corpus/new/init", json={"name": "Finalized"}).json["corpus_id"]
+        self.assertEqual([corpus.name for corpus in Corpus.query], ["Finalized"])
+        self.client.post(f"/corpus/{corpus_id}/tokens/upload",
+                         json={"tokens": [{"form": form} for form in self.FORMS], "token_offset": 0})
+        with patch.dict(self.app.config, BACKGROUND_TASKS=True):
+            self.assertEqual(self.client.post(f"/corpus/{corpus_id}/tokens/finalize").json["job"]["status"], "queued")
+
+        self.client.post("/corpus/new/init", json={"name": "Next"})
+        self.assertEqual(sorted(corpus.name for corpus in Corpus.query), ["Finalized", "Next"])
+        self.assertEqual(Worker(interval=0).run(burst=True), 1)
+        self.assertEqual(self.db.session.get(Corpus, corpus_id).status, "active")
+
+    def test_server_side_lemmatization(self):
+        """Raw text is lemmatized by the configured service and its tokens added to the corpus"""
+        resp = self.client.post("/corpus/new/init", json={"name": "Lemmatized", "context_left": 2, "context_right": 2})
+        corpus_id = resp.json["corpus_id"]
+        text = " ".join(self.FORMS[:4]) + ". " + " ".join(self.FORMS[4:]) + "."
+        resp = self.client.post(f"/corpus/{corpus_id}/tokens/lemmatize",
+                                json={"service": "http://127.0.0.1:1/unknown", "text": text})
+        self.assertEqual(resp.status_code, 400, "Only configured services can be reached")
+
+        with DummyService() as service, \
+                patch.dict(self.app.config, LEMMATIZERS=[LemmatizerService("Dummy", service.uri, "", "", "")],
+                           LEMMATIZER_BATCH_SIZE=5, CORPUS_UPLOAD_CHUNK_SIZE=3):
+            resp = self.client.post(f"/corpus/{corpus_id}/tokens/lemmatize", json={"service": service.uri, "text": text})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.json["job"]["status"], "done")
+        self.assertEqual(self.db.session.get(Corpus, corpus_id).status, "active")
+        tokens = WordToken.query.filter_by(corpus=corpus_id).order_by(WordToken.order_id).all()
+        self.assertEqual([tok.form for tok in tokens], self.FORMS[:3] + ["rois."] + self.FORMS[4:-1] + ["dormoit."])
+        self.assertEqual([tok.lemma for tok in tokens], [str(i) for i in range(4)] + [str(i) for i in range(5)] + [str(i) for i in range(4)])
+        self.assertEqual(tokens[3].left_context, "vint li")
+        self.assertEqual(tokens[3].right_context, "a la")
+
+
+class TestContextPreferences(TestBase):
+
+    def test_context_update(self):
+        """Changing the context lengths recomputes the contexts and reports when the update is over"""
+        self.addCorpus("wauchier", with_token=True)
+        resp = self.client.post("/corpus/1/preferences", data={"context_left": 1, "context_right": 2})
+        self.assertEqual(resp.status_code, 200)
+        token = WordToken.query.filter_by(corpus=1, order_id=2).one()
+        self.assertEqual(token.left_context, "De")
+        self.assertEqual(token.right_context, "Martin mout")
+        self.assertEqual(
+            self.client.get("/corpus/1/preferences/contexts").json,
+            {"running": False, "updated": 0, "total": 354}
+        )
+
+    def test_concurrent_context_update_is_refused(self):
+        """A context update cannot start while another one is running"""
+        self.addCorpus("wauchier", with_token=True)
+        Corpus.set_context_update_progress(1, 100)
+        self.client.post("/corpus/1/preferences", data={"context_left": 1, "context_right": 2})
+        self.assertEqual(self.db.session.get(Corpus, 1).context_left, 3)
+        self.assertEqual(self.client.get("/corpus/1/preferences/contexts").json["running"], True)
+
+
+class TestBackgroundJobs(TestBase):
+
+    def test_export_job(self):
+        """Exports run as jobs write the same file as streamed exports"""
+        self.addCorpus("wauchier", with_token=True)
+        resp = self.client.get("/corpus/1/tokens?format=tei-msd&background=1")
+        self.assertEqual(resp.status_code, 202)
+        job = resp.json
+        self.assertEqual((job["status"], job["progress"], job["total"]), ("done", 354, 354))
+        self.assertEqual(self.client.get(job["url"]).json["download_url"], job["download_url"])
+
+        download = self.client.get(job["download_url"])
+        self.assertEqual(download.status_code, 200)
+        self.assertIn('filename=wauchier.xml', download.headers["Content-Disposition"])
+        self.assertEqual(download.data, self.client.get("/corpus/1/tokens?format=tei-msd").data)
+        download.close()
+
+    def test_delete_job(self):
+        """Corpora are removed by a job"""
+        self.addCorpus("wauchier", with_token=True)
+        resp = self.client.post("/corpus/1/delete", data={"delete-name": "Wauchier"}, follow_redirects=True)
+        self.assertIn("The corpus has been removed", resp.data.decode())
+        self.assertIsNone(self.db.session.get(Corpus, 1))
+        self.assertEqual(self.client.get("/jobs/1").json["status"], "done")
+        self.assertIsNone(self.client.get("/jobs/1").json["cancel_url"])
+        self.assertEqual(self.client.post("/jobs/1/cancel").status_code, 409)
+        self.assertEqual(self.client.get("/jobs/2").status_code, 404)
+
+    def test_cancel_restricted_to_owner(self):
+        """Members of the corpus can follow the jobs of others but cannot cancel them"""
+        self.addCorpus("wauchier", with_token=True)
+        with patch.dict(current_app.config, BACKGROUND_TASKS=True):
+            job = Job.enqueue("corpus.export", user_id=1, corpus_id=1, format="tei-msd")
+        user = User(email="user@ppa.fr", first_name="Simple", last_name="User", password="password",
+                    confirmed=True, role=Role.query.filter_by(name="User").first())
+        self.db.session.add(user)
+        self.db.session.add(CorpusUser(user, self.db.session.get(Corpus, 1)))
+        self.db.session.commit()
+        self.client.get(url_for("account.logout"))
+        self.client.post(url_for("account.login"), data={"email": "user@ppa.fr", "password": "password"})
+
+        self.assertEqual(self.client.get("/jobs/{}".format(job.id)).status_code, 200)
+        self.assertEqual(self.client.post("/jobs/{}/cancel".format(job.id)).status_code, 403)
+        self.assertEqual(self.db.session.get(Job, job.id).status, Job.QUEUED)
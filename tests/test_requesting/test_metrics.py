@@ -0,0 +1,83 @@
+import logging
+
+from flask import url_for
+
+from tests.test_requesting.base import TestBase
+from app import sql_metrics
+from app.models import User, Role, WordToken
+from app.utils.sql_metrics import count_queries, slow_query_logger
+
+
+class TestSQLMetrics(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier")
+        sql_metrics.reset()
+
+    def test_query_budgets(self):
+        """ Pages of the annotation table run a bounded number of queries, whatever the page """
+        # First requests fill the caches (similar counts, statistics)
+        self.client.get("/corpus/1/info")
+        self.client.get("/corpus/1/tokens/correct/data")
+
+        self.assertEqual(self.assertMaxQueries(10, "/corpus/1/info").status_code, 200)
+        self.assertEqual(self.assertMaxQueries(8, "/corpus/1/tokens/correct").status_code, 200)
+        self.assertEqual(self.assertMaxQueries(7, "/corpus/1/tokens/correct/data").status_code, 200)
+        self.assertEqual(self.assertMaxQueries(7, "/corpus/1/tokens/correct/data?page=3").status_code, 200)
+        self.assertEqual(self.assertMaxQueries(6, "/corpus/1/tokens/unallowed/lemma/correct/data").status_code, 200)
+
+    def test_history_positions(self):
+        """ Positions of the tokens of the history are read once for the page """
+        for token_id in range(1, 6):
+            WordToken.update(user_id=1, corpus_id=1, token_id=token_id, lemma="changed")
+        with count_queries() as queries:
+            response = self.client.get("/corpus/1/tokens/history")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("#tok5", response.get_data(as_text=True))
+        self.assertEqual(len([statement for statement in queries.statements if "token_order_shift" in statement]), 1)
+
+    def test_server_timing(self):
+        """ Responses tell the time spent in the database """
+        with count_queries() as queries:
+            response = self.client.get("/corpus/1/info")
+        timing = response.headers["Server-Timing"]
+        self.assertIn('desc="{} queries"'.format(queries.count), timing)
+        self.assertTrue(timing.startswith("db;dur="))
+        self.assertIn("app;dur=", timing)
+
+    def test_metrics_page(self):
+        """ Metrics are aggregated by endpoint and only shown to administrators """
+        self.client.get("/corpus/1/info")
+        self.client.get("/corpus/1/info")
+        endpoints = {
+            endpoint["endpoint"]: endpoint
+            for endpoint in self.client.get(url_for("admin.metrics"), headers={"Accept": "application/json"}).json
+        }
+        self.assertEqual(endpoints["main.corpus_info"]["requests"], 2)
+        self.assertGreater(endpoints["main.corpus_info"]["queries"], 0)
+        self.assertLessEqual(len(endpoints["main.corpus_info"]["slowest"]), 5)
+
+        response = self.client.get(url_for("admin.metrics"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("main.corpus_info", response.get_data(as_text=True))
+
+        self.client.post(url_for("admin.reset_metrics"))
+        self.assertNotIn("main.corpus_info", [endpoint["endpoint"] for endpoint in sql_metrics.snapshot()])
+
+        user = User(email="user@ppa.fr", first_name="Simple", last_name="User", password="password",
+                    confirmed=True, role=Role.query.filter_by(name="User").first())
+        self.db.session.add(user)
+        self.db.session.commit()
+        self.client.get(url_for("account.logout"))
+        self.client.post(url_for("account.login"), data={"email": "user@ppa.fr", "password": "password"})
+        self.assertEqual(self.client.get(url_for("admin.metrics")).status_code, 403)
+
+    def test_slow_query_log(self):
+        """ Statements above the threshold are logged with the endpoint that ran them """
+        threshold, sql_metrics.threshold = sql_metrics.threshold, 0
+        try:
+            with self.assertLogs(slow_query_logger, logging.WARNING) as logs:
+                self.client.get("/corpus/1/info")
+        finally:
+            sql_metrics.threshold = threshold
+        self.assertIn("main.corpus_info", logs.output[0])
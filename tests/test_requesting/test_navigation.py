@@ -0,0 +1,73 @@
+from flask import url_for
+
+from tests.test_requesting.base import TestBase
+from app.models import Corpus, CorpusUser, ControlLists, ControlListsUser, User, Role
+from app.utils.sql_metrics import count_queries
+
+
+class TestRequestContext(TestBase):
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier")
+        self.admin = User.query.filter_by(email=self.app.config["ADMIN_EMAIL"]).first()
+        self.db.session.add(CorpusUser(self.admin, self.db.session.get(Corpus, 1), is_owner=True))
+        self.db.session.commit()
+
+    def login_as_user(self):
+        user = User(email="user@ppa.fr", first_name="Simple", last_name="User", password="password",
+                    confirmed=True, role=Role.query.filter_by(name="User").first())
+        self.db.session.add(user)
+        self.db.session.commit()
+        self.client.get(url_for("account.logout"))
+        self.client.post(url_for("account.login"), data={"email": "user@ppa.fr", "password": "password"})
+        return user
+
+    def test_access(self):
+        """ Access checks read the membership of the user from the request context """
+        self.assertEqual(self.client.get("/corpus/1/tokens/correct").status_code, 200)
+        self.assertEqual(self.client.get("/corpus/404/tokens/correct").status_code, 404)
+        self.assertEqual(self.client.get("/corpus/404/delete").status_code, 404)
+
+        self.login_as_user()
+        self.assertEqual(self.client.get("/corpus/1/tokens/correct").status_code, 403)
+        self.assertEqual(self.client.get("/corpus/1/tokens/correct/data").status_code, 403)
+        self.assertEqual(self.client.get("/corpus/404/tokens/correct").status_code, 403)
+        self.assertEqual(self.client.get("/corpus/1/delete").status_code, 403)
+
+    def test_corpus_loaded_once(self):
+        """ The corpus, its columns and the bookmark of the user are read by a single query """
+        self.client.get("/corpus/1/bookmark?token_id=3&page=1")
+        # Fills the similar counts
+        self.client.get("/corpus/1/tokens/correct/data")
+        with count_queries() as queries:
+            response = self.client.get("/corpus/1/tokens/correct/data")
+        self.assertEqual(response.json["bookmark_token_id"], 3)
+        self.assertEqual(len([statement for statement in queries.statements if "FROM corpus " in statement]), 1)
+        self.assertFalse([statement for statement in queries.statements if "FROM \"column\"" in statement])
+        self.assertFalse([statement for statement in queries.statements if "FROM bookmark" in statement])
+
+    def test_nav_cache(self):
+        """ Favorites and control lists of the navigation bar are cached until they change """
+        self.assertNotIn("dropdown_link_1", self.client.get("/").get_data(as_text=True))
+        self.client.get("/corpus/favorite/1")
+        self.assertIn("dropdown_link_1", self.client.get("/").get_data(as_text=True))
+
+        with count_queries() as queries:
+            self.client.get("/")
+        self.assertFalse([statement for statement in queries.statements if "favorite" in statement])
+
+        # Renaming a corpus or a control list is seen at once
+        corpus = self.db.session.get(Corpus, 1)
+        corpus.name = "Renamed corpus"
+        self.db.session.add(ControlListsUser(control_lists_id=1, user_id=self.admin.id, is_owner=True))
+        self.db.session.commit()
+        page = self.client.get("/").get_data(as_text=True)
+        self.assertIn("Renamed corpus", page)
+        self.assertIn("dropdown_link_cl_1", page)
+        self.db.session.get(ControlLists, 1).name = "Renamed list"
+        self.db.session.commit()
+        self.assertIn("Renamed list", self.client.get("/").get_data(as_text=True))
+
+        self.client.get("/corpus/favorite/1")
+        self.assertNotIn("dropdown_link_1", self.client.get("/").get_data(as_text=True))
+
@@ -1,5 +1,7 @@
 """Tests for the token annotation endpoints, focused on the Gloss column and review feature."""
 import json
+from app.models import WordToken, ChangeRecord, Corpus
+from app.utils.keyset import encode_cursor
 from .base import TestBase
 
 
@@ -90,3 +92,190 @@ class TestReviewAPI(TestBase):
     def test_needs_review_filter_page(self):
         resp = self.client.get('/corpus/1/tokens/needs-review')
         self.assertEqual(resp.status_code, 200)
+
+
+class TestBatchCorrectionAPI(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier", with_token=True, with_allowed_lemma=True, partial_allowed_lemma=True)
+
+    def _correct_batch(self, corrections):
+        return self.client.post("/corpus/1/tokens/correct/batch", json={"tokens": corrections})
+
+    def test_batch_statuses(self):
+        """Each correction gets its own status, valid ones are saved in one request."""
+        resp = self._correct_batch([
+            {"token_id": 1, "lemma": "saint"},
+            {"token_id": 2, "lemma": "seint"},
+            {"token_id": 3, "lemma": "martin", "POS": "NOMpro", "morph": "None"},
+            {"token_id": 100000, "lemma": "de"},
+            {"token_id": 4, "gloss": "much"},
+        ])
+        self.assertEqual(resp.status_code, 200)
+        body = json.loads(resp.data)
+        self.assertEqual(body["updated"], 2)
+        self.assertEqual([status["status"] for status in body["statuses"]], [True, False, False, False, True])
+        self.assertEqual(body["statuses"][1]["new-values"], ["lemma"])
+        self.assertEqual(body["statuses"][2]["message"], "No value where changed")
+        self.assertEqual(body["statuses"][3]["message"], "Token not found")
+        self.assertEqual(body["statuses"][0]["token"]["lemma"], "saint")
+        self.assertEqual(body["statuses"][4]["token"]["gloss"], "much")
+
+        self.assertEqual(self.db.session.get(WordToken, 1).lemma, "saint")
+        self.assertEqual(self.db.session.get(WordToken, 4).lemma, "mout", "Missing lemma keeps the value")
+        self.assertEqual(ChangeRecord.query.count(), 2)
+
+    def test_batch_rejects_values_which_are_not_strings(self):
+        """Numbers, lists or objects as values are errors of their correction only."""
+        resp = self._correct_batch([
+            {"token_id": 1, "lemma": 12},
+            {"token_id": 2, "POS": ["NOMpro"], "gloss": {"text": "much"}},
+            {"token_id": 3, "lemma": "saint"},
+        ])
+        self.assertEqual(resp.status_code, 200)
+        body = json.loads(resp.data)
+        self.assertEqual(body["updated"], 1)
+        self.assertEqual([status["status"] for status in body["statuses"]], [False, False, True])
+        self.assertEqual(body["statuses"][0]["message"], "Invalid value in lemma")
+        self.assertEqual(body["statuses"][1]["new-values"], ["POS", "gloss"])
+        self.assertEqual(self.db.session.get(WordToken, 1).lemma, "de")
+
+    def test_batch_requires_list(self):
+        """Anything else than a list of corrections is rejected."""
+        resp = self.client.post("/corpus/1/tokens/correct/batch", json={"tokens": "nope"})
+        self.assertEqual(resp.status_code, 400)
+
+
+class TestTEIExport(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier", with_token=True)
+        # Several chunks are needed to export the 354 tokens
+        self.app.config["EXPORT_CHUNK_SIZE"] = 50
+
+    def _export(self, format):
+        resp = self.client.get(f"/corpus/1/tokens?format={format}")
+        self.assertEqual(resp.status_code, 200)
+        return resp.data.decode()
+
+    def test_standoff_streams_every_token(self):
+        """Tokens are streamed chunk by chunk in reading order, both in the text and in the annotations."""
+        data = self._export("standoff-tei")
+        self.assertEqual(data.count("<w "), 354)
+        self.assertEqual(data.count("<annotationBlock "), 354)
+        self.assertIn('<w xml:id="t1">De</w>', data)
+        self.assertIn('<w xml:id="t354">', data)
+        self.assertLess(data.index('xml:id="t50"'), data.index('xml:id="t51"'))
+
+    def test_history_is_exported(self):
+        """The token history is streamed with the name of the editor."""
+        self.assertNotIn("<revisionDesc>", self._export("tei-msd"))
+        self.client.post("/corpus/1/tokens/edit/5", data={"form": "xyz"})
+        for format in ("tei-msd", "tei-geste"):
+            data = self._export(format)
+            self.assertEqual(data.count("<w "), 354)
+            self.assertIn("<revisionDesc>", data)
+            self.assertIn('corresp="#t5"', data)
+            self.assertIn("<add>xyz</add>", data)
+
+
+class TestComputedContexts(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier", with_token=True)
+        self.client.post("/corpus/1/preferences", data={"context_left": 2, "context_right": 2, "lazyContext": "true"})
+
+    def test_stored_contexts_are_dropped(self):
+        """Switching to computed contexts clears the stored ones"""
+        corpus = self.db.session.get(Corpus, 1)
+        self.assertFalse(corpus.store_context)
+        self.assertEqual(WordToken.query.filter(WordToken.left_context.isnot(None)).count(), 0)
+
+    def test_data_endpoint_computes_contexts(self):
+        """The annotation table receives the contexts computed from the neighbours of the page"""
+        data = self.client.get("/corpus/1/tokens/correct/data?page=1&limit=3").json
+        self.assertEqual(
+            [(tok["left_context"], tok["right_context"]) for tok in data["tokens"]],
+            [("", "seint Martin"), ("De", "Martin mout"), ("De seint", "mout doit")]
+        )
+
+    def test_structural_edits_keep_contexts_computed(self):
+        """Adding a token does not write contexts, and the new token appears in the context of its neighbours"""
+        self.client.post("/corpus/1/tokens/insert/1", data={"form": "li"})
+        self.assertEqual(WordToken.query.filter(WordToken.left_context.isnot(None)).count(), 0)
+        data = self.client.get("/corpus/1/tokens/correct/data?page=1&limit=3").json
+        self.assertEqual(data["tokens"][2]["left_context"], "De li")
+
+    def test_pages_show_computed_contexts(self):
+        """The history, its download, the similar pages and edited tokens show the computed contexts"""
+        token = self.client.post(
+            "/corpus/1/tokens/correct/2", data={"lemma": "saint", "POS": "ADJqua", "morph": "None"}
+        ).json["token"]
+        self.assertEqual(token["context"], "De seint Martin mout")
+        record = ChangeRecord.query.one()
+        for url in ("/corpus/1/tokens/history", f"/corpus/1/tokens/changes/similar/{record.id}"):
+            with self.subTest(url=url):
+                page = self.client.get(url).get_data(as_text=True)
+                self.assertIn("De <b>seint</b> Martin mout", page)
+        self.assertIn("De seint Martin mout", self.client.get("/corpus/1/tokens/similar/2").get_data(as_text=True))
+        self.assertIn(
+            "\tDe seint Martin mout\t", self.client.get("/corpus/1/tokens/history/download").get_data(as_text=True)
+        )
+
+
+class TestCursorPagination(TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.addCorpus("wauchier", with_token=True)
+
+    def _ids(self, data):
+        return [tok["id"] for tok in data["tokens"]]
+
+    def test_cursors_walk_through_the_pages(self):
+        """Following the cursors gives the same pages as their numbers, in both directions"""
+        url = "/corpus/1/tokens/correct/data?limit=100"
+        pages = [self.client.get(f"{url}&page={page}").json for page in range(1, 5)]
+        self.assertEqual(pages[0]["total"], 354)
+        self.assertEqual(pages[0]["pages"], 4)
+        self.assertIsNone(pages[0]["prev"])
+        self.assertIsNone(pages[-1]["next"])
+
+        data = pages[0]
+        for page, expected in enumerate(pages[1:], 2):
+            data = self.client.get(f"{url}&page={page}&after={data['next']}").json
+            self.assertEqual(self._ids(data), self._ids(expected))
+            self.assertEqual(data["total"], 354)
+        self.assertIsNone(data["next"])
+
+        for page in (3, 2, 1):
+            data = self.client.get(f"{url}&page={page}&before={data['prev']}").json
+            self.assertEqual(self._ids(data), self._ids(pages[page - 1]))
+        self.assertIsNone(data["prev"])
+
+    def test_total_is_sent_back(self):
+        """Filtered tables do not count their tokens again when a cursor is given"""
+        url = "/corpus/1/tokens/search/data?lemma=saint&limit=5"
+        first = self.client.get(url).json
+        self.assertEqual(first["total"], 7)
+        second = self.client.get(f"{url}&page=2&after={first['next']}&total=7").json
+        self.assertEqual(second["total"], 7)
+        self.assertEqual(len(second["tokens"]), 2)
+        self.assertIsNone(second["next"])
+        self.assertEqual(
+            self._ids(self.client.get(f"{url}&page=1&before={second['prev']}&total=7").json), self._ids(first)
+        )
+
+    def test_invalid_cursor(self):
+        self.assertEqual(self.client.get("/corpus/1/tokens/correct/data?after=nope").status_code, 400)
+        for values in ([1], [{}], [1, "2"], [1, 2, 3], [True, 2]):
+            with self.subTest(values=values):
+                self.assertEqual(
+                    self.client.get(f"/corpus/1/tokens/correct/data?after={encode_cursor(values)}").status_code, 400
+                )
+                self.assertEqual(
+                    self.client.get(f"/corpus/1/tokens/correct/data?before={encode_cursor(values)}").status_code, 400
+                )